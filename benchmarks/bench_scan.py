@@ -0,0 +1,148 @@
+'''
+benchmarks.bench_scan
+~~~~~~~~~~~~~~~~~~~~~
+
+This module provides the scan throughput benchmark.  Every roster size runs a
+cold `scan()` (fresh input directory, no caches) against `FakeUpstreamServer`
+and reports wall time, upstream requests per second and peak memory.
+
+    python -m benchmarks.bench_scan --sizes 50 200 1000 --latency 20 --throttle 0.01
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+from keystonescan import keystonescan
+from keystonescan.ratelimit import RateLimiter
+from keystonescan.sources import source_choices
+from benchmarks.fakeserver import FakeUpstreamServer, LocalTransport
+
+def write_inputs(input_dir, roster_size, players=10):
+    '''
+    Write access.json and a toons.json with `roster_size` characters spread
+    over `players` players.
+    '''
+    roster = {}
+    for index in range(roster_size):
+        player = "player{}".format(index % players)
+        realm = "realm{}".format(index % 7)
+        roster.setdefault(player, {}).setdefault(realm, []).append("toon{}".format(index))
+    with open(os.path.join(input_dir, "toons.json"), mode="w", encoding="utf-8") as toons_fd:
+        json.dump(roster, toons_fd)
+    with open(os.path.join(input_dir, "access.json"), mode="w", encoding="utf-8") as access_fd:
+        json.dump({"client_id": "bench", "client_secret": "bench"}, access_fd)
+
+def cold_scan(server, roster_size, jobs=8, rates=None, source="raiderio"):
+    '''
+    Run one scan of `roster_size` characters in a fresh input directory,
+    returns its wall time in seconds.
+    '''
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = os.path.join(tmpdir, "input")
+        output_dir = os.path.join(tmpdir, "output")
+        os.makedirs(input_dir)
+        os.makedirs(output_dir)
+        write_inputs(input_dir, roster_size)
+
+        transport = LocalTransport(server.base_url, pool_size=max(jobs, 10),
+                rate_limiter=RateLimiter(rates))
+        start = time.perf_counter()
+        try:
+            keystonescan.scan(input_dir, output_dir, character=True, player=True,
+                    dungeon=True, weekly=True, jobs=jobs, transport=transport, source=source)
+        finally:
+            wall = time.perf_counter() - start
+            transport.close()
+    return wall
+
+def bench_scan(server, roster_size, jobs=8, rates=None, source="raiderio"):
+    '''
+    Run one cold scan of `roster_size` characters, returns its measurements.
+    Allocation tracing slows the scan down, so the peak memory comes from a
+    second traced scan and the timings from an untraced one.
+
+    @param rates Requests per second per upstream, see `RateLimiter.default_rates`
+    @param source Run data source, see `sources.source_choices`
+    '''
+    before = server.stats()
+    wall = cold_scan(server, roster_size, jobs, rates, source)
+    after = server.stats()
+
+    tracemalloc.start()
+    try:
+        cold_scan(server, roster_size, jobs, rates, source)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    requests = after["requests"] - before["requests"]
+    return {
+        "toons": roster_size,
+        "wall_s": round(wall, 3),
+        "requests": requests,
+        "throttled": after["throttled"] - before["throttled"],
+        "req_per_s": round(requests / wall, 1) if wall else 0,
+        "peak_mib": round(peak / (1024 * 1024), 2),
+    }
+
+def format_table(results):
+    '''
+    Format benchmark results as a plain text table.
+    '''
+    columns = ("toons", "wall_s", "requests", "throttled", "req_per_s", "peak_mib")
+    rows = [columns] + [tuple(str(result[column]) for column in columns) for result in results]
+    widths = [max(len(row[index]) for row in rows) for index in range(len(columns))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths))
+            for row in rows)
+
+def main(argv=None):
+    '''
+    Benchmark entry point
+    '''
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_scan",
+            description="Measure keystonescan against a local fake upstream")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500],
+            help="Roster sizes to scan")
+    parser.add_argument("-j", "--jobs", type=int, default=8,
+            help="Characters scanned concurrently")
+    parser.add_argument("--latency", type=float, default=20,
+            help="Milliseconds the server delays every response")
+    parser.add_argument("--throttle", type=float, default=0.0,
+            help="Fraction of requests answered with a 429")
+    parser.add_argument("--retry-after", type=int, default=0,
+            help="Retry-After seconds sent with a 429")
+    parser.add_argument("--keep-limits", action="store_true",
+            help="Keep the production client side rate limits instead of lifting them")
+    parser.add_argument("--source", choices=source_choices, default="raiderio",
+            help="Run data source to scan characters from")
+    parser.add_argument("--json", action="store_true",
+            help="Print the results as json")
+    args = parser.parse_args(argv)
+
+    # the production limits would make every run measure raider.io's 5 requests/s
+    rates = None
+    if not args.keep_limits:
+        rates = {key: 100000 for key in RateLimiter.default_rates}
+
+    server = FakeUpstreamServer(latency=args.latency / 1000.0, throttle_rate=args.throttle,
+            retry_after=args.retry_after)
+    server.start()
+    try:
+        results = [bench_scan(server, size, jobs=args.jobs, rates=rates,
+                source=args.source) for size in args.sizes]
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_table(results))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
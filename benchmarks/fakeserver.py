@@ -0,0 +1,290 @@
+'''
+benchmarks.fakeserver
+~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a local stand-in for the Blizzard, Battle.net OAuth and
+Raider.io endpoints keystonescan uses, so scans can be measured without
+touching the live APIs
+'''
+
+import json
+import time
+import random
+import hashlib
+import threading
+import socketserver
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from keystonescan.transport import HttpTransport
+
+DUNGEONS = [
+    (375, "Mists of Tirna Scithe", 1184),
+    (376, "The Necrotic Wake", 1182),
+    (377, "De Other Side", 1188),
+    (378, "Halls of Atonement", 1185),
+    (379, "Plaguefall", 1183),
+    (380, "Sanguine Depths", 1189),
+    (381, "Spires of Ascension", 1186),
+    (382, "Theater of Pain", 1187),
+]
+
+AFFIXES = ("Tyrannical", "Fortified")
+
+class FakeUpstreamServer(socketserver.ThreadingMixIn, HTTPServer):
+    '''
+    Threaded HTTP server answering like the upstream APIs.  Requests are
+    addressed as `http://<server>/<upstream host>/<path>`, see `LocalTransport`.
+
+    Basic Usage::
+       >>> server = FakeUpstreamServer(latency=0.02, throttle_rate=0.01)
+       >>> server.start()
+       >>> transport = LocalTransport(server.base_url)
+       >>> ...
+       >>> server.stop()
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.0, throttle_rate=0.0,
+            retry_after=0, seed=0):
+        '''
+        @param latency Seconds every response is delayed
+        @param throttle_rate Fraction of requests answered with a 429
+        @param retry_after Retry-After seconds sent with a 429
+        @param seed Seed of the throttling dice, runs with the same seed throttle alike
+        '''
+        super().__init__(address, FakeUpstreamHandler)
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.requests = 0
+        self.throttled = 0
+        self.not_modified = 0
+
+    @property
+    def base_url(self):
+        '''
+        Url the upstream hosts are mapped below
+        '''
+        return "http://{}:{}".format(*self.server_address[:2])
+
+    def start(self):
+        '''
+        Serve from a background thread.
+        '''
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        '''
+        Stop serving and close the socket.
+        '''
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def count(self):
+        '''
+        Count a request, returns True when it should be throttled.
+        '''
+        with self._lock:
+            self.requests += 1
+            throttle = self._random.random() < self.throttle_rate
+            if throttle:
+                self.throttled += 1
+            return throttle
+
+    def count_not_modified(self):
+        '''
+        Count a conditional request answered with a 304.
+        '''
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        '''
+        Request counters
+        '''
+        with self._lock:
+            return {"requests": self.requests, "throttled": self.throttled,
+                    "not_modified": self.not_modified}
+
+def character_seed(realm, name):
+    '''
+    Stable per character seed, a character gets the same runs on every request.
+    '''
+    return int(hashlib.sha256("{}/{}".format(realm, name).encode("utf-8")).hexdigest()[:8], 16)
+
+def raiderio_profile(realm, name, fields):
+    '''
+    Build a raider.io profile with the requested fields for any character.
+    '''
+    rand = random.Random(character_seed(realm, name))
+    # "mythic_plus_best_runs:all" asks for the same group as "mythic_plus_best_runs"
+    fields = [field.split(":")[0] for field in fields]
+    profile = {"name": name.capitalize(), "realm": realm, "region": "us"}
+    best_runs = []
+    alternate_runs = []
+    for _, dungeon, _ in DUNGEONS:
+        level = rand.randint(2, 25)
+        affix = rand.randrange(2)
+        best_runs.append({"dungeon": dungeon, "mythic_level": level,
+                "clear_time_ms": rand.randint(1200000, 2400000),
+                "score": level * 7.5, "affixes": [{"name": AFFIXES[affix]}]})
+        alternate_runs.append({"dungeon": dungeon, "mythic_level": level - 1,
+                "clear_time_ms": rand.randint(1200000, 2400000),
+                "score": (level - 1) * 7.5, "affixes": [{"name": AFFIXES[1 - affix]}]})
+
+    if "mythic_plus_best_runs" in fields:
+        profile["mythic_plus_best_runs"] = best_runs
+    if "mythic_plus_alternate_runs" in fields:
+        profile["mythic_plus_alternate_runs"] = alternate_runs
+    if "mythic_plus_scores_by_season" in fields:
+        profile["mythic_plus_scores_by_season"] = [{"scores": {
+                "all": sum(run["score"] for run in best_runs + alternate_runs)}}]
+    if "mythic_plus_weekly_highest_level_runs" in fields:
+        profile["mythic_plus_weekly_highest_level_runs"] = [
+                {"mythic_level": rand.randint(2, 25)} for _ in range(rand.randrange(10))]
+    return profile
+
+def blizzard_document(path):
+    '''
+    Body of a Blizzard API path, None for unknown paths.
+    '''
+    parts = path.strip("/").split("/")
+    if path.endswith("/mythic-keystone/dungeon/index"):
+        return {"dungeons": [{"id": dungeon_id, "name": name} for dungeon_id, name, _ in DUNGEONS]}
+    if path.endswith("/mythic-keystone/season/index"):
+        return {"seasons": [{"id": 5}, {"id": 6}], "current_season": {"id": 6}}
+    if "/mythic-keystone/dungeon/" in path:
+        for dungeon_id, name, journal_id in DUNGEONS:
+            if parts[-1] == str(dungeon_id):
+                return {"id": dungeon_id, "name": name, "dungeon": {"id": journal_id},
+                        "keystone_upgrades": [
+                            {"upgrade_level": level,
+                             "qualifying_duration": 1800000 - level * 360000}
+                            for level in (1, 2, 3)]}
+        return None
+    if "/media/journal-instance/" in path:
+        return {"id": int(parts[-1]), "assets": [{"key": "tile",
+                "value": "https://render.example/zones/{}.jpg".format(parts[-1])}]}
+    if "/mythic-keystone-profile/season/" in path:
+        # .../character/<realm>/<name>/mythic-keystone-profile/season/<n>
+        rand = random.Random(character_seed(parts[-5], parts[-4]))
+        best_runs = []
+        for dungeon_id, name, _ in DUNGEONS:
+            for affix in AFFIXES:
+                level = rand.randint(2, 25)
+                best_runs.append({"dungeon": {"id": dungeon_id, "name": name},
+                        "keystone_level": level, "duration": rand.randint(1200000, 2400000),
+                        "keystone_affixes": [{"name": affix}, {"name": "Bolstering"}],
+                        "mythic_rating": {"rating": level * 7.5},
+                        "is_completed_within_time": True})
+        rating = sum(run["mythic_rating"]["rating"] for run in best_runs)
+        return {"best_runs": best_runs, "mythic_rating": {"rating": rating}}
+    if path.endswith("/mythic-keystone-profile"):
+        # .../character/<realm>/<name>/mythic-keystone-profile
+        rand = random.Random(character_seed(parts[-3], parts[-2]))
+        return {"current_period": {"best_runs": [{"keystone_level": rand.randint(2, 25)}
+                for _ in range(rand.randrange(8))]}}
+    return None
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    '''
+    Request handler of `FakeUpstreamServer`
+    '''
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes, without this every keep-alive
+    # response waits on a delayed ack
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+    def _reply(self, status, body=None, headers=None):
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _route(self, method):
+        # drain the request body so the connection can be reused
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.count():
+            self._reply(429, {"code": 429, "type": "TOO_MANY_REQUESTS"},
+                    {"Retry-After": str(self.server.retry_after)})
+            return
+
+        split = urlsplit(self.path)
+        host, _, path = split.path.lstrip("/").partition("/")
+        path = "/" + path
+        query = parse_qs(split.query)
+
+        if method == "POST" and path == "/oauth/token":
+            self._reply(200, {"access_token": "bench", "token_type": "bearer", "expires_in": 86399})
+        elif method == "POST" and path == "/oauth/check_token":
+            self._reply(200, {"exp": int(time.time()) + 86399})
+        elif host == "raider.io" and path == "/api/v1/characters/profile":
+            fields = ",".join(query.get("fields", [])).split(",")
+            self._reply(200, raiderio_profile(query["realm"][0], query["name"][0], fields))
+        elif host.endswith(".api.blizzard.com"):
+            body = blizzard_document(path)
+            if body is None:
+                self._reply(404, {"code": 404, "type": "BLZWEBAPI00000404", "detail": "Not Found"})
+                return
+            etag = '"{}"'.format(hashlib.sha256(json.dumps(body).encode("utf-8")).hexdigest()[:16])
+            if self.headers.get("If-None-Match") == etag:
+                self.server.count_not_modified()
+                self._reply(304, headers={"ETag": etag})
+            else:
+                self._reply(200, body, {"ETag": etag})
+        else:
+            self._reply(404, {"code": 404, "detail": "Not Found"})
+
+    def do_GET(self): # pylint: disable=invalid-name
+        '''
+        Answer a GET
+        '''
+        self._route("GET")
+
+    def do_POST(self): # pylint: disable=invalid-name
+        '''
+        Answer a POST
+        '''
+        self._route("POST")
+
+class LocalTransport(HttpTransport):
+    '''
+    HttpTransport sending every `https://<host>/<path>` request to
+    `<base_url>/<host>/<path>` instead, rate limiting and retries unchanged.
+    '''
+    def __init__(self, base_url, **kwargs):
+        '''
+        LocalTransport constructor
+        '''
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def request(self, method, url, limit_key=None, endpoint=None, **kwargs):
+        '''
+        Send the request to the local server.
+        '''
+        split = urlsplit(url)
+        local_url = "{}/{}{}".format(self.base_url, split.netloc, split.path)
+        return super().request(method, local_url, limit_key=limit_key, endpoint=endpoint,
+                **kwargs)
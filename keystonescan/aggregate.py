@@ -0,0 +1,149 @@
+'''
+keystonescan.aggregate
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides the aggregation of scanned characters into the tables
+behind the player, character and weekly output files
+'''
+
+class KeystoneAggregate():
+    '''
+    Per-player and per-character dungeon tables keyed by dungeon id, filled
+    in a single pass over the characters.  Dungeons a character never ran are
+    taken from `dungeon_default` when the output is built, so nothing is copied.
+
+    Basic Usage::
+       >>> aggregate = KeystoneAggregate.build(dungeon_default, characters)
+       >>> aggregate.player_output()
+       [{"name": "player", "dungeons": [...]}, ...]
+    '''
+    def __init__(self, dungeon_default):
+        '''
+        KeystoneAggregate constructor
+        '''
+        self.dungeon_default = dungeon_default
+        self.dungeon_ids = {dungeon["name"]: dungeon["id"] for dungeon in dungeon_default}
+        # player -> {dungeon id: best run of all their characters}
+        self.players = {}
+        # character slug -> {dungeon id: run}, names repeat across realms and regions
+        self.characters = {}
+        # character slug -> weekly completed key levels
+        self.weekly = {}
+        # characters and players showing last known good data
+        self.stale_characters = set()
+        self.stale_players = set()
+
+    @classmethod
+    def build(cls, dungeon_default, characters, completed=True, weekly=True):
+        '''
+        Aggregate a list of characters in one pass.
+        '''
+        aggregate = cls(dungeon_default)
+        for character in characters:
+            aggregate.add(character, completed, weekly)
+        return aggregate
+
+    def add(self, character, completed=True, weekly=True):
+        '''
+        Fold the completed and/or weekly keystones of a character into the tables.
+        '''
+        if character.stale:
+            self.stale_characters.add(character.slug())
+            self.stale_players.update(character.players)
+        if completed:
+            self.add_completed(character)
+        if weekly:
+            self.add_weekly(character)
+
+    def add_completed(self, character):
+        '''
+        Fold the best runs of a character into the tables of its character and
+        of every player it is listed under.
+        '''
+        player_tables = [self.players.setdefault(player, {}) for player in character.players]
+        character_table = self.characters[character.slug()] = {}
+        for dungeon_name, run in character.keystone.items():
+            dungeon_id = self.dungeon_ids.get(dungeon_name)
+            if dungeon_id is None:
+                continue
+            character_table[dungeon_id] = run
+            for player_table in player_tables:
+                best = player_table.get(dungeon_id)
+                if best is None or best["level"] < run["level"]:
+                    player_table[dungeon_id] = run
+
+    def add_weekly(self, character):
+        '''
+        Record the keys a character completed this week.
+        '''
+        self.weekly[character.slug()] = character.weekly_completed_keys
+
+    def dungeons(self, table):
+        '''
+        Expand a dungeon table into the output dungeon list in default order.
+        '''
+        dungeons = []
+        for dungeon in self.dungeon_default:
+            run = table.get(dungeon["id"])
+            if run is None:
+                dungeons.append(dungeon)
+                continue
+            dungeons.append({
+                "id": dungeon["id"],
+                "name": dungeon["name"],
+                "level": run["level"],
+                "duration": run["duration"],
+                "rating": run["rating"],
+            })
+        return dungeons
+
+    @staticmethod
+    def entry(name, dungeons, stale, slug=None):
+        '''
+        One output record, flagged `"stale": true` when built from last known
+        good data.  Character records also name their realm and region.
+        '''
+        entry = {"name": name, "dungeons": dungeons}
+        if slug is not None:
+            entry["realm"] = slug[1]
+            entry["region"] = slug[0]
+        if stale:
+            entry["stale"] = True
+        return entry
+
+    def player_output(self):
+        '''
+        Data for players.json
+        '''
+        # players.json contains:
+        # [{"name": "<player>",
+        #   "dungeons": [{"id": <id>, "name": "...", "level": <best level of all characters>,
+        #                 "duration": <ms>, "rating": {...}}, ...],
+        #   "stale": true <only when built from last known good data>}, ...]
+        return [self.entry(player, self.dungeons(table), player in self.stale_players)
+                for player, table in self.players.items()]
+
+    def character_output(self):
+        '''
+        Data for characters.json
+        '''
+        # characters.json contains:
+        # [{"name": "<Character>", "realm": "<realm>", "region": "<region>",
+        #   "dungeons": [{"id": <id>, "name": "...", "level": <level>,
+        #                 "duration": <ms>, "rating": {...}}, ...],
+        #   "stale": true <only when built from last known good data>}, ...]
+        # "realm" and "region" tell apart characters of the same name
+        return [self.entry(str.capitalize(slug[2]), self.dungeons(table),
+                slug in self.stale_characters, slug)
+                for slug, table in self.characters.items()]
+
+    def weekly_output(self):
+        '''
+        Data for weekly.json
+        '''
+        # weekly.json contains:
+        # [{"name": "<Character>", "realm": "<realm>", "region": "<region>",
+        #   "dungeons": [<completed key levels this week, highest first>],
+        #   "stale": true <only when built from last known good data>}, ...]
+        return [self.entry(str.capitalize(slug[2]), dungeons, slug in self.stale_characters, slug)
+                for slug, dungeons in self.weekly.items()]
@@ -0,0 +1,174 @@
+'''
+keystonescan.archive
+~~~~~~~~~~~~~~~~~~~~
+
+This module provides recording of raw API responses and replaying them
+without touching the network
+'''
+
+import os
+import gzip
+import json
+import shutil
+import hashlib
+import threading
+
+import requests
+
+from keystonescan.transport import HttpTransport
+
+class ReplayMissingError(Exception):
+    '''
+    Exception thrown when a replayed scan makes a request that was not recorded
+    '''
+
+class ResponseArchive():
+    '''
+    Directory of recorded responses.  Bodies are stored gzip compressed under
+    their sha256 so identical responses are kept once, `index.json` maps each
+    request to its status, headers and body.
+
+    Basic Usage::
+       >>> archive = ResponseArchive("./archive")
+       >>> transport = HttpTransport(recorder=archive)
+       >>> ...
+       >>> archive.close()
+       >>> replay = ReplayTransport(ResponseArchive("./archive"))
+    '''
+    index_name = "index.json"
+    # response headers worth keeping for a replay
+    kept_headers = ("Content-Type", "ETag", "Last-Modified", "Retry-After")
+
+    def __init__(self, archive_dir):
+        '''
+        ResponseArchive constructor
+        '''
+        self.archive_dir = archive_dir
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(archive_dir, "objects"), exist_ok=True)
+
+        # index.json contains:
+        # {
+        #    "<request key>": {
+        #        "status": 200,
+        #        "headers": {"ETag": "..."},
+        #        "object": "<sha256 of the body>"
+        #    }
+        # }
+        self._index = {}
+        try:
+            with open(self._path(self.index_name), mode="r") as index_fd:
+                self._index = json.load(index_fd)
+        except FileNotFoundError:
+            pass
+
+    def _path(self, *names):
+        return os.path.join(self.archive_dir, *names)
+
+    @staticmethod
+    def key(method, url, params=None, headers=None, **kwargs):
+        '''
+        Archive key of a request.  Auth and conditional headers and post data
+        (secrets and tokens) are not part of it.
+        '''
+        namespace = (headers or {}).get("Battlenet-Namespace")
+        return json.dumps([method, url, sorted((params or {}).items()), namespace])
+
+    def record(self, method, url, request_kwargs, resp):
+        '''
+        Archive the response of a request made by `HttpTransport`.
+        '''
+        body = resp.content or b""
+        if url.endswith("/oauth/token") and resp.status_code == 200:
+            token = json.loads(body.decode("utf-8"))
+            token["access_token"] = "replay"
+            body = json.dumps(token).encode("utf-8")
+
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self._path("objects", digest + ".gz")
+        with self._lock:
+            if not os.path.exists(object_path):
+                with gzip.open(object_path, mode="wb") as object_fd:
+                    object_fd.write(body)
+            self._index[self.key(method, url, **request_kwargs)] = {
+                "status": resp.status_code,
+                "headers": {name: resp.headers[name]
+                        for name in self.kept_headers if name in resp.headers},
+                "object": digest,
+            }
+
+    def response(self, method, url, request_kwargs):
+        '''
+        Build the recorded response of a request.
+        '''
+        key = self.key(method, url, **request_kwargs)
+        entry = self._index.get(key)
+        if entry is None:
+            raise ReplayMissingError("request not in archive", key)
+        with gzip.open(self._path("objects", entry["object"] + ".gz"), mode="rb") as object_fd:
+            body = object_fd.read()
+
+        resp = requests.Response()
+        resp.status_code = entry["status"]
+        resp.reason = "Replayed"
+        resp.url = url
+        resp.headers.update(entry["headers"])
+        resp._content = body # pylint: disable=protected-access
+        return resp
+
+    def add_file(self, name, path):
+        '''
+        Keep a copy of an input file (e.g. toons.json) with the responses.
+        '''
+        shutil.copyfile(path, self._path(name))
+
+    def close(self):
+        '''
+        Write the index, the archive is not usable for a replay before this.
+        '''
+        with self._lock:
+            tmp_path = self._path(self.index_name + ".tmp")
+            with open(tmp_path, mode="w") as index_fd:
+                json.dump(self._index, index_fd, indent=1, sort_keys=True)
+            os.replace(tmp_path, self._path(self.index_name))
+
+class ReplayTransport(HttpTransport):
+    '''
+    Transport answering every request from a `ResponseArchive`.
+    '''
+    def __init__(self, archive):
+        '''
+        ReplayTransport constructor
+        '''
+        super().__init__(max_retries=0)
+        self.archive = archive
+
+    def request(self, method, url, limit_key=None, endpoint=None, **kwargs):
+        '''
+        Return the recorded response, no network involved.
+        '''
+        return self.archive.response(method, url, kwargs)
+
+class ReplayOAuth():
+    '''
+    Stand-in for `BlizzOAuth` while replaying, there is nothing to authorize.
+    '''
+    client_id = "replay"
+    limit_suffix = None
+
+    def pick(self):
+        '''
+        There is only this one client
+        '''
+        return self
+
+    def client_credentials(self):
+        '''
+        return a dummy bearer token
+        '''
+        return "replay"
+
+    def invalidate(self):
+        '''
+        Nothing to forget
+        '''
@@ -1,22 +1,56 @@
 '''
 blizzoauth module docstring
 '''
+import os
 import json
 import datetime
+import threading
+import contextlib
 from datetime import timezone
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from keystonescan import profiling
+from keystonescan.blizzregion import BlizzardRegion
 from keystonescan.blizzrequest import BlizzardApiRequest
 
 class BlizzOAuth():
     '''
     BlizzOAuth class docstring
+
+    The bearer token is kept in memory and trusted until `timestamp + expires_in`
+    minus `expiry_margin`.  The auth cache file and blizzard are only consulted
+    when the token is missing, about to expire or was rejected by the API.
     '''
-    def __init__(self, client_id, client_secret, auth_cache):
+    # refresh the token this many seconds before blizzard says it expires
+    expiry_margin = 300
+
+    def __init__(self, client_id, client_secret, auth_cache, transport=None,
+            region=BlizzardRegion.US):
         '''
         constructor docstring
+
+        @param region Region whose OAuth endpoint hands out the token
         '''
         self.client_id = client_id
         self.client_secret = client_secret
         self.auth_cache_file = auth_cache
+        self.transport = transport
+        self.region = region
+        # set by BlizzOAuthPool so every client gets its own rate limit budget
+        self.limit_suffix = None
+        # us tokens keep the plain client id key older auth caches used
+        self.cache_key = client_id
+        if region != BlizzardRegion.US:
+            self.cache_key = "{}/{}".format(client_id, region)
+
+        self._token = None
+        self._expires_at = 0
+        self._rejected_token = None
+        self._lock = threading.Lock()
 
     def __repr__(self):
         return str(self)
@@ -31,37 +65,169 @@ class BlizzOAuth():
         '''
         return oauth bearer token
         '''
-        auth_cache = {}
         now = int(datetime.datetime.now(tz=timezone.utc).timestamp())
+        if self._token is not None and now < self._expires_at:
+            return self._token
+
+        # concurrent scans share this object, only one thread refreshes the token
+        with self._lock:
+            if self._token is not None and now < self._expires_at:
+                return self._token
+            with profiling.span("auth"):
+                return self._refresh(now)
 
+    def _refresh(self, now):
+        '''
+        Load the token from the auth cache file or request a new one.
+        '''
         # auth_cache.json contains:
         # {
-        #    "<client_id value>": {
+        #    "<client_id value>[/<region other than us>]": {
         #        "timestamp": <time when blizz request was made>,
         #        "access_token": "xyz",
         #        "token_type": "bearer",
         #        "expires_in": 86399
         #    }
         # }
+        # other clients and processes share the file, hold the lock from reading
+        # it until our entry is merged in so no entry is lost or fetched twice
+        with self._locked_auth_cache():
+            auth_cache = self._read_auth_cache()
+            auth_info = auth_cache.get(self.cache_key)
+            if auth_info is not None and self._accept(auth_info, now):
+                return self._token
+
+            # we have a cache miss, call blizzard API and request new access_token
+            token = BlizzardApiRequest.oauth_token_client(self.client_id, self.client_secret,
+                    self.region, transport=self.transport)
+            token["timestamp"] = now
+            auth_cache[self.cache_key] = token
+            self._write_auth_cache(auth_cache)
+        self._remember(token)
+        return self._token
+
+    @contextlib.contextmanager
+    def _locked_auth_cache(self):
+        '''
+        Hold an exclusive lock on `<auth_cache>.lock`, a no-op where fcntl is missing.
+        '''
+        if fcntl is None:
+            yield
+            return
+        with open(self.auth_cache_file + ".lock", mode="a") as lock_fd:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+
+    def _write_auth_cache(self, auth_cache):
+        '''
+        Replace the auth cache file through a rename, readers never see a partial file.
+        '''
+        tmp_path = "{}.{}.tmp".format(self.auth_cache_file, os.getpid())
+        with open(tmp_path, mode="w") as auth_fd:
+            auth_fd.write(json.dumps(auth_cache))
+        os.replace(tmp_path, self.auth_cache_file)
+
+    def pick(self):
+        '''
+        The client to send the next request with, see `BlizzOAuthPool`.
+        '''
+        return self
+
+    def invalidate(self):
+        '''
+        Forget the in-memory token, e.g. after the API answered with a 401.
+        The next `client_credentials` call will not hand out the same token again.
+        '''
+        with self._lock:
+            self._rejected_token = self._token
+            self._token = None
+            self._expires_at = 0
+
+    def _read_auth_cache(self):
+        '''
+        Load the auth cache file, treating a missing or corrupt file as empty.
+        '''
         try:
             with open(self.auth_cache_file, mode="r") as auth_fd:
-                auth_cache = json.load(auth_fd)
-                if self.client_id in auth_cache:
-                    auth_info = auth_cache[self.client_id]
-                    if BlizzardApiRequest.oauth_check_token(auth_info["access_token"]):
-                        return auth_info["access_token"]
+                return json.load(auth_fd)
         except FileNotFoundError:
             pass
         except json.decoder.JSONDecodeError:
             pass
+        return {}
 
+    def _accept(self, auth_info, now):
+        '''
+        Decide if a token from the auth cache file is still usable.  Entries
+        without expiry information fall back to asking blizzard.
+        '''
+        if "access_token" not in auth_info or auth_info["access_token"] == self._rejected_token:
+            return False
+
+        if "timestamp" in auth_info and "expires_in" in auth_info:
+            if now >= auth_info["timestamp"] + auth_info["expires_in"] - self.expiry_margin:
+                return False
+        elif not BlizzardApiRequest.oauth_check_token(auth_info["access_token"], self.region,
+                transport=self.transport):
+            return False
+        else:
+            auth_info = dict(auth_info, timestamp=now, expires_in=self.expiry_margin * 2)
+
+        self._remember(auth_info)
+        return True
+
+    def _remember(self, token):
+        '''
+        Keep the token in memory until it is close to expiring.
+        '''
+        self._token = token["access_token"]
+        self._expires_at = token["timestamp"] + token["expires_in"] - self.expiry_margin
+
+class BlizzOAuthPool():
+    '''
+    Round-robin over the tokens of several API clients.  Blizzard rate limits
+    every client on its own, so spreading requests over N clients gives N times
+    the budget: each client counts against its own `blizzard-<region>-<n>` limit.
+
+    Basic Usage::
+       >>> pool = BlizzOAuthPool([BlizzOAuth(id1, secret1, cache), BlizzOAuth(id2, secret2, cache)])
+       >>> oauth = pool.pick()
+       >>> oauth.client_credentials()
+       "xyz"
+    '''
+    def __init__(self, clients):
+        '''
+        @param clients BlizzOAuth for every credential pair, sharing one auth cache file
+        '''
+        if not clients:
+            raise ValueError("BlizzOAuthPool needs at least one client")
+        self.clients = list(clients)
+        if len(self.clients) > 1:
+            for index, client in enumerate(self.clients):
+                client.limit_suffix = str(index)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        return ",".join(str(client) for client in self.clients)
 
-        # we have a cache miss, call blizzard API and request new access_token
-        token = BlizzardApiRequest.oauth_token_client(self.client_id, self.client_secret)
-        token["timestamp"] = now
-        with open(self.auth_cache_file, mode="w") as auth_fd:
-            cache_entry = {
-                self.client_id: token
-            }
-            auth_fd.write(json.dumps(cache_entry))
-        return token["access_token"]
+    def pick(self):
+        '''
+        The client to send the next request with
+        '''
+        with self._lock:
+            client = self.clients[self._next]
+            self._next = (self._next + 1) % len(self.clients)
+        return client
+
+    def client_credentials(self):
+        '''
+        Token of the next client
+        '''
+        return self.pick().client_credentials()
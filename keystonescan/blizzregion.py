@@ -5,6 +5,10 @@ keystonescan.blizzregion
 This module provides region support for Blizzard API
 '''
 
+import datetime
+from datetime import timezone
+from datetime import timedelta
+
 class BlizzardRegionMeta(type):
     '''
     Treat BlizzardRegion like a container so that we can do and easy
@@ -40,3 +44,24 @@ class BlizzardRegion(metaclass=BlizzardRegionMeta): # pylint: disable=too-few-pu
     KR = "kr"
     TW = "tw"
     CN = "cn"
+
+# weekday (Monday is 0) and UTC hour of the weekly reset of every region
+weekly_resets = {
+    BlizzardRegion.US: (1, 15),
+    BlizzardRegion.EU: (2, 4),
+    BlizzardRegion.KR: (2, 23),
+    BlizzardRegion.TW: (2, 23),
+    BlizzardRegion.CN: (2, 23),
+}
+
+def last_weekly_reset(now, region=BlizzardRegion.US):
+    '''
+    Unix time of the most recent weekly reset of a region at `now`.
+    '''
+    weekday, hour = weekly_resets[region]
+    current = datetime.datetime.fromtimestamp(now, tz=timezone.utc)
+    reset = current.replace(hour=hour, minute=0, second=0, microsecond=0) \
+            - timedelta(days=(current.weekday() - weekday) % 7)
+    if reset > current:
+        reset -= timedelta(days=7)
+    return int(reset.timestamp())
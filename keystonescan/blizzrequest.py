@@ -2,10 +2,11 @@
 blizzrequest module docstring
 '''
 
-import requests
+from urllib.parse import quote
 
 from keystonescan.blizzlocale import BlizzardLocale
 from keystonescan.blizzregion import BlizzardRegion
+from keystonescan.transport import default_transport
 
 class BlizzardApiError(Exception):
     '''
@@ -33,9 +34,14 @@ class BlizzardApiRequest:
     '''
     _api_url_base = "https://{}.api.blizzard.com/{}"
 
-    def __init__(self, oauth, region=BlizzardRegion.US, locale=BlizzardLocale.en_US):
+    def __init__(self, oauth, region=BlizzardRegion.US, locale=BlizzardLocale.en_US,
+            transport=None, cache=None):
         '''
         constructor
+
+        @param transport HttpTransport used for all calls, defaults to a shared one
+        @param cache Optional HttpCache used to revalidate game data instead of
+                     downloading it again
         '''
         if region not in BlizzardRegion:
             raise BlizzardInvalidRegionError("unknown region", region)
@@ -43,8 +49,13 @@ class BlizzardApiRequest:
             raise BlizzardInvalidRegionError("unknown locale", locale)
 
         self.oauth = oauth
+        self.transport = transport if transport is not None else default_transport()
+        self.cache = cache
 
         self.locale = locale
+        self.region = region
+        # every region has its own blizzard API budget
+        self.limit_key = "blizzard-{}".format(region)
         self.static_ns = "static-{}".format(region)
         self.dynamic_ns = "dynamic-{}".format(region)
         self.profile_ns = "profile-{}".format(region)
@@ -52,18 +63,53 @@ class BlizzardApiRequest:
         self.profile_url_base = self._api_url_base.format(region, "profile/wow")
         self.data_url_base = self._api_url_base.format(region, "data/wow")
 
+    def _authorized_get(self, url, namespace, params, cacheable=False, endpoint=None):
+        '''
+        GET an API url with the bearer token of the next oauth client.  When
+        blizzard rejects the token with a 401 we drop it, fetch a fresh one and
+        retry the request once.
+
+        @param cacheable Revalidate the response against the HttpCache
+        @param endpoint Name the call is counted under in the request metrics
+        '''
+        oauth = self.oauth.pick()
+        limit_key = self.limit_key
+        if oauth.limit_suffix is not None:
+            limit_key = "{}-{}".format(self.limit_key, oauth.limit_suffix)
+        for attempt in range(2):
+            headers = {
+                "Authorization" : "Bearer {}".format(oauth.client_credentials()),
+                "Battlenet-Namespace" : namespace,
+            }
+            if cacheable and self.cache is not None:
+                resp = self.cache.get(self.transport, url, params=params, headers=headers,
+                        namespace=namespace, limit_key=limit_key, endpoint=endpoint)
+            else:
+                resp = self.transport.get(url, params=params, headers=headers,
+                        limit_key=limit_key, endpoint=endpoint)
+            if resp.status_code != 401 or attempt > 0:
+                break
+            oauth.invalidate()
+        return resp
+
+    @staticmethod
+    def character_path(toon):
+        '''
+        Realm slug and character name as the profile API expects them in a url,
+        e.g. "Area 52"/"Main" becomes "area-52/main".
+        '''
+        realm = toon.realm.lower().replace("'", "").replace(" ", "-")
+        return "{}/{}".format(quote(realm), quote(toon.name.lower()))
+
     def mythic_keystone_profile_detail(self, toon, season=6, **kwargs):
         '''
         Request a characters mythic keystone times for a specific season.
         '''
-        url = "{}/character/{}/{}/mythic-keystone-profile/season/{}".format(
-                self.profile_url_base, *toon.slug(), season)
+        url = "{}/character/{}/mythic-keystone-profile/season/{}".format(
+                self.profile_url_base, self.character_path(toon), season)
         params = {"locale": kwargs.get("locale", self.locale)}
-        headers = {
-            "Authorization" : "Bearer {}".format(self.oauth.client_credentials()),
-            "Battlenet-Namespace" : self.profile_ns,
-        }
-        resp = requests.get(url, params=params, headers=headers)
+        resp = self._authorized_get(url, self.profile_ns, params,
+                endpoint="blizzard_mythic_keystone_profile")
 
         # treat a 404 as missing data for that user.  In the beginning of a season
         # we can have no data for this specific user.
@@ -76,17 +122,49 @@ class BlizzardApiRequest:
             raise BlizzardApiError(resp.text, resp.reason, resp.status_code, url)
         return resp.json()
 
+    def mythic_keystone_profile_index(self, toon, **kwargs):
+        '''
+        Request a characters mythic keystone summary, including the runs of the
+        current weekly period.
+        '''
+        url = "{}/character/{}/mythic-keystone-profile".format(
+                self.profile_url_base, self.character_path(toon))
+        params = {"locale": kwargs.get("locale", self.locale)}
+        resp = self._authorized_get(url, self.profile_ns, params,
+                endpoint="blizzard_mythic_keystone_profile_index")
+
+        # no keys done yet this season
+        if resp.status_code == 404:
+            return {"current_period": {"best_runs": []}}
+
+        if resp.status_code == 429:
+            raise BlizzardThrottlingError(resp.text, resp.reason, resp.status_code, url)
+        if resp.status_code != 200:
+            raise BlizzardApiError(resp.text, resp.reason, resp.status_code, url)
+        return resp.json()
+
     def mythic_keystone_dungeon_index(self, **kwargs):
         '''
         Return a list of mythic dungeons
         '''
         url = "{}/mythic-keystone/dungeon/index".format(self.data_url_base)
         params = {"locale": kwargs.get("locale", self.locale)}
-        headers = {
-            "Authorization" : "Bearer {}".format(self.oauth.client_credentials()),
-            "Battlenet-Namespace" : self.dynamic_ns,
-        }
-        resp = requests.get(url, params=params, headers=headers)
+        resp = self._authorized_get(url, self.dynamic_ns, params, cacheable=True,
+                endpoint="blizzard_mythic_keystone_dungeon_index")
+        if resp.status_code == 429:
+            raise BlizzardThrottlingError(resp.text, resp.status_code, url)
+        if resp.status_code != 200:
+            raise BlizzardApiError(resp.text, resp.status_code, url)
+        return resp.json()
+
+    def mythic_keystone_season_index(self, **kwargs):
+        '''
+        Return a list of mythic keystone seasons and the current season
+        '''
+        url = "{}/mythic-keystone/season/index".format(self.data_url_base)
+        params = {"locale": kwargs.get("locale", self.locale)}
+        resp = self._authorized_get(url, self.dynamic_ns, params, cacheable=True,
+                endpoint="blizzard_mythic_keystone_season_index")
         if resp.status_code == 429:
             raise BlizzardThrottlingError(resp.text, resp.status_code, url)
         if resp.status_code != 200:
@@ -99,11 +177,8 @@ class BlizzardApiRequest:
         '''
         url = "{}/mythic-keystone/dungeon/{}".format(self.data_url_base, dungeon_id)
         params = {"locale": kwargs.get("locale", self.locale)}
-        headers = {
-            "Authorization" : "Bearer {}".format(self.oauth.client_credentials()),
-            "Battlenet-Namespace" : self.dynamic_ns,
-        }
-        resp = requests.get(url, params=params, headers=headers)
+        resp = self._authorized_get(url, self.dynamic_ns, params, cacheable=True,
+                endpoint="blizzard_mythic_keystone_dungeon")
         if resp.status_code == 429:
             raise BlizzardThrottlingError(resp.text, resp.status_code, url)
         if resp.status_code != 200:
@@ -116,11 +191,8 @@ class BlizzardApiRequest:
         '''
         url = "{}/media/journal-instance/{}".format(self.data_url_base, journal_id)
         params = {"locale": kwargs.get("locale", self.locale)}
-        headers = {
-            "Authorization" : "Bearer {}".format(self.oauth.client_credentials()),
-            "Battlenet-Namespace" : self.static_ns,
-        }
-        resp = requests.get(url, params=params, headers=headers)
+        resp = self._authorized_get(url, self.static_ns, params, cacheable=True,
+                endpoint="blizzard_media_journal_instance")
         if resp.status_code == 429:
             raise BlizzardThrottlingError(resp.text, resp.status_code, url)
         if resp.status_code != 200:
@@ -128,7 +200,8 @@ class BlizzardApiRequest:
         return resp.json()
 
     @classmethod
-    def oauth_token_client(cls, client_id, client_secret, region=BlizzardRegion.US):
+    def oauth_token_client(cls, client_id, client_secret, region=BlizzardRegion.US,
+            transport=None):
         '''
         Request a bearer token from blizzard using client credentials
         '''
@@ -141,8 +214,10 @@ class BlizzardApiRequest:
         else:
             raise BlizzardInvalidRegionError("unknown region", region)
 
-        resp = requests.post(url, data={'grant_type':'client_credentials'},
-                auth=(client_id, client_secret))
+        transport = transport if transport is not None else default_transport()
+        resp = transport.post(url, data={'grant_type':'client_credentials'},
+                auth=(client_id, client_secret), limit_key="oauth-{}".format(region),
+                endpoint="oauth_token")
         if resp.status_code == 429:
             raise BlizzardThrottlingError(resp.text, resp.status_code)
         if resp.status_code != 200:
@@ -150,7 +225,7 @@ class BlizzardApiRequest:
         return resp.json()
 
     @classmethod
-    def oauth_check_token(cls, token, region=BlizzardRegion.US):
+    def oauth_check_token(cls, token, region=BlizzardRegion.US, transport=None):
         if region in (BlizzardRegion.US, BlizzardRegion.EU,):
             url = "https://{}.battle.net/oauth/check_token".format(region)
         elif region in (BlizzardRegion.KR, BlizzardRegion.TW):
@@ -160,6 +235,8 @@ class BlizzardApiRequest:
         else:
             raise BlizzardInvalidRegionError("unknown region", region)
 
-        resp = requests.post(url, data={'token':token})
+        transport = transport if transport is not None else default_transport()
+        resp = transport.post(url, data={'token':token}, limit_key="oauth-{}".format(region),
+                endpoint="oauth_check_token")
         return resp.status_code == 200
 
@@ -0,0 +1,143 @@
+'''
+keystonescan.breaker
+~~~~~~~~~~~~~~~~~~~~
+
+This module provides per-upstream circuit breakers for API calls
+'''
+
+import time
+import logging
+import threading
+
+import requests
+
+class CircuitOpenError(requests.RequestException):
+    '''
+    Exception thrown instead of sending a request to an upstream whose breaker is open
+    '''
+
+class CircuitBreaker():
+    '''
+    Stop calling an upstream after `threshold` consecutive failures (no
+    response, a 5xx or a 429 left after the retries).  While open every call
+    fails at once, after `reset_timeout` seconds a single trial call is let
+    through: its success closes the breaker, its failure opens it again.
+    '''
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, threshold=5, reset_timeout=30, clock=time.monotonic):
+        '''
+        @param name Upstream the breaker guards, used in the log
+        @param threshold Consecutive failures that open the breaker
+        @param reset_timeout Seconds the breaker stays open before a trial call
+        '''
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        '''
+        Raise CircuitOpenError unless a call may be sent now.
+        '''
+        with self._lock:
+            if self.state == self.OPEN and self._clock() >= self._opened_at + self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError("circuit open for {}".format(self.name))
+
+    def on_success(self):
+        '''
+        The upstream answered, close the breaker.
+        '''
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info("{} answered again, closing its circuit".format(self.name))
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def on_failure(self):
+        '''
+        The upstream failed a call, open the breaker after too many in a row.
+        '''
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED
+                    and self.failures >= self.threshold):
+                logging.warning("{} failed {} calls in a row, opening its circuit for {}s".format(
+                        self.name, self.failures, self.reset_timeout))
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+                self.opened += 1
+
+    def stats(self):
+        '''
+        Counters for logging
+        '''
+        with self._lock:
+            return {"state": self.state, "opened": self.opened, "rejected": self.rejected}
+
+class CircuitBreakers():
+    '''
+    One CircuitBreaker per upstream, named after the rate limit key of the
+    call with the Blizzard client pool suffix removed ("blizzard-us-1" is
+    guarded by "blizzard-us").  A threshold of zero disables the breakers.
+
+    Basic Usage::
+       >>> transport = HttpTransport(breakers=CircuitBreakers(threshold=5, reset_timeout=30))
+    '''
+    def __init__(self, threshold=5, reset_timeout=30, clock=time.monotonic):
+        '''
+        CircuitBreakers constructor
+        '''
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def upstream(limit_key):
+        '''
+        Upstream name of a rate limit key
+        '''
+        name, _, suffix = limit_key.rpartition("-")
+        return name if name and suffix.isdigit() else limit_key
+
+    def breaker(self, limit_key):
+        '''
+        Breaker guarding the upstream of `limit_key`, None when disabled.
+        '''
+        if limit_key is None or self.threshold <= 0:
+            return None
+        name = self.upstream(limit_key)
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name, self.threshold,
+                        self.reset_timeout, self._clock)
+            return breaker
+
+    def stats(self):
+        '''
+        Counters of every breaker keyed by upstream
+        '''
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.stats() for name, breaker in sorted(breakers.items())}
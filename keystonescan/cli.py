@@ -3,10 +3,38 @@
 import sys
 import argparse
 from keystonescan import keystonescan
+from keystonescan import watcher
+from keystonescan import profiling
+from keystonescan import sources
+from keystonescan import shard
+from keystonescan import server
+
+# options the merge command takes, the others only apply to scan and watch
+merge_options = ("input_dir", "output_dir", "character", "player", "dungeon", "weekly", "debug",
+        "compress", "manifest", "leaderboard", "leaderboard_size")
+# options only a single scan takes, watch refuses them
+scan_only_options = ("shard", "resume", "record", "replay")
+
+def shard_type(value):
+    """Parse a --shard value."""
+    try:
+        return shard.parse_shard(value)
+    except shard.ShardError as err:
+        raise argparse.ArgumentTypeError("{}: {}".format(err.args[0], value))
+
+def http_type(value):
+    """Parse a --http value."""
+    try:
+        return server.parse_listen(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError("expected HOST:PORT: {}".format(value)) from err
 
 def main():
     """Console script for keystonescan."""
     parser = argparse.ArgumentParser()
+    parser.add_argument("command", nargs="?", default="scan", choices=["scan", "watch", "merge"],
+            help="scan once (default), stay resident and keep the outputs up to date, or "
+                 "merge the partial-*.json files of sharded scans in the input directory")
     parser.add_argument("-i", "--input", default=".", metavar="DIR", dest="input_dir",
             help="location of input data files (e.g. 'toons.json' and 'access.json')")
     parser.add_argument("-o", "--output", default=".", metavar="DIR", dest="output_dir",
@@ -15,10 +43,87 @@ def main():
     parser.add_argument("-c", "--character", action="store_true", help="output character data")
     parser.add_argument("-d", "--dungeon", action="store_true", help="output dungeon data")
     parser.add_argument("-w", "--weekly", action="store_true", help="output weekly key data")
+    parser.add_argument("-l", "--leaderboard", action="store_true",
+            help="output leaderboards.json with per dungeon, score and weekly vault rankings")
+    parser.add_argument("--leaderboard-size", default=10, type=int, metavar="N",
+            help="runs listed per dungeon leaderboard")
+    parser.add_argument("--region", default="us", choices=["us", "eu", "kr", "tw", "cn"],
+            help="region of characters toons.json lists without one, dungeon data comes from it")
+    parser.add_argument("--source", default="raiderio", choices=sources.source_choices,
+            help="where character runs come from: raiderio, blizzard, failover (raiderio "
+                 "then blizzard) or balance (alternate between them, failing over)")
+    parser.add_argument("--shard", type=shard_type, metavar="i/N",
+            help="scan only the i-th of N roster partitions and write partial-<i>-of-<N>.json "
+                 "for a later merge")
+    parser.add_argument("-j", "--jobs", default=1, type=int, metavar="N",
+            help="number of characters to scan concurrently")
+    parser.add_argument("--cache-size", default=32, type=float, metavar="MB",
+            help="size cap of the cached blizzard game data, 0 disables the cache")
+    parser.add_argument("--dungeon-ttl", default=7 * 24, type=float, metavar="HOURS",
+            help="hours before cached dungeon details are refreshed")
+    parser.add_argument("--incremental", action="store_true",
+            help="only fetch characters whose stored data is older than --stale-after")
+    parser.add_argument("--stale-after", default=12, type=float, metavar="HOURS",
+            help="age in hours after which stored character data is fetched again")
+    parser.add_argument("--resume", action="store_true",
+            help="skip characters an interrupted scan already finished")
+    parser.add_argument("--record", metavar="DIR",
+            help="archive every raw API response of the scan in DIR")
+    parser.add_argument("--replay", metavar="DIR",
+            help="regenerate the outputs from an archive written by --record, no network calls")
+    parser.add_argument("--compress", action="append", default=[], choices=["gz", "br"],
+            help="also write precompressed output files (may be repeated)")
+    parser.add_argument("--manifest", action="store_true",
+            help="write manifest.json with the content hash of every output file")
+    parser.add_argument("--breaker-threshold", default=5, type=int, metavar="N",
+            help="consecutive failures after which an upstream is skipped and characters "
+                 "use their last known data, marked stale (0 disables)")
+    parser.add_argument("--breaker-reset", default=30, type=float, metavar="SECONDS",
+            help="seconds before a skipped upstream is tried again")
+    parser.add_argument("--metrics-file", metavar="FILE",
+            help="also write the request metrics to FILE in the Prometheus textfile format")
+    parser.add_argument("--poll-min", default=5, type=float, metavar="MINUTES",
+            help="watch: minutes between polls of a character with new runs")
+    parser.add_argument("--poll-max", default=6 * 60, type=float, metavar="MINUTES",
+            help="watch: longest poll interval for characters without new runs")
+    parser.add_argument("--http", type=http_type, metavar="HOST:PORT",
+            help="watch: also serve the outputs from memory over HTTP with ETags and gzip")
+    parser.add_argument("--profile", action="store_true",
+            help="log the time spent in every phase when done")
+    parser.add_argument("--profile-dir", metavar="DIR",
+            help="with --profile also write cprofile.pstats and flamegraph spans.folded to DIR")
     parser.add_argument("-D", "--debug", action="store_true", help="enable debug logging")
     args = parser.parse_args()
+    args.dungeon_ttl = int(args.dungeon_ttl * 60 * 60)
+    args.stale_after = int(args.stale_after * 60 * 60)
+
+    kwargs = vars(args)
+    command = kwargs.pop("command")
+    min_interval = int(kwargs.pop("poll_min") * 60)
+    max_interval = int(kwargs.pop("poll_max") * 60)
+    if kwargs["http"] is not None and command != "watch":
+        parser.error("--http needs the watch command")
+    if command != "watch":
+        kwargs.pop("http")
+    else:
+        for key in scan_only_options:
+            if kwargs.pop(key):
+                parser.error("--{} does not apply to the watch command".format(key))
+    profile = kwargs.pop("profile")
+    profile_dir = kwargs.pop("profile_dir")
+    if not profile and profile_dir is None:
+        return run(command, min_interval, max_interval, kwargs)
+    with profiling.profile(profile_dir):
+        return run(command, min_interval, max_interval, kwargs)
+
+def run(command, min_interval, max_interval, kwargs):
+    """Run the scan or watch command."""
+    if command == "watch":
+        return watcher.watch(min_interval=min_interval, max_interval=max_interval, **kwargs)
+    if command == "merge":
+        return keystonescan.merge(**{key: kwargs[key] for key in merge_options})
 
-    return keystonescan.scan(**vars(args))
+    return keystonescan.scan(**kwargs)
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,80 @@
+'''
+keystonescan.coalesce
+~~~~~~~~~~~~~~~~~~~~~
+
+This module provides coalescing of identical requests into one upstream call
+'''
+
+import threading
+from concurrent.futures import Future
+
+class RequestCoalescer():
+    '''
+    Share one call between every caller asking for the same key.  Callers
+    arriving while the call is in flight wait for its result, with `remember`
+    a successful result `keep` accepts also answers later callers until `clear`.
+
+    Basic Usage::
+       >>> coalescer = RequestCoalescer()
+       >>> transport = HttpTransport(coalescer=coalescer)
+    '''
+    def __init__(self, remember=False, keep=lambda result: True):
+        '''
+        @param remember Keep finished results for callers arriving later
+        @param keep Called with a result, False when it must not be remembered
+        '''
+        self.remember = remember
+        self.keep = keep
+        self.hits = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def call(self, key, fn):
+        '''
+        Return `fn()`, or the result of the call already made for `key`.
+        '''
+        with self._lock:
+            shared = self._calls.get(key)
+            if shared is not None:
+                self.hits += 1
+            else:
+                future = self._calls[key] = Future()
+                future.set_running_or_notify_cancel()
+        if shared is not None:
+            return shared.result()
+
+        try:
+            result = fn()
+        except BaseException as err:
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(err)
+            raise
+        with self._lock:
+            if not self.remember or not self.keep(result):
+                del self._calls[key]
+        future.set_result(result)
+        return result
+
+    def clear(self):
+        '''
+        Forget every remembered result.
+        '''
+        with self._lock:
+            self._calls = {key: future for key, future in self._calls.items()
+                    if not future.done()}
+
+def reusable_response(resp):
+    '''
+    Responses worth sharing with later identical requests, throttled and
+    failed ones are asked for again.
+    '''
+    return resp.status_code in (200, 304, 404)
+
+def reusable_game_data(resp):
+    '''
+    Reusable responses of the Blizzard game data API (dungeons, seasons,
+    media), the only ones a scan asks for more than once.  Character
+    responses are not kept, the roster lists every character once.
+    '''
+    return reusable_response(resp) and "/data/wow/" in (resp.url or "")
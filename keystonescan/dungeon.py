@@ -4,6 +4,7 @@ Dungeon information
 
 import os
 import json
+import hashlib
 
 class Dungeon():
     '''
@@ -42,3 +43,87 @@ class Dungeon():
         slug
         '''
         return (self.realm, self.name)
+
+class DungeonCache():
+    '''
+    Computed dungeon records (upgrade times and journal tile) for the dungeon
+    output.  They only change between seasons, so they are kept per namespace
+    and locale together with the season they belong to and a digest of the
+    dungeon index they were built from.  An entry is stale once the index
+    changes, a new season starts or `ttl` seconds have passed.
+    '''
+    file_name = "dungeon_cache.json"
+    default_ttl = 7 * 24 * 60 * 60
+
+    def __init__(self, input_dir, ttl=default_ttl):
+        '''
+        DungeonCache constructor
+        '''
+        self.cache_file = os.path.join(input_dir, self.file_name)
+        self.ttl = ttl
+
+    @staticmethod
+    def scope(blizzapi):
+        '''
+        Cache entry name for the namespace and locale of an API wrapper
+        '''
+        return "{}/{}".format(blizzapi.dynamic_ns, blizzapi.locale)
+
+    @staticmethod
+    def digest(mythic_dungeons):
+        '''
+        Fingerprint of the dungeon index the records are built from
+        '''
+        index = sorted((dungeon["id"], dungeon["name"]) for dungeon in mythic_dungeons)
+        return hashlib.sha256(json.dumps(index).encode("utf-8")).hexdigest()
+
+    def _read(self):
+        # dungeon_cache.json contains:
+        # {
+        #    "<namespace>/<locale>": {
+        #        "season": <mythic keystone season id>,
+        #        "digest": <digest of the dungeon index>,
+        #        "timestamp": <time the records were fetched>,
+        #        "dungeons": [<dungeon records>]
+        #    }
+        # }
+        try:
+            with open(self.cache_file, mode="r") as cache_fd:
+                return json.load(cache_fd)
+        except FileNotFoundError:
+            pass
+        except json.decoder.JSONDecodeError:
+            pass
+        return {}
+
+    def load(self, blizzapi, mythic_dungeons, season, now):
+        '''
+        Return the cached records or None when they need to be refreshed
+
+        @param season Current mythic keystone season id, a season can keep
+                      the dungeons of the previous one with other timers
+        '''
+        entry = self._read().get(self.scope(blizzapi))
+        if entry is None or entry["digest"] != self.digest(mythic_dungeons):
+            return None
+        if entry.get("season") != season:
+            return None
+        if now >= entry["timestamp"] + self.ttl:
+            return None
+        return entry["dungeons"]
+
+    def save(self, blizzapi, mythic_dungeons, season, dungeons, now):
+        '''
+        Store freshly fetched records
+        '''
+        cache = self._read()
+        cache[self.scope(blizzapi)] = {
+            "season": season,
+            "digest": self.digest(mythic_dungeons),
+            "timestamp": now,
+            "dungeons": dungeons,
+        }
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, mode="w") as cache_fd:
+            json.dump(cache, cache_fd)
+        os.replace(tmp_file, self.cache_file)
@@ -0,0 +1,192 @@
+'''
+keystonescan.httpcache
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides an on-disk HTTP response cache with conditional revalidation
+'''
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+import requests
+
+class HttpCache():
+    '''
+    Store response bodies on disk together with their `ETag` and
+    `Last-Modified` headers.  Cached entries are revalidated with conditional
+    requests and a 304 is answered from disk.  When the bodies grow beyond
+    `max_bytes` the least recently used entries are evicted.
+
+    Basic Usage::
+       >>> cache = HttpCache("./http_cache", max_bytes=16 * 1024 * 1024)
+       >>> blizzapi = BlizzardApiRequest(oauth, cache=cache)
+    '''
+    index_name = "index.json"
+
+    def __init__(self, cache_dir, max_bytes=32 * 1024 * 1024):
+        '''
+        @param cache_dir Directory holding the cached bodies and the index
+        @param max_bytes Size cap for all cached bodies
+        '''
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        # index.json contains:
+        # {
+        #    "<key>": {
+        #        "etag": "\"abc\"",
+        #        "last_modified": "Wed, 21 Oct 2015 07:28:00 GMT",
+        #        "size": 1234,
+        #        "used": <time the entry was last stored or served>
+        #    }
+        # }
+        self._index = {}
+        try:
+            with open(self._path(self.index_name), mode="r") as index_fd:
+                self._index = json.load(index_fd)
+        except FileNotFoundError:
+            pass
+        except json.decoder.JSONDecodeError:
+            pass
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    @staticmethod
+    def key(url, params=None, namespace=None):
+        '''
+        Cache key for a request, the auth token is deliberately not part of it.
+        '''
+        request = json.dumps([url, sorted((params or {}).items()), namespace])
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def validators(self, key):
+        '''
+        Conditional request headers for a cached entry.
+        '''
+        headers = {}
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or not os.path.exists(self._path(key)):
+                return headers
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def load(self, key):
+        '''
+        Return the cached body for a key or None.
+        '''
+        with self._lock:
+            try:
+                with open(self._path(key), mode="rb") as body_fd:
+                    body = body_fd.read()
+            except FileNotFoundError:
+                self._index.pop(key, None)
+                return None
+            if key in self._index:
+                self._index[key]["used"] = time.time()
+            self.hits += 1
+            return body
+
+    def store(self, key, resp):
+        '''
+        Cache a 200 response if upstream gave us something to revalidate with.
+        '''
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        if resp.status_code != 200 or not (etag or last_modified):
+            return
+
+        body = resp.content
+        with self._lock:
+            with open(self._path(key), mode="wb") as body_fd:
+                body_fd.write(body)
+            self._index[key] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "size": len(body),
+                "used": time.time(),
+            }
+            self._evict()
+            self._save()
+
+    def _evict(self):
+        '''
+        Drop least recently used entries until we are under the size cap.
+        '''
+        total = sum(entry["size"] for entry in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]["used"]):
+            if total <= self.max_bytes:
+                break
+            total -= entry["size"]
+            del self._index[key]
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _save(self):
+        tmp_path = self._path(self.index_name + ".tmp")
+        with open(tmp_path, mode="w") as index_fd:
+            json.dump(self._index, index_fd)
+        os.replace(tmp_path, self._path(self.index_name))
+
+    def flush(self):
+        '''
+        Persist the access times of entries served since the last store.
+        '''
+        with self._lock:
+            self._save()
+
+    def get(self, transport, url, params=None, headers=None, namespace=None, **kwargs):
+        '''
+        GET a url through the cache.  A 304 is turned into a 200 carrying the
+        cached body so callers never see the difference.
+        '''
+        key = self.key(url, params, namespace)
+        headers = dict(headers or {})
+        headers.update(self.validators(key))
+
+        metrics = getattr(transport, "metrics", None)
+        endpoint = kwargs.get("endpoint") or kwargs.get("limit_key") or "other"
+        resp = transport.get(url, params=params, headers=headers, **kwargs)
+        if resp.status_code == 304:
+            body = self.load(key)
+            if body is not None:
+                if metrics is not None:
+                    metrics.cache(endpoint, True)
+                return cached_response(resp, body)
+            # the body vanished underneath us, ask again without validators
+            for header in ("If-None-Match", "If-Modified-Since"):
+                headers.pop(header, None)
+            resp = transport.get(url, params=params, headers=headers, **kwargs)
+
+        with self._lock:
+            self.misses += 1
+        if metrics is not None:
+            metrics.cache(endpoint, False)
+        self.store(key, resp)
+        return resp
+
+def cached_response(not_modified, body):
+    '''
+    Build a 200 response from a 304 and the cached body.
+    '''
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.reason = "OK"
+    resp.url = not_modified.url
+    resp.headers = not_modified.headers
+    resp.request = not_modified.request
+    resp._content = body # pylint: disable=protected-access
+    return resp
@@ -0,0 +1,139 @@
+'''
+keystonescan.journal
+~~~~~~~~~~~~~~~~~~~~
+
+This module provides the checkpoint journal that lets an interrupted scan resume
+'''
+
+import os
+import json
+import logging
+import datetime
+from datetime import timezone
+import threading
+
+class ScanJournal():
+    '''
+    Append-only journal (one json document per line) of the characters a scan
+    has finished.  Every scan starts a new epoch unless it resumes an epoch
+    that did not finish, in which case the characters already in the journal
+    are restored instead of fetched again.
+
+    Basic Usage::
+       >>> journal = ScanJournal("./scan_journal.jsonl", ["completed"], resume=True)
+       >>> journal.restore(toon)
+       False
+       >>> journal.record(toon)
+       >>> journal.finish()
+    '''
+    file_name = "scan_journal.jsonl"
+
+    def __init__(self, path, groups, resume=False, max_age=None):
+        '''
+        @param groups Data groups the scan fetches, an epoch for other groups is not resumed
+        @param resume Continue the last epoch if it did not finish
+        @param max_age Seconds after which an unfinished epoch is too old to resume
+        '''
+        self.path = path
+        self.groups = list(groups)
+        self.max_age = max_age
+        self.completed = {}
+        self._lock = threading.Lock()
+
+        # scan_journal.jsonl contains:
+        #    {"epoch": <start time>, "groups": ["completed", "weekly"]}
+        #    {"toon": "<realm>/<name>", "state": {"<group>": <Toon.get_state(group)>}}
+        #    ...
+        #    {"finished": <epoch>}
+        self.epoch = self._load() if resume else None
+        resumed = self.epoch is not None
+        if resumed:
+            logging.info("resuming scan epoch {} with {} characters done".format(
+                    self.epoch, len(self.completed)))
+            # start on a fresh line if the last one was cut short
+            with open(self.path, mode="rb+") as journal_fd:
+                journal_fd.seek(0, os.SEEK_END)
+                if journal_fd.tell() > 0:
+                    journal_fd.seek(-1, os.SEEK_END)
+                    if journal_fd.read(1) != b"\n":
+                        journal_fd.write(b"\n")
+        else:
+            self.epoch = int(datetime.datetime.now(tz=timezone.utc).timestamp())
+            self.completed = {}
+        # held open for the whole scan, `finish` or `close` releases it
+        self._fd = open(self.path, mode="a" if resumed else "w") # pylint: disable=consider-using-with
+        if not resumed:
+            self._append({"epoch": self.epoch, "groups": self.groups})
+
+    def _load(self):
+        '''
+        Read an unfinished epoch for our groups, returns its id or None.
+        '''
+        epoch = None
+        try:
+            with open(self.path, mode="r") as journal_fd:
+                for line in journal_fd:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line cut short by the crash we are resuming from
+                        continue
+                    if "epoch" in entry:
+                        epoch = entry["epoch"] if set(self.groups) <= set(entry["groups"]) else None
+                        self.completed = {}
+                    elif "finished" in entry:
+                        epoch = None
+                    elif epoch is not None:
+                        self.completed[entry["toon"]] = entry["state"]
+        except FileNotFoundError:
+            pass
+        now = datetime.datetime.now(tz=timezone.utc).timestamp()
+        if epoch is not None and self.max_age is not None and epoch < now - self.max_age:
+            logging.info("scan epoch {} is too old to resume, starting over".format(epoch))
+            epoch = None
+        return epoch
+
+    def _append(self, entry):
+        with self._lock:
+            self._fd.write(json.dumps(entry) + "\n")
+            self._fd.flush()
+
+    @staticmethod
+    def key(toon):
+        '''
+        Journal key for a toon
+        '''
+        return "/".join(toon.slug())
+
+    def restore(self, toon):
+        '''
+        Fill a toon finished earlier in this epoch, returns False for unknown toons.
+        '''
+        state = self.completed.get(self.key(toon))
+        if state is None:
+            return False
+        for group in self.groups:
+            toon.set_state(group, state[group])
+        return True
+
+    def record(self, toon):
+        '''
+        Append a finished toon.
+        '''
+        self._append({"toon": self.key(toon),
+                      "state": {group: toon.get_state(group) for group in self.groups}})
+
+    def finish(self):
+        '''
+        Mark the epoch as finished, a later `--resume` starts over.
+        '''
+        self._append({"finished": self.epoch})
+        self.close()
+
+    def close(self):
+        '''
+        Close the journal file.
+        '''
+        with self._lock:
+            if not self._fd.closed:
+                self._fd.close()
@@ -8,53 +8,93 @@ data in a parsable format, used to display on our guild page.
 
 import os
 import json
-import copy
 import datetime
 from datetime import timezone
 from datetime import timedelta
 import operator
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 
-from keystonescan.blizzoauth import BlizzOAuth
-from keystonescan.blizzrequest import BlizzardApiRequest
+from keystonescan.blizzoauth import BlizzOAuth, BlizzOAuthPool
+from keystonescan.blizzregion import BlizzardRegion
+from keystonescan.regions import BlizzardRegionClients
 from keystonescan.raideriorequest import RaiderIoApiRequest, RaiderIoApiError
+from keystonescan.transport import HttpTransport
+from keystonescan.ratelimit import RateLimiter
+from keystonescan.metrics import RequestMetrics
+from keystonescan.sources import get_run_source, source_unavailable
+from keystonescan.coalesce import RequestCoalescer, reusable_game_data
+from keystonescan.breaker import CircuitBreakers
+from keystonescan.httpcache import HttpCache
 
 from keystonescan import toons
+from keystonescan import shard as shards
+from keystonescan import profiling
+from keystonescan.dungeon import DungeonCache
+from keystonescan.statestore import ToonStateStore
+from keystonescan.aggregate import KeystoneAggregate
+from keystonescan.leaderboard import Leaderboards
+from keystonescan.output import OutputWriter
+from keystonescan.journal import ScanJournal
+from keystonescan.archive import ResponseArchive, ReplayTransport, ReplayOAuth
 
 class AuthorizationError(Exception):
     '''
     Exception with getting API credentials from access.json
     '''
 
-def get_dungeon_details(blizzapi, mythic_dungeons):
+def get_dungeon_detail(blizzapi, mythic_dungeon):
+    '''
+    Pull down the keystone upgrade times and the journal tile for one dungeon.
+    '''
+    dungeon = blizzapi.mythic_keystone_dungeon(mythic_dungeon["id"])
+    upgrade_times = [str(timedelta(milliseconds=duration))
+            for _, duration in [keystone_upgrades.values()
+                for keystone_upgrades in dungeon["keystone_upgrades"]]]
+    upgrade_times.sort(reverse=True)
+
+    media = blizzapi.media_journal_instance(dungeon["dungeon"]["id"])
+    tile = None
+    for asset in media["assets"]:
+        if asset["key"] == "tile":
+            tile = asset["value"]
+
+    return {
+        "name": dungeon["name"],
+        "id": dungeon["id"],
+        "upgrade": upgrade_times,
+        "tile": tile,
+    }
+
+def get_dungeon_details(blizzapi, mythic_dungeons, jobs=1):
     '''
     Pull down dungeon detailed information like the dungeon background image
     and keystone upgrade times.
     '''
-    dungeon_details = []
-    for mythic_dungeon in mythic_dungeons:
-        dungeon = blizzapi.mythic_keystone_dungeon(mythic_dungeon["id"])
-        upgrade_times = [str(timedelta(milliseconds=duration))
-                for _, duration in [keystone_upgrades.values()
-                    for keystone_upgrades in dungeon["keystone_upgrades"]]]
-        upgrade_times.sort(reverse=True)
-
-        media = blizzapi.media_journal_instance(dungeon["dungeon"]["id"])
-        tile = None
-        for asset in media["assets"]:
-            if asset["key"] == "tile":
-                tile = asset["value"]
-
-        dungeon_details.append({
-            "name": dungeon["name"],
-            "id": dungeon["id"],
-            "upgrade": upgrade_times,
-            "tile": tile,
-        })
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        dungeon_details = list(executor.map(
+                lambda mythic_dungeon: get_dungeon_detail(blizzapi, mythic_dungeon),
+                mythic_dungeons))
 
     sorted(dungeon_details, key=operator.itemgetter("id"))
     return dungeon_details
 
+def get_cached_dungeon_details(blizzapi, mythic_dungeons, dungeon_cache, jobs=1):
+    '''
+    Return the dungeon details from `dungeon_cache`, only going to the API when
+    the dungeon index or the season changed or the cached records expired.
+    '''
+    now = int(datetime.datetime.now(tz=timezone.utc).timestamp())
+    season = blizzapi.mythic_keystone_season_index()["current_season"]["id"]
+    dungeon_details = dungeon_cache.load(blizzapi, mythic_dungeons, season, now)
+    if dungeon_details is not None:
+        return dungeon_details
+
+    logging.info("refreshing dungeon details")
+    dungeon_details = get_dungeon_details(blizzapi, mythic_dungeons, jobs)
+    dungeon_cache.save(blizzapi, mythic_dungeons, season, dungeon_details, now)
+    return dungeon_details
+
 def get_dungeon_defaults(blizzapi, exclusions=[197, 198, 199, 206, 207, 210]):
     '''
     Pull the current season dungeons and set the level completed to zero.
@@ -82,41 +122,146 @@ def get_dungeon_defaults(blizzapi, exclusions=[197, 198, 199, 206, 207, 210]):
     sorted(dungeon_default, key=operator.itemgetter("id"))
     return dungeon_default
 
-def scan_completed_keystones(raiderioapi, scanned_toons):
+def scan_concurrently(scanned_toons, scan_toon, jobs=1):
     '''
-    Get all toons from `<input_dir>/toons.json and query the blizzard API
-    for all the completed keystones.
+    Call `scan_toon(toon)` for every toon using at most `jobs` worker threads.
+    Toons keep their roster order.  The first error to happen cancels the
+    toons not started yet and is raised once the running ones finish.
     '''
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [executor.submit(scan_toon, toon) for toon in scanned_toons]
+        try:
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in pending:
+                future.cancel()
+            for future in futures:
+                if future in done:
+                    future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return scanned_toons
+
+def scan_stale_toons(scanned_toons, groups, scan_toon, jobs=1, state_store=None, stale_after=0,
+        journal=None, incremental=True):
+    '''
+    Call `scan_toon(toon, stale_groups)` for every toon with data groups that
+    are missing from `state_store` or older than `stale_after` seconds, fresh
+    groups are restored from the store.  Without a store, or when not
+    `incremental`, every group of every toon is scanned.  Toons already
+    finished in the `journal` epoch are restored from it, the others are
+    appended as they finish unless they only got stale data.
+    '''
+    now = int(datetime.datetime.now(tz=timezone.utc).timestamp())
+    stale_toons = []
     for toon in scanned_toons:
+        if journal is not None and journal.restore(toon):
+            continue
+        stale_groups = list(groups)
+        if state_store is not None and incremental:
+            stale_groups = [group for group in groups
+                    if not state_store.restore(toon, group, fresh_after=now - stale_after,
+                        now=now)]
+        if stale_groups:
+            stale_toons.append((toon, stale_groups))
+        elif journal is not None:
+            journal.record(toon)
+    if state_store is not None and incremental:
+        logging.info("{} of {} characters need a refresh".format(
+                len(stale_toons), len(scanned_toons)))
+
+    def scan_and_save(stale_toon):
+        toon, stale_groups = stale_toon
+        if scan_toon(toon, stale_groups) is not False and state_store is not None:
+            for group in stale_groups:
+                state_store.save(toon, group, now)
+        if journal is not None and not toon.stale:
+            journal.record(toon)
+
+    scan_concurrently(stale_toons, scan_and_save, jobs)
+    return scanned_toons
+
+def scan_keystones(raiderioapi, scanned_toons, groups, jobs=1, state_store=None, stale_after=0,
+        journal=None, incremental=True):
+    '''
+    Query raider.io (or any run data source from `keystonescan.sources`) once
+    per toon for every data group in `groups` ("completed" and/or "weekly").
+    A toon whose upstream is down, throttled or behind an open circuit gets
+    its last known good data from `state_store` and is marked stale.
+    '''
+    def scan_toon(toon, stale_groups):
         logging.info("scanning {}".format(toon))
         try:
-            toon.get_mythic_keystone(raiderioapi)
-        except RaiderIoApiError as err:
-            if err.args[0] == 400 and err.args[1] == "Bad Request":
+            with profiling.span("toon"):
+                toon.get_keystone_profile(raiderioapi,
+                        completed="completed" in stale_groups, weekly="weekly" in stale_groups)
+        except Exception as err: # pylint: disable=broad-except
+            if isinstance(err, RaiderIoApiError) and err.args[0] == 400 \
+                    and err.args[1] == "Bad Request":
                 logging.error(err)
-            else:
+                return False
+            if not source_unavailable(err):
                 raise err
-    return scanned_toons
+            logging.error("{} unavailable, using its last known data: {}".format(toon, err))
+            toon.stale = True
+            if state_store is not None:
+                for group in stale_groups:
+                    state_store.restore(toon, group)
+            return False
+        return True
+    return scan_stale_toons(scanned_toons, groups, scan_toon, jobs, state_store, stale_after,
+            journal, incremental)
+
+def scan_completed_keystones(raiderioapi, scanned_toons, jobs=1, state_store=None, stale_after=0):
+    '''
+    Get all toons from `<input_dir>/toons.json and query the blizzard API
+    for all the completed keystones.
+    '''
+    return scan_keystones(raiderioapi, scanned_toons, ["completed"], jobs, state_store, stale_after)
 
-def scan_weekly_keystones(raiderioapi, scanned_toons):
+def scan_weekly_keystones(raiderioapi, scanned_toons, jobs=1, state_store=None, stale_after=0):
     '''
     Get all toons from `<input_dir>/toons.json and query the blizzard API
     for keystons complete this week.
     '''
-    for toon in scanned_toons:
-        toon.get_weekly_keystone(raiderioapi)
-    return scanned_toons
+    return scan_keystones(raiderioapi, scanned_toons, ["weekly"], jobs, state_store, stale_after)
 
-def get_toons(input_dir):
+def get_dungeon_data(blizzapi, details=False, dungeon_cache=None, jobs=1):
+    '''
+    Return the dungeon defaults and, when asked for, the dungeon details
+    (through `dungeon_cache` if one is given).
+    '''
+    with profiling.span("dungeon_defaults"):
+        dungeon_default = get_dungeon_defaults(blizzapi)
+    dungeon_details = None
+    with profiling.span("dungeon_details"):
+        if details and dungeon_cache is not None:
+            dungeon_details = get_cached_dungeon_details(blizzapi, dungeon_default, dungeon_cache,
+                    jobs)
+        elif details:
+            dungeon_details = get_dungeon_details(blizzapi, dungeon_default, jobs)
+    return (dungeon_default, dungeon_details)
+
+def get_toons(input_dir, region=BlizzardRegion.US):
     '''
     Scan `<input_dir>/toons.json` for list of characters to scan.
+
+    @param region Region of the characters listed without one
     '''
-    return toons.Toon.scan(input_dir)
+    return toons.Toon.scan(input_dir, region)
 
-def get_api_access_file(input_dir):
+def get_api_credentials(input_dir):
     '''
-    Open `<input_dir>/access.json` to get the API client_id and client_secret
+    Open `<input_dir>/access.json` to get every API client_id and client_secret
+    pair, returns a list of `(client_id, client_secret)`.
     '''
+    # access.json contains a single client, a list of clients or both:
+    # {
+    #    "client_id": "...",
+    #    "client_secret": "...",
+    #    "clients": [{"client_id": "...", "client_secret": "..."}, ...]
+    # }
     access = {}
     try:
         with open(os.path.join(input_dir, 'access.json'), mode="r") as secret_fd:
@@ -125,107 +270,336 @@ def get_api_access_file(input_dir):
         raise AuthorizationError("Blizzard API access secrets file missing",
                 os.path.join(input_dir, "access.json")) from fnfe
 
-    if "client_id" not in access or "client_secret" not in access:
+    clients = list(access.get("clients", []))
+    if "client_id" in access or "client_secret" in access:
+        clients.insert(0, access)
+    credentials = []
+    for client in clients:
+        if "client_id" not in client or "client_secret" not in client:
+            raise AuthorizationError("Missing secrets values in access.json")
+        if (client["client_id"], client["client_secret"]) not in credentials:
+            credentials.append((client["client_id"], client["client_secret"]))
+    if not credentials:
         raise AuthorizationError("Missing secrets values in access.json")
 
-    return (access["client_id"], access["client_secret"])
+    return credentials
 
-def generate_weekly_output(output_dir, characters, dungeon_default):
-    character_cache = {}
-    for character in characters:
-        character_cache[character.name] = character.weekly_completed_keys
+def get_api_clients(input_dir, jobs=1, cache_size=32, record=None, replay=None, transport=None,
+        remember=True, breaker_threshold=5, breaker_reset=30):
+    '''
+    Build the per-region blizzard clients and the raider.io API wrapper sharing
+    one pooled, rate limited transport.  The blizzard clients revalidate game
+    data against `<input_dir>/http_cache` unless `cache_size` is zero.
+
+    @param record Archive directory every raw response is recorded to
+    @param replay Archive directory to answer every request from instead of the network
+    @param transport HttpTransport to use instead of building one
+    @param remember Answer repeated identical game data requests from the first response
+                    until the scan ends, otherwise only requests in flight at the same
+                    time are shared
+    @param breaker_threshold Consecutive failures that open the circuit of an upstream,
+                             zero disables the circuit breakers
+    @param breaker_reset Seconds an open circuit waits before trying its upstream again
+    '''
+    if replay is not None:
+        transport = ReplayTransport(ResponseArchive(replay))
+        return (BlizzardRegionClients(lambda region: ReplayOAuth(), transport=transport),
+                RaiderIoApiRequest(transport=transport))
+
+    recorder = ResponseArchive(record) if record is not None else None
+    if transport is None:
+        transport = HttpTransport(pool_size=max(jobs, HttpTransport.default_pool_size),
+                rate_limiter=RateLimiter())
+    transport.recorder = recorder
+    if transport.metrics is None:
+        transport.metrics = RequestMetrics()
+    if transport.coalescer is None:
+        transport.coalescer = RequestCoalescer(remember=remember, keep=reusable_game_data)
+    if transport.breakers is None:
+        transport.breakers = CircuitBreakers(breaker_threshold, breaker_reset)
+    http_cache = None
+    # a recording needs full bodies, not the 304s of conditional requests
+    if cache_size > 0 and recorder is None:
+        http_cache = HttpCache(os.path.join(input_dir, "http_cache"),
+                max_bytes=int(cache_size * 1024 * 1024))
+    credentials = get_api_credentials(input_dir)
+    auth_cache = os.path.join(input_dir, "auth_cache.json")
+    blizzapis = BlizzardRegionClients(
+            lambda region: BlizzOAuthPool([BlizzOAuth(client_id, client_secret, auth_cache,
+                transport=transport, region=region) for client_id, client_secret in credentials]),
+            transport=transport, cache=http_cache)
+    raiderioapi = RaiderIoApiRequest(transport=transport)
+    return (blizzapis, raiderioapi)
+
+def configure_logging(debug=False):
+    '''
+    Set the root log level
+    '''
+    if debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+    else:
+        logging.getLogger().setLevel(logging.INFO)
 
-    with open(os.path.join(output_dir, "weekly.json"), mode="w") as character_fd:
-        json.dump(
-            [{"name": str.capitalize(character), "dungeons": dungeons}
-                    for character, dungeons in character_cache.items()],
-            character_fd, indent=2)
+def generate_weekly_output(writer, aggregate):
+    '''
+    generate_weekly_output
+    '''
+    return writer.write_json("weekly.json", aggregate.weekly_output())
 
-def generate_player_output(output_dir, characters, dungeon_default):
+def generate_player_output(writer, aggregate):
     '''
     generate_player_output
     '''
-    # collapse all characters with the same player into a dictionary
-    player_cache = {}
-    for character in characters:
-        if character.player not in player_cache:
-            player_cache[character.player] = copy.deepcopy(dungeon_default)
-
-        for dungeon in player_cache[character.player]:
-            if dungeon["name"] in character.keystone and dungeon["level"] < character.keystone[dungeon["name"]]["level"]:
-                dungeon["level"] = character.keystone[dungeon["name"]]["level"]
-                dungeon["duration"] = character.keystone[dungeon["name"]]["duration"]
-                dungeon["rating"] = character.keystone[dungeon["name"]]["rating"]
-
-    with open(os.path.join(output_dir, "players.json"), mode="w") as players_fd:
-        json.dump(
-            [{"name": player, "dungeons": dungeons} for player, dungeons in player_cache.items()],
-            players_fd, indent=2)
+    return writer.write_json("players.json", aggregate.player_output())
 
-def generate_character_output(output_dir, characters, dungeon_default):
+def generate_character_output(writer, aggregate):
     '''
     generate_character_output
     '''
-    character_cache = {}
-    for character in characters:
-        character_cache[character.name] = copy.deepcopy(dungeon_default)
-
-        for dungeon in character_cache[character.name]:
-            if dungeon["name"] in character.keystone:
-                dungeon["level"] = character.keystone[dungeon["name"]]["level"]
-                dungeon["duration"] = character.keystone[dungeon["name"]]["duration"]
-                dungeon["rating"] = character.keystone[dungeon["name"]]["rating"]
-
-    with open(os.path.join(output_dir, "characters.json"), mode="w") as character_fd:
-        json.dump(
-            [{"name": str.capitalize(character), "dungeons": dungeons}
-                    for character, dungeons in character_cache.items()],
-            character_fd, indent=2)
+    return writer.write_json("characters.json", aggregate.character_output())
 
-def generate_dungeon_output(output_dir, dungeon_details):
+def generate_dungeon_output(writer, dungeon_details):
     '''
     generate_dungeon_output
     '''
-    with open(os.path.join(output_dir, "dungeons.json"), mode="w") as dungeon_fd:
-        json.dump(dungeon_details, dungeon_fd, indent=2)
+    return writer.write_json("dungeons.json", dungeon_details)
 
-
-def scan(input_dir, output_dir, character=False, player=False, dungeon=False, weekly=False, debug=False):
+def generate_scanned_output(writer, timestamp):
     '''
-    Scan all the characters and write the formatted data to <output_dir>
+    generate_scanned_output
     '''
+    return writer.write_json("scanned.json", {"timestamp": timestamp})
 
-    if debug:
-        logging.getLogger().setLevel(logging.DEBUG)
-    else:
-        logging.getLogger().setLevel(logging.INFO)
-
-    now = int(datetime.datetime.now(tz=timezone.utc).timestamp())
-
-    blizzapi = BlizzardApiRequest(BlizzOAuth(*get_api_access_file(input_dir),
-            os.path.join(input_dir, "auth_cache.json")))
-    raiderioapi = RaiderIoApiRequest()
+def generate_leaderboard_output(writer, leaderboards):
+    '''
+    generate_leaderboard_output
+    '''
+    return writer.write_json("leaderboards.json", leaderboards.output())
 
-    dungeon_default = get_dungeon_defaults(blizzapi)
+def generate_partial_output(writer, shard, roster, characters, groups, dungeon_default,
+        dungeon_details, timestamp):
+    '''
+    Write the partial result of a shard for `merge`
+    '''
+    return writer.write_json(shards.partial_name(shard), shards.partial_output(shard, roster,
+            characters, groups, dungeon_default, dungeon_details, timestamp))
 
-    if player or character:
-        characters = scan_completed_keystones(raiderioapi, get_toons(input_dir))
+def generate_stats_output(writer, metrics):
+    '''
+    Write the per-endpoint request metrics to stats.json
+    '''
+    return writer.write_json("stats.json", {"requests": metrics.snapshot()})
 
+def write_outputs(writer, aggregate, dungeon_details, timestamp, character=False, player=False,
+        dungeon=False, weekly=False, leaderboards=None):
+    '''
+    Write the requested output files and scanned.json
+    '''
     if player:
-        generate_player_output(output_dir, characters, dungeon_default)
+        generate_player_output(writer, aggregate)
 
     if character:
-        generate_character_output(output_dir, characters, dungeon_default)
+        generate_character_output(writer, aggregate)
 
     if dungeon:
-        dungeon_details = get_dungeon_details(blizzapi, dungeon_default)
-        generate_dungeon_output(output_dir, dungeon_details)
-    
+        generate_dungeon_output(writer, dungeon_details)
+
     if weekly:
-        characters = scan_weekly_keystones(raiderioapi, get_toons(input_dir))
-        generate_weekly_output(output_dir, characters, dungeon_default)
+        generate_weekly_output(writer, aggregate)
+
+    if leaderboards is not None:
+        generate_leaderboard_output(writer, leaderboards)
 
-    with open(os.path.join(output_dir, "scanned.json"), mode="w") as scanned_fd:
-        json.dump({"timestamp": now}, scanned_fd, indent=2)
+    generate_scanned_output(writer, timestamp)
+
+def scan(input_dir, output_dir, character=False, player=False, dungeon=False, weekly=False, debug=False,
+        jobs=1, cache_size=32, dungeon_ttl=DungeonCache.default_ttl, incremental=False,
+        stale_after=12 * 60 * 60, compress=(), manifest=False, resume=False, record=None,
+        replay=None, transport=None, metrics_file=None, region=BlizzardRegion.US,
+        source="raiderio", breaker_threshold=5, breaker_reset=30, shard=None, leaderboard=False,
+        leaderboard_size=Leaderboards.default_top):
+    '''
+    Scan all the characters and write the formatted data to <output_dir>
+
+    @param jobs Number of characters scanned concurrently
+    @param cache_size Size cap in MB of the game data cache in `<input_dir>/http_cache`,
+                      zero disables the cache
+    @param dungeon_ttl Seconds the dungeon details in `<input_dir>/dungeon_cache.json` are trusted
+    @param incremental Only fetch characters whose data in `<input_dir>/toons.sqlite`
+                       is older than `stale_after` seconds
+    @param compress Also write precompressed output files, any of "gz" and "br"
+    @param manifest Write `<output_dir>/manifest.json` with the output content hashes
+    @param resume Skip the characters an unfinished earlier scan already recorded in
+                  `<input_dir>/scan_journal.jsonl`
+    @param record Archive every raw API response of this scan (and toons.json) in this directory
+    @param replay Regenerate the outputs from an archive written by `record`, without
+                  any network calls
+    @param transport HttpTransport for all API calls, e.g. one pointed at a test server
+    @param metrics_file Also write the request metrics to this Prometheus textfile
+    @param region Region of characters toons.json lists without one, the dungeon
+                  data (the same in every region) is fetched from it
+    @param source Where character runs come from, one of `sources.source_choices`
+    @param breaker_threshold Consecutive failures that open the circuit of an upstream, the
+                             characters behind an open circuit get their last known data
+                             from `<input_dir>/toons.sqlite`, marked `"stale": true`
+    @param breaker_reset Seconds an open circuit waits before trying its upstream again
+    @param shard `(i, N)` to only scan the i-th of N roster partitions (see `shard.shard_of`)
+                 and write `<output_dir>/partial-<i>-of-<N>.json` for `merge` instead of
+                 the outputs
+    @param leaderboard Write leaderboards.json with the dungeon, score and weekly rankings
+    @param leaderboard_size Runs listed per dungeon leaderboard
+    '''
 
+    configure_logging(debug)
+
+    now = int(datetime.datetime.now(tz=timezone.utc).timestamp())
+
+    blizzapis, raiderioapi = get_api_clients(input_dir, jobs, cache_size, record, replay,
+            transport, breaker_threshold=breaker_threshold, breaker_reset=breaker_reset)
+    blizzapi = blizzapis.get(region)
+    run_source = get_run_source(source, raiderioapi, blizzapis)
+    rate_limiter = blizzapi.transport.rate_limiter
+    metrics = blizzapi.transport.metrics
+    http_cache = blizzapi.cache
+
+    # recordings must hold every response and replays must not depend on local state
+    archived = record is not None or replay is not None
+    if archived:
+        incremental = resume = False
+    toons_dir = replay if replay is not None else input_dir
+
+    # every scan keeps the last good data of its characters for outages,
+    # incremental scans also skip the characters with fresh data
+    state_store = None
+    if not archived:
+        state_store = ToonStateStore(os.path.join(input_dir, ToonStateStore.file_name))
+
+    # decide up front which raider.io data the requested outputs need
+    groups = []
+    if player or character or leaderboard:
+        groups.append("completed")
+    if weekly or leaderboard:
+        groups.append("weekly")
+
+    # the dungeon index and details are fetched while the characters are scanned
+    dungeon_cache = None if archived else DungeonCache(input_dir, ttl=dungeon_ttl)
+    journal = None
+    # shards sharing an input directory each keep their own journal
+    journal_name = ScanJournal.file_name
+    if shard is not None:
+        journal_name = "scan_journal-{}-of-{}.jsonl".format(*shard)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as dungeon_executor:
+            dungeon_future = dungeon_executor.submit(get_dungeon_data, blizzapi, dungeon,
+                    dungeon_cache, jobs)
+            roster = []
+            characters = []
+            if groups:
+                roster = get_toons(toons_dir, region)
+                scanned_toons = roster
+                if shard is not None:
+                    scanned_toons = shards.select_shard(roster, shard)
+                    logging.info("scanning shard {}/{}: {} of {} characters".format(
+                            shard[0], shard[1], len(scanned_toons), len(roster)))
+                if replay is None:
+                    journal = ScanJournal(os.path.join(input_dir, journal_name), groups,
+                            resume=resume, max_age=stale_after)
+                with profiling.span("characters"):
+                    characters = scan_keystones(run_source, scanned_toons, groups, jobs,
+                            state_store, stale_after, journal, incremental)
+            dungeon_default, dungeon_details = dungeon_future.result()
+
+        if shard is not None:
+            with profiling.span("output"):
+                generate_partial_output(OutputWriter(output_dir), shard, roster, characters, groups,
+                        dungeon_default, dungeon_details, now)
+                if metrics is not None and metrics_file is not None:
+                    metrics.write_prometheus(metrics_file)
+        else:
+            with profiling.span("aggregate"):
+                aggregate = KeystoneAggregate.build(dungeon_default, characters,
+                        completed=player or character, weekly=weekly)
+                leaderboards = None
+                if leaderboard:
+                    leaderboards = Leaderboards.build(dungeon_default, characters,
+                            top=leaderboard_size)
+            writer = OutputWriter(output_dir, compress=compress, manifest=manifest)
+
+            with profiling.span("output"):
+                write_outputs(writer, aggregate, dungeon_details, now, character=character,
+                        player=player, dungeon=dungeon, weekly=weekly, leaderboards=leaderboards)
+                if metrics is not None:
+                    generate_stats_output(writer, metrics)
+                    if metrics_file is not None:
+                        metrics.write_prometheus(metrics_file)
+        if journal is not None:
+            journal.finish()
+    finally:
+        # an unfinished epoch stays in the journal for --resume
+        if journal is not None:
+            journal.close()
+    if record is not None:
+        blizzapi.transport.recorder.add_file("toons.json", os.path.join(input_dir, "toons.json"))
+        blizzapi.transport.recorder.close()
+
+    if rate_limiter is not None:
+        for key, stats in rate_limiter.stats().items():
+            logging.info("rate limit {}: {}".format(key, stats))
+    if blizzapi.transport.breakers is not None:
+        for key, stats in blizzapi.transport.breakers.stats().items():
+            logging.info("circuit {}: {}".format(key, stats))
+    stale = [toon for toon in characters if toon.stale]
+    if stale:
+        logging.warning("{} of {} characters use their last known data".format(
+                len(stale), len(characters)))
+    if state_store is not None:
+        state_store.close()
+    if http_cache is not None:
+        http_cache.flush()
+        logging.info("http cache: {} hits, {} misses".format(http_cache.hits, http_cache.misses))
+    if blizzapi.transport.coalescer is not None:
+        logging.info("coalesced {} requests".format(blizzapi.transport.coalescer.hits))
+        blizzapi.transport.coalescer.clear()
+    if metrics is not None:
+        logging.info(metrics.summary())
+
+    return 0
+
+def merge(input_dir, output_dir, character=False, player=False, dungeon=False, weekly=False,
+        debug=False, compress=(), manifest=False, leaderboard=False,
+        leaderboard_size=Leaderboards.default_top):
+    '''
+    Combine the partial result files every shard of a `scan(shard=...)` wrote
+    to `<input_dir>` into the outputs in <output_dir>.  scanned.json holds the
+    time of the oldest shard.
+    '''
+    configure_logging(debug)
+
+    partials = shards.load_partials(input_dir)
+    groups = []
+    if player or character or leaderboard:
+        groups.append("completed")
+    if weekly or leaderboard:
+        groups.append("weekly")
+    for partial in partials:
+        missing = set(groups) - set(partial["groups"])
+        if missing:
+            raise shards.ShardError("shard {}/{} did not scan {}".format(
+                    partial["shard"][0], partial["shard"][1], ", ".join(sorted(missing))))
+    dungeon_details = partials[0]["dungeon_details"]
+    if dungeon and dungeon_details is None:
+        raise shards.ShardError("the shards were scanned without dungeon details")
+
+    characters = shards.merged_toons(partials, groups)
+    logging.info("merging {} characters from {} shards".format(len(characters), len(partials)))
+    aggregate = KeystoneAggregate.build(partials[0]["dungeons"], characters,
+            completed=player or character, weekly=weekly)
+    leaderboards = None
+    if leaderboard:
+        leaderboards = Leaderboards.build(partials[0]["dungeons"], characters,
+                top=leaderboard_size)
+    writer = OutputWriter(output_dir, compress=compress, manifest=manifest)
+    write_outputs(writer, aggregate, dungeon_details,
+            min(partial["timestamp"] for partial in partials), character=character,
+            player=player, dungeon=dungeon, weekly=weekly, leaderboards=leaderboards)
     return 0
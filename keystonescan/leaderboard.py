@@ -0,0 +1,177 @@
+'''
+keystonescan.leaderboard
+~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides the sorted ranking indexes behind leaderboards.json, kept
+up to date one character at a time so a refresh of a few characters does not
+sort the whole roster again
+'''
+
+import bisect
+
+class RankingIndex():
+    '''
+    Entries kept in descending order of their sort key with `bisect`.  Every
+    entry has an id, updating an id moves its entry to its new position.
+
+    Basic Usage::
+       >>> index = RankingIndex()
+       >>> index.update(("us", "realm", "toon"), (2750.5,), ["player", "Toon", "realm", 2750.5])
+       >>> index.top(10)
+       [["player", "Toon", "realm", 2750.5]]
+    '''
+    def __init__(self):
+        '''
+        RankingIndex constructor
+        '''
+        # ascending (negated sort key, entry id), so the best entry comes first
+        self._order = []
+        # entry id -> (position in _order, row)
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._order)
+
+    def update(self, entry_id, sort_key, row):
+        '''
+        Insert or move an entry.
+
+        @param sort_key Tuple of numbers, higher ranks first
+        @param row Data emitted for the entry
+        '''
+        self.remove(entry_id)
+        position = (tuple(-value for value in sort_key), entry_id)
+        bisect.insort(self._order, position)
+        self._entries[entry_id] = (position, row)
+
+    def remove(self, entry_id):
+        '''
+        Drop an entry, unknown ids are ignored.
+        '''
+        entry = self._entries.pop(entry_id, None)
+        if entry is not None:
+            del self._order[bisect.bisect_left(self._order, entry[0])]
+
+    def top(self, count=None):
+        '''
+        Rows of the `count` best entries, all of them without a count.
+        '''
+        return [self._entries[entry_id][1] for _, entry_id in self._order[:count]]
+
+class Leaderboards():
+    '''
+    Ranking indexes of the scanned characters: the top runs of every dungeon
+    by level and by rating, the season score ranking and the weekly vault
+    ranking.  Characters are added (or re-added after a refresh) one at a
+    time, which only moves their own entries.
+
+    Basic Usage::
+       >>> leaderboards = Leaderboards.build(dungeon_default, characters)
+       >>> leaderboards.add(refreshed_toon)
+       >>> leaderboards.output()
+       {"top": 10, "dungeons": [...], "score": [...], "weekly": [...]}
+    '''
+    default_top = 10
+    # positions of the keys rewarding the 1st, 2nd and 3rd great vault choice
+    vault_slots = (0, 3, 7)
+
+    def __init__(self, dungeon_default, top=default_top):
+        '''
+        @param top Number of runs kept per dungeon leaderboard
+        '''
+        self.dungeon_default = dungeon_default
+        self.top = top
+        self.dungeon_ids = {dungeon["name"]: dungeon["id"] for dungeon in dungeon_default}
+        self.by_level = {dungeon["id"]: RankingIndex() for dungeon in dungeon_default}
+        self.by_rating = {dungeon["id"]: RankingIndex() for dungeon in dungeon_default}
+        self.score = RankingIndex()
+        self.weekly = RankingIndex()
+
+    @classmethod
+    def build(cls, dungeon_default, characters, completed=True, weekly=True, top=default_top):
+        '''
+        Index a list of characters.
+        '''
+        leaderboards = cls(dungeon_default, top)
+        for character in characters:
+            leaderboards.add(character, completed, weekly)
+        return leaderboards
+
+    @staticmethod
+    def identity(character):
+        '''
+        Leading columns of every row
+        '''
+        return [character.player, str.capitalize(character.name), character.realm]
+
+    def add(self, character, completed=True, weekly=True):
+        '''
+        Index the completed and/or weekly keystones of a character, replacing
+        what was indexed for it before.
+        '''
+        slug = character.slug()
+        identity = self.identity(character)
+        if completed:
+            runs = {self.dungeon_ids.get(name): run for name, run in character.keystone.items()}
+            for dungeon_id in self.by_level:
+                run = runs.get(dungeon_id)
+                if run is None or not run["level"]:
+                    self.by_level[dungeon_id].remove(slug)
+                    self.by_rating[dungeon_id].remove(slug)
+                    continue
+                total = run["rating"].get("total", 0)
+                row = identity + [run["level"], total, run["duration"]]
+                self.by_level[dungeon_id].update(slug, (run["level"], total, -run["duration"]), row)
+                self.by_rating[dungeon_id].update(slug, (total, run["level"], -run["duration"]),
+                        row)
+            if character.keystone_score:
+                self.score.update(slug, (character.keystone_score,),
+                        identity + [character.keystone_score])
+            else:
+                self.score.remove(slug)
+        if weekly:
+            keys = character.weekly_completed_keys
+            runs = len([level for level in keys if level])
+            if runs:
+                rewards = [keys[slot] if slot < len(keys) else 0 for slot in self.vault_slots]
+                choices = len([level for level in rewards if level])
+                self.weekly.update(slug, tuple([choices] + rewards[::-1] + [runs]),
+                        identity + [choices] + rewards + [runs])
+            else:
+                self.weekly.remove(slug)
+
+    def remove(self, character):
+        '''
+        Drop every entry of a character.
+        '''
+        slug = character.slug()
+        for index in list(self.by_level.values()) + list(self.by_rating.values()):
+            index.remove(slug)
+        self.score.remove(slug)
+        self.weekly.remove(slug)
+
+    def output(self):
+        '''
+        Data for leaderboards.json
+        '''
+        # leaderboards.json contains rows instead of objects to stay small:
+        # {
+        #    "top": <runs per dungeon leaderboard>,
+        #    "dungeons": [{"id": <id>, "name": "...",
+        #                  "level": [[player, character, realm, level, rating, duration], ...],
+        #                  "rating": [<the same rows best rating first>]}, ...],
+        #    "score": [[player, character, realm, score], ...],
+        #    "weekly": [[player, character, realm, vault choices,
+        #                1st, 4th and 8th highest key, keys done], ...]
+        # }
+        return {
+            "top": self.top,
+            "dungeons": [{
+                "id": dungeon["id"],
+                "name": dungeon["name"],
+                "level": self.by_level[dungeon["id"]].top(self.top),
+                "rating": self.by_rating[dungeon["id"]].top(self.top),
+            } for dungeon in self.dungeon_default],
+            "score": self.score.top(),
+            "weekly": self.weekly.top(),
+        }
@@ -0,0 +1,195 @@
+'''
+keystonescan.metrics
+~~~~~~~~~~~~~~~~~~~~
+
+This module provides per-endpoint request metrics and their export as a
+json stats file or a Prometheus textfile
+'''
+
+import os
+import bisect
+import threading
+
+class EndpointStats():
+    '''
+    Counters of one endpoint
+    '''
+    def __init__(self, buckets):
+        '''
+        EndpointStats constructor
+        '''
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.status = {}
+        # latency histogram, one count per bucket plus one for +Inf
+        self.histogram = [0] * (len(buckets) + 1)
+
+    def as_dict(self, buckets):
+        '''
+        Counters as a json serializable dict, histogram buckets are cumulative.
+        '''
+        cumulative = []
+        total = 0
+        for count in self.histogram:
+            total += count
+            cumulative.append(total)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "bytes": self.bytes,
+            "seconds": round(self.seconds, 6),
+            "status": {str(status): count for status, count in sorted(self.status.items())},
+            "latency": {le: count for le, count
+                    in zip([str(bound) for bound in buckets] + ["+Inf"], cumulative)},
+        }
+
+class RequestMetrics():
+    '''
+    Thread safe request counters keyed by endpoint (e.g. "raiderio_character_profile").
+    Every attempt sent over the network is observed, so a retried call counts
+    once per attempt and its retries are counted separately.
+
+    Basic Usage::
+       >>> metrics = RequestMetrics()
+       >>> transport = HttpTransport(metrics=metrics)
+       >>> ...
+       >>> metrics.write_prometheus("/var/lib/node_exporter/keystonescan.prom")
+    '''
+    # upper bounds in seconds of the latency histogram buckets
+    default_buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=default_buckets):
+        '''
+        @param buckets Upper bounds in seconds of the latency histogram buckets
+        '''
+        self.buckets = tuple(sorted(buckets))
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, endpoint):
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = EndpointStats(self.buckets)
+        return stats
+
+    def observe(self, endpoint, status, seconds, size=0):
+        '''
+        Count one request attempt.
+
+        @param status HTTP status code, or None when no response arrived
+        @param seconds Time the attempt took
+        @param size Bytes of the response body
+        '''
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.bytes += size
+            stats.histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+            if status is None:
+                stats.errors += 1
+            else:
+                stats.status[status] = stats.status.get(status, 0) + 1
+
+    def retry(self, endpoint):
+        '''
+        Count a retried request.
+        '''
+        with self._lock:
+            self._endpoint(endpoint).retries += 1
+
+    def cache(self, endpoint, hit):
+        '''
+        Count a request answered from (hit) or stored to (miss) the http cache.
+        '''
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            if hit:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+
+    def snapshot(self):
+        '''
+        All counters as a json serializable dict keyed by endpoint.
+        '''
+        with self._lock:
+            return {endpoint: stats.as_dict(self.buckets)
+                    for endpoint, stats in sorted(self._endpoints.items())}
+
+    def summary(self):
+        '''
+        One line summary of all requests, e.g. for the end of a scan.
+        '''
+        snapshot = self.snapshot()
+        calls = sum(stats["calls"] for stats in snapshot.values())
+        line = "requests: {} calls, {} errors, {} retries, {} cache hits, {:.1f} KiB".format(
+                calls,
+                sum(stats["errors"] for stats in snapshot.values()),
+                sum(stats["retries"] for stats in snapshot.values()),
+                sum(stats["cache_hits"] for stats in snapshot.values()),
+                sum(stats["bytes"] for stats in snapshot.values()) / 1024)
+        if calls:
+            slowest, stats = max(snapshot.items(),
+                    key=lambda item: item[1]["seconds"] / max(1, item[1]["calls"]))
+            line += ", slowest {} at {:.3f}s avg".format(
+                    slowest, stats["seconds"] / max(1, stats["calls"]))
+        return line
+
+    def prometheus(self):
+        '''
+        All counters in the Prometheus text exposition format.
+        '''
+        snapshot = self.snapshot()
+        lines = []
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, value in samples:
+                lines.append("{}{{{}}} {}".format(name,
+                        ",".join('{}="{}"'.format(key, val) for key, val in labels), value))
+
+        metric("keystonescan_requests_total", "counter", "Requests sent by status code",
+                [((("endpoint", endpoint), ("status", status)), count)
+                    for endpoint, stats in snapshot.items()
+                    for status, count in stats["status"].items()])
+        metric("keystonescan_request_errors_total", "counter", "Requests without a response",
+                [((("endpoint", endpoint),), stats["errors"]) for endpoint, stats in snapshot.items()])
+        metric("keystonescan_request_retries_total", "counter", "Throttled requests retried",
+                [((("endpoint", endpoint),), stats["retries"]) for endpoint, stats in snapshot.items()])
+        metric("keystonescan_cache_hits_total", "counter", "Requests answered from the http cache",
+                [((("endpoint", endpoint),), stats["cache_hits"])
+                    for endpoint, stats in snapshot.items()])
+        metric("keystonescan_cache_misses_total", "counter", "Requests stored to the http cache",
+                [((("endpoint", endpoint),), stats["cache_misses"])
+                    for endpoint, stats in snapshot.items()])
+        metric("keystonescan_response_bytes_total", "counter", "Response body bytes received",
+                [((("endpoint", endpoint),), stats["bytes"]) for endpoint, stats in snapshot.items()])
+
+        name = "keystonescan_request_duration_seconds"
+        lines.append("# HELP {} Request latency".format(name))
+        lines.append("# TYPE {} histogram".format(name))
+        for endpoint, stats in snapshot.items():
+            for le, count in stats["latency"].items():
+                lines.append('{}_bucket{{endpoint="{}",le="{}"}} {}'.format(name, endpoint, le, count))
+            lines.append('{}_sum{{endpoint="{}"}} {}'.format(name, endpoint, stats["seconds"]))
+            lines.append('{}_count{{endpoint="{}"}} {}'.format(name, endpoint, stats["calls"]))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        '''
+        Write the Prometheus textfile for the node-exporter textfile collector,
+        through a rename so the collector never reads a partial file.
+        '''
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, mode="w") as prom_fd:
+            prom_fd.write(self.prometheus())
+        os.replace(tmp_path, path)
@@ -0,0 +1,156 @@
+'''
+keystonescan.output
+~~~~~~~~~~~~~~~~~~~
+
+This module provides the writer for the json files in the output directory
+'''
+
+import io
+import os
+import gzip
+import json
+import hashlib
+import logging
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def gzip_body(body):
+    '''
+    Gzip a body, a fixed mtime keeps the result identical for identical content.
+    '''
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=9, mtime=0) as gz_fd:
+        gz_fd.write(body)
+    return buf.getvalue()
+
+class OutputWriter():
+    '''
+    Write compact json output files.  A file is only replaced when its content
+    hash changed, and always through a temp file plus rename so readers never
+    see a partial file.  Optionally `.gz`/`.br` siblings and a manifest of
+    content hashes (for cache busting) are written next to it.  With a `store`
+    every file is also staged there for `publish` (see `server.OutputStore`).
+
+    Basic Usage::
+       >>> writer = OutputWriter("./output", compress=("gz",), manifest=True)
+       >>> writer.write_json("players.json", [...])
+       True
+       >>> writer.write_json("players.json", [...])
+       False
+    '''
+    manifest_name = "manifest.json"
+    # suffix of the precompressed variant of every supported compression
+    suffixes = {"gz": ".gz", "br": ".br"}
+
+    def __init__(self, output_dir, compress=(), manifest=False, store=None):
+        '''
+        @param compress Precompressed variants to write, any of "gz" and "br"
+        @param manifest Maintain `<output_dir>/manifest.json`
+        @param store Optional OutputStore serving the files from memory
+        '''
+        self.output_dir = output_dir
+        self.store = store
+        self.compress = list(compress or ())
+        self.manifest = manifest
+        if "br" in self.compress and brotli is None:
+            logging.warning("brotli is not installed, not writing .br files")
+            self.compress.remove("br")
+
+        # manifest.json contains:
+        # {
+        #    "<file name>": {
+        #        "sha256": "<hex digest of the content>",
+        #        "size": <size in bytes>,
+        #        "variants": [".gz", ".br"]
+        #    }
+        # }
+        self._manifest = {}
+        if manifest:
+            try:
+                with open(self._path(self.manifest_name), mode="r") as manifest_fd:
+                    self._manifest = json.load(manifest_fd)
+            except FileNotFoundError:
+                pass
+            except json.decoder.JSONDecodeError:
+                pass
+
+    def _path(self, name):
+        return os.path.join(self.output_dir, name)
+
+    def _write_atomic(self, name, body):
+        '''
+        Write through a temp file in the output dir and rename it into place.
+        '''
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, prefix=".{}.".format(name))
+        try:
+            with os.fdopen(fd, mode="wb") as tmp_fd:
+                tmp_fd.write(body)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self._path(name))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _current_digest(self, name):
+        '''
+        Hash of the file as it is on disk, trusting the manifest when present.
+        '''
+        if not os.path.exists(self._path(name)):
+            return None
+        if name in self._manifest:
+            return self._manifest[name]["sha256"]
+        with open(self._path(name), mode="rb") as current_fd:
+            return hashlib.sha256(current_fd.read()).hexdigest()
+
+    def variants(self, body):
+        '''
+        Yield `(suffix, compressed body)` for every configured compression.
+        '''
+        for encoding in self.compress:
+            if encoding == "gz":
+                yield (".gz", gzip_body(body))
+            elif encoding == "br":
+                yield (".br", brotli.compress(body))
+
+    def write_json(self, name, data):
+        '''
+        Serialize `data` to `<output_dir>/<name>`, returns False when the file
+        already held the same content.
+        '''
+        body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()
+        if self.store is not None:
+            self.store.stage(name, body, digest)
+        missing_variants = [encoding for encoding in self.compress
+                if not os.path.exists(self._path(name + self.suffixes[encoding]))]
+        # variants left by a run with other --compress options would go stale
+        stale_variants = [suffix for encoding, suffix in sorted(self.suffixes.items())
+                if encoding not in self.compress and os.path.exists(self._path(name + suffix))]
+        if digest == self._current_digest(name) and not missing_variants and not stale_variants:
+            logging.debug("{} unchanged".format(name))
+            return False
+
+        self._write_atomic(name, body)
+        variants = []
+        for suffix, compressed in self.variants(body):
+            self._write_atomic(name + suffix, compressed)
+            variants.append(suffix)
+        for suffix in stale_variants:
+            os.remove(self._path(name + suffix))
+
+        if self.manifest:
+            self._manifest[name] = {"sha256": digest, "size": len(body), "variants": variants}
+            self._write_atomic(self.manifest_name,
+                    json.dumps(self._manifest, indent=2, sort_keys=True).encode("utf-8"))
+        return True
+
+    def publish(self):
+        '''
+        Swap the files written since the last publish into the store at once.
+        '''
+        if self.store is not None:
+            self.store.swap()
@@ -0,0 +1,168 @@
+'''
+keystonescan.profiling
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides lightweight timing spans around the phases of a scan.
+Spans cost next to nothing until a `Profiler` is started, so the phases stay
+instrumented in normal runs.
+
+    with profiling.span("characters"):
+        ...
+'''
+
+import os
+import time
+import logging
+import cProfile
+import threading
+import contextlib
+
+class Profiler():
+    '''
+    Accumulate the time spent in named spans.  Spans nest per thread, a span
+    is reported under the path of its enclosing spans (e.g. "toon;fetch;http").
+
+    Basic Usage::
+       >>> profiler = profiling.start()
+       >>> with profiling.span("output"):
+       ...     ...
+       >>> profiling.stop()
+       >>> print(profiler.report())
+    '''
+    def __init__(self, clock=time.perf_counter):
+        '''
+        Profiler constructor
+        '''
+        self.clock = clock
+        # span path -> [calls, total seconds, seconds outside child spans, longest call]
+        self._spans = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def span(self, name):
+        '''
+        Time the enclosed block as `name`.
+        '''
+        stack = self._stack()
+        # [name, seconds spent in child spans]
+        frame = [name, 0.0]
+        stack.append(frame)
+        started = self.clock()
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - started
+            path = ";".join(entry[0] for entry in stack)
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            with self._lock:
+                stats = self._spans.setdefault(path, [0, 0.0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] += elapsed - frame[1]
+                stats[3] = max(stats[3], elapsed)
+
+    def spans(self):
+        '''
+        Span statistics keyed by path.
+        '''
+        with self._lock:
+            return {path: {"calls": stats[0], "total": stats[1], "self": stats[2], "max": stats[3]}
+                    for path, stats in self._spans.items()}
+
+    def report(self):
+        '''
+        Phase breakdown as a text table, spans of worker threads are summed
+        over all threads so they can exceed the wall time.
+        '''
+        spans = self.spans()
+        rows = [("span", "calls", "total s", "self s", "avg ms", "max ms")]
+        for path, stats in sorted(spans.items()):
+            depth = path.count(";")
+            rows.append(("  " * depth + path.rsplit(";", 1)[-1], str(stats["calls"]),
+                    "{:.3f}".format(stats["total"]), "{:.3f}".format(stats["self"]),
+                    "{:.2f}".format(stats["total"] * 1000 / stats["calls"]),
+                    "{:.2f}".format(stats["max"] * 1000)))
+        widths = [max(len(row[index]) for row in rows) for index in range(len(rows[0]))]
+        return "\n".join(row[0].ljust(widths[0]) + "  " + "  ".join(
+                cell.rjust(width) for cell, width in zip(row[1:], widths[1:])) for row in rows)
+
+    def folded(self):
+        '''
+        Self time of every span path in the folded stack format read by
+        flamegraph.pl, speedscope and friends (microseconds per line).
+        '''
+        return "".join("{} {}\n".format(path, int(stats["self"] * 1000000))
+                for path, stats in sorted(self.spans().items()))
+
+class _NullSpan():
+    '''
+    Span used while no profiler is running
+    '''
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_null_span = _NullSpan()
+_profiler = None
+
+def span(name):
+    '''
+    Time the enclosed block as `name` when a profiler is running.
+    '''
+    profiler = _profiler
+    if profiler is None:
+        return _null_span
+    return profiler.span(name)
+
+def start(clock=time.perf_counter):
+    '''
+    Start collecting spans, returns the running Profiler.
+    '''
+    global _profiler # pylint: disable=global-statement
+    _profiler = Profiler(clock)
+    return _profiler
+
+def stop():
+    '''
+    Stop collecting spans.
+    '''
+    global _profiler # pylint: disable=global-statement
+    _profiler = None
+
+@contextlib.contextmanager
+def profile(output_dir=None):
+    '''
+    Collect spans for the enclosed block and log the phase breakdown.  With an
+    `output_dir` the spans are also written to `spans.folded` and the block is
+    run under cProfile with its stats written to `cprofile.pstats`.  cProfile
+    only sees the calling thread, the spans cover the worker threads.
+    '''
+    profiler = start()
+    cprofiler = None
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+    try:
+        with profiler.span("total"):
+            yield profiler
+    finally:
+        if cprofiler is not None:
+            cprofiler.disable()
+        stop()
+        logging.info("profile:\n{}".format(profiler.report()))
+        if output_dir is not None:
+            cprofiler.dump_stats(os.path.join(output_dir, "cprofile.pstats"))
+            with open(os.path.join(output_dir, "spans.folded"), mode="w") as folded_fd:
+                folded_fd.write(profiler.folded())
@@ -1,4 +1,5 @@
-import requests
+from keystonescan import profiling
+from keystonescan.transport import default_transport
 
 class RaiderIoApiError(Exception):
     '''
@@ -15,89 +16,61 @@ class RaiderIoApiRequest:
     Wrapper for RaiderIO API calls.
     '''
 
-    def __init__(self):
+    def __init__(self, transport=None):
         '''
         constructor
+
+        @param transport HttpTransport used for all calls, defaults to a shared one
         '''
-        self.region = "us"
         self.url_base = "https://raider.io/api/v1"
+        self.transport = transport if transport is not None else default_transport()
 
-    def mythic_keystone_weekly_highest(self, toon, **kwargs):
+    def character_profile(self, toon, fields, **kwargs):
         '''
-        Request a characters weekly highest keystone runs.
+        Request any set of profile field groups for a character in one call,
+        in the region of the character.
+
+        @param fields Iterable of raider.io field names (e.g. "mythic_plus_best_runs:all")
         '''
         url = "{}/characters/profile".format(self.url_base)
-        params = {"region": kwargs.get("region", self.region),
+        params = {"region": kwargs.get("region", toon.region),
                   "realm": toon.realm,
                   "name": toon.name,
-                  "fields": "mythic_plus_weekly_highest_level_runs"}
+                  "fields": ",".join(fields)}
         headers = {
             "accept": "application/json",
         }
-        resp = requests.get(url, params=params, headers=headers)
+        resp = self.transport.get(url, params=params, headers=headers, limit_key="raiderio",
+                endpoint="raiderio_character_profile")
         if resp.status_code == 429:
             raise RaiderIoThrottlingError(resp.status_code, resp.reason, resp.text, url, params)
         if resp.status_code != 200:
             raise RaiderIoApiError(resp.status_code, resp.reason, resp.text, url, params)
 
-        return resp.json()
+        with profiling.span("json"):
+            return resp.json()
+
+    def mythic_keystone_weekly_highest(self, toon, **kwargs):
+        '''
+        Request a characters weekly highest keystone runs.
+        '''
+        return self.character_profile(toon, ["mythic_plus_weekly_highest_level_runs"], **kwargs)
 
     def mythic_plus_best_runs(self, toon, **kwargs):
         '''
         Request a characters best dungeon runs.
         '''
-        url = "{}/characters/profile".format(self.url_base)
-        params = {"region": kwargs.get("region", self.region),
-                  "realm": toon.realm,
-                  "name": toon.name,
-                  "fields": "mythic_plus_best_runs:all"}
-        headers = {
-            "accept": "application/json",
-        }
-        resp = requests.get(url, params=params, headers=headers)
-        if resp.status_code == 429:
-            raise RaiderIoThrottlingError(resp.status_code, resp.reason, resp.text, url, params)
-        if resp.status_code != 200:
-            raise RaiderIoApiError(resp.status_code, resp.reason, resp.text, url, params)
-
-        return resp.json()
+        return self.character_profile(toon, ["mythic_plus_best_runs:all"], **kwargs)
 
     def mythic_plus_alternate_runs(self, toon, **kwargs):
         '''
         Request a characters second best dungeon runs.
         '''
-        url = "{}/characters/profile".format(self.url_base)
-        params = {"region": kwargs.get("region", self.region),
-                  "realm": toon.realm,
-                  "name": toon.name,
-                  "fields": "mythic_plus_alternate_runs:all"}
-        headers = {
-            "accept": "application/json",
-        }
-        resp = requests.get(url, params=params, headers=headers)
-        if resp.status_code == 429:
-            raise RaiderIoThrottlingError(resp.status_code, resp.reason, resp.text, url, params)
-        if resp.status_code != 200:
-            raise RaiderIoApiError(resp.status_code, resp.reason, resp.text, url, params)
-
-        return resp.json()
+        return self.character_profile(toon, ["mythic_plus_alternate_runs:all"], **kwargs)
 
     def mythic_plus_scores_by_season(self, toon, season="current", **kwargs):
         '''
         Request a characters season score.
         '''
-        url = "{}/characters/profile".format(self.url_base)
-        params = {"region": kwargs.get("region", self.region),
-                  "realm": toon.realm,
-                  "name": toon.name,
-                  "fields": "mythic_plus_scores_by_season:{}".format(season)}
-        headers = {
-            "accept": "application/json",
-        }
-        resp = requests.get(url, params=params, headers=headers)
-        if resp.status_code == 429:
-            raise RaiderIoThrottlingError(resp.status_code, resp.reason, resp.text, url, params)
-        if resp.status_code != 200:
-            raise RaiderIoApiError(resp.status_code, resp.reason, resp.text, url, params)
-
-        return resp.json()
+        return self.character_profile(toon,
+                ["mythic_plus_scores_by_season:{}".format(season)], **kwargs)
@@ -0,0 +1,167 @@
+'''
+keystonescan.ratelimit
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides per-upstream rate limiting for API calls
+'''
+
+import time
+import email.utils
+import datetime
+from datetime import timezone
+import threading
+
+class TokenBucket():
+    '''
+    Token bucket that adapts its rate to the upstream.  Every 429 halves the
+    rate (down to `min_rate`) and each successful call adds a little back until
+    the configured rate is reached again.  A `Retry-After` blocks the bucket
+    until that time has passed.
+    '''
+    def __init__(self, rate, capacity=None, min_rate=None, clock=time.monotonic, sleep=time.sleep):
+        '''
+        @param rate Requests per second allowed when the upstream is healthy
+        @param capacity Largest burst, defaults to one second worth of requests
+        @param min_rate Lowest rate a series of 429s can push us to
+        '''
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = float(min_rate) if min_rate is not None else self.max_rate / 16
+        self.capacity = float(capacity) if capacity is not None else max(1.0, self.max_rate)
+
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+        self.acquired = 0
+        self.throttled = 0
+        self.retries = 0
+        self.waited = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        '''
+        Block until a request may be sent.
+        '''
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    self.acquired += 1
+                    return
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+                self.waited += wait
+            self._sleep(wait)
+
+    def on_success(self):
+        '''
+        Record a successful call and slowly restore the rate.
+        '''
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def on_throttled(self, retry_after=None):
+        '''
+        Record a 429: halve the rate and honor the upstream `Retry-After`.
+        '''
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, self._clock() + retry_after)
+
+    def on_retry(self):
+        '''
+        Record that a throttled call is being retried.
+        '''
+        with self._lock:
+            self.retries += 1
+
+    def stats(self):
+        '''
+        Counters for this bucket.
+        '''
+        with self._lock:
+            return {
+                "rate": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "acquired": self.acquired,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "waited": round(self.waited, 3),
+            }
+
+class RateLimiter():
+    '''
+    Collection of token buckets, one per upstream budget.
+
+    Basic Usage::
+       >>> limiter = RateLimiter({"raiderio": 5})
+       >>> limiter.bucket("raiderio").acquire()
+       >>> limiter.stats()
+       {"raiderio": {"rate": 5.0, "acquired": 1, ...}}
+    '''
+    # requests per second for each budget, blizzard allows 100/s per client
+    # and raider.io asks for a few requests per second from public clients
+    default_rates = {
+        "raiderio": 5,
+        "blizzard": 100,
+        "oauth": 10,
+    }
+
+    def __init__(self, rates=None, clock=time.monotonic, sleep=time.sleep):
+        '''
+        @param rates Dict of budget name to requests per second, budgets named
+                     "<prefix>-<suffix>" fall back to the rate of "<prefix>"
+        '''
+        self.rates = dict(self.default_rates)
+        self.rates.update(rates or {})
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        '''
+        Return the bucket for a budget, creating it on first use.
+        '''
+        with self._lock:
+            if key not in self._buckets:
+                rate = self.rates.get(key, self.rates.get(key.split("-")[0], 1))
+                self._buckets[key] = TokenBucket(rate, clock=self._clock, sleep=self._sleep)
+            return self._buckets[key]
+
+    def stats(self):
+        '''
+        Counters for every budget used so far.
+        '''
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {key: bucket.stats() for key, bucket in sorted(buckets.items())}
+
+def parse_retry_after(value):
+    '''
+    Convert a `Retry-After` header (seconds or an HTTP date) to seconds.
+    '''
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(tz=timezone.utc)).total_seconds())
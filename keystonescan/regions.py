@@ -0,0 +1,54 @@
+'''
+keystonescan.regions
+~~~~~~~~~~~~~~~~~~~~
+
+This module provides the per-region Blizzard API clients of a multi-region scan
+'''
+
+import threading
+
+from keystonescan.blizzlocale import BlizzardLocale
+from keystonescan.blizzrequest import BlizzardApiRequest
+
+class BlizzardRegionClients():
+    '''
+    One `BlizzardApiRequest` per region, each with its own OAuth endpoint,
+    namespaces and rate limit budget (`blizzard-<region>`).  All regions share
+    the transport and the game data cache, clients are created on first use
+    so a region without characters never asks for a token.
+
+    Basic Usage::
+       >>> clients = BlizzardRegionClients(lambda region: BlizzOAuth(..., region=region),
+       ...         transport=transport)
+       >>> clients.get("eu").profile_ns
+       "profile-eu"
+    '''
+    def __init__(self, oauth_factory, transport=None, cache=None, locale=BlizzardLocale.en_US):
+        '''
+        @param oauth_factory Called with a region, returns the oauth object of its client
+        '''
+        self.oauth_factory = oauth_factory
+        self.transport = transport
+        self.cache = cache
+        self.locale = locale
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, region):
+        '''
+        The client of a region
+        '''
+        with self._lock:
+            client = self._clients.get(region)
+            if client is None:
+                client = self._clients[region] = BlizzardApiRequest(self.oauth_factory(region),
+                        region=region, locale=self.locale, transport=self.transport,
+                        cache=self.cache)
+            return client
+
+    def regions(self):
+        '''
+        Regions a client was created for
+        '''
+        with self._lock:
+            return sorted(self._clients)
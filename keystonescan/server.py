@@ -0,0 +1,307 @@
+'''
+keystonescan.server
+~~~~~~~~~~~~~~~~~~~
+
+This module provides the optional built-in HTTP server answering the output
+files (players.json, characters.json, ...) from memory, so the guild page can
+read them without a web server going back to the disk for every request.
+'''
+
+import os
+import glob
+import asyncio
+import hashlib
+import logging
+import threading
+from email.utils import formatdate
+
+from keystonescan.output import gzip_body
+
+class Document():
+    '''
+    One output file as served: the body and its gzip variant, each with its
+    own strong ETag since a strong validator must differ between codings
+    '''
+    def __init__(self, body, digest=None, modified=None):
+        '''
+        @param digest sha256 hex digest of the body when the caller already has it
+        @param modified Unix time of the content, defaults to now
+        '''
+        self.body = body
+        self.gzip = gzip_body(body)
+        digest = digest or hashlib.sha256(body).hexdigest()
+        self.etag = '"{}"'.format(digest[:32])
+        self.gzip_etag = '"{}-gz"'.format(digest[:32])
+        self.modified = formatdate(modified, usegmt=True)
+
+class OutputStore():
+    '''
+    Thread safe in-memory copy of the output files.  Writers stage files as
+    they are written, `swap` publishes all staged files at once so readers
+    never see the players.json of one scan next to the weekly.json of another.
+
+    Basic Usage::
+       >>> store = OutputStore()
+       >>> writer = OutputWriter("./output", store=store)
+       >>> keystonescan.write_outputs(writer, ...)
+       >>> writer.publish()
+       >>> store.get("players.json").etag
+       '"3f7c..."'
+    '''
+    def __init__(self):
+        '''
+        OutputStore constructor
+        '''
+        self._documents = {}
+        self._staged = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name, body, digest=None):
+        '''
+        Prepare a file for the next swap, unchanged files keep their document.
+        '''
+        with self._lock:
+            current = self._documents.get(name)
+            if current is not None and current.body == body:
+                self._staged.pop(name, None)
+                return
+        document = Document(body, digest)
+        with self._lock:
+            self._staged[name] = document
+
+    def swap(self):
+        '''
+        Publish every staged file.
+        '''
+        with self._lock:
+            if not self._staged:
+                return
+            documents = dict(self._documents)
+            documents.update(self._staged)
+            self._staged = {}
+            self._documents = documents
+        logging.debug("serving {}".format(", ".join(sorted(documents))))
+
+    def get(self, name):
+        '''
+        The published document of a file or None.
+        '''
+        return self._documents.get(name)
+
+    def load(self, output_dir, names=("players.json", "characters.json", "dungeons.json",
+            "weekly.json", "leaderboards.json", "scanned.json", "stats.json")):
+        '''
+        Publish the output files an earlier run left in `output_dir`, so the
+        server has data before the first refresh finishes.
+        '''
+        for path in sorted(glob.glob(os.path.join(output_dir, "*.json"))):
+            name = os.path.basename(path)
+            if name in names:
+                with open(path, mode="rb") as output_fd:
+                    body = output_fd.read()
+                document = Document(body, modified=os.path.getmtime(path))
+                with self._lock:
+                    self._staged[name] = document
+        self.swap()
+
+def accepts_gzip(accept_encoding):
+    '''
+    True when an Accept-Encoding header allows gzip.
+    '''
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        quality = 1.0
+        key, _, value = params.partition("=")
+        if key.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[name.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+def etag_matches(if_none_match, etag):
+    '''
+    True when an If-None-Match header lists `etag` (weak comparison as RFC 7232 asks).
+    '''
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+class OutputServer():
+    '''
+    Minimal asyncio HTTP/1.1 server for the documents of an `OutputStore`.
+    GET and HEAD of `/<name>` answer with a strong ETag, gzip when accepted
+    and a 304 when `If-None-Match` matches; connections are kept alive.  The
+    event loop runs in its own thread next to the scanning threads.
+
+    Basic Usage::
+       >>> server = OutputServer(store, "127.0.0.1", 8080)
+       >>> server.start()
+       >>> ...
+       >>> server.stop()
+    '''
+    # largest request head accepted, the server only answers small GETs
+    max_header_bytes = 16 * 1024
+    # seconds an idle keep-alive connection is held open
+    idle_timeout = 30
+
+    def __init__(self, store, host="127.0.0.1", port=8080):
+        '''
+        @param port TCP port to listen on, 0 picks a free one (see `port` after `start`)
+        '''
+        self.store = store
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        '''
+        Listen and serve in a background thread.
+        '''
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        errors = []
+        def run():
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._server = self._loop.run_until_complete(
+                        asyncio.start_server(self._handle, self.host, self.port))
+            except OSError as err:
+                errors.append(err)
+                started.set()
+                return
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._shutdown())
+            self._loop.close()
+        self._thread = threading.Thread(target=run, name="keystonescan-http", daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+        logging.info("serving outputs on http://{}:{}/".format(self.host, self.port))
+
+    def stop(self):
+        '''
+        Stop listening, drop open connections and wait for the server thread.
+        '''
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    async def _shutdown(self):
+        '''
+        Close the listening socket and cancel the connection handlers, so
+        they close their connections while the loop still runs.
+        '''
+        self._server.close()
+        all_tasks = getattr(asyncio, "all_tasks", None) or asyncio.Task.all_tasks
+        current_task = getattr(asyncio, "current_task", None) or asyncio.Task.current_task
+        tasks = [task for task in all_tasks(self._loop) if task is not current_task(self._loop)]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def respond(self, method, path, headers):
+        '''
+        Build `(status, reason, headers, body)` for a request.
+        '''
+        if method not in ("GET", "HEAD"):
+            return (405, "Method Not Allowed", [("Allow", "GET, HEAD")], b"")
+        document = self.store.get(path.split("?", 1)[0].lstrip("/"))
+        if document is None:
+            return (404, "Not Found", [], b"")
+
+        gzipped = accepts_gzip(headers.get("accept-encoding", ""))
+        etag = document.gzip_etag if gzipped else document.etag
+        response_headers = [
+            ("ETag", etag),
+            ("Last-Modified", document.modified),
+            ("Cache-Control", "no-cache"),
+            ("Vary", "Accept-Encoding"),
+        ]
+        if etag_matches(headers.get("if-none-match", ""), etag):
+            return (304, "Not Modified", response_headers, b"")
+        body = document.body
+        if gzipped:
+            body = document.gzip
+            response_headers.append(("Content-Encoding", "gzip"))
+        response_headers.append(("Content-Type", "application/json"))
+        return (200, "OK", response_headers, body)
+
+    async def _read_request(self, reader):
+        '''
+        Read a request head, returns `(method, path, version, headers)` or
+        None when the client went away.
+        '''
+        line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+        if not line:
+            return None
+        size = len(line)
+        method, path, version = line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+            size += len(line)
+            if size > self.max_header_bytes:
+                raise ValueError("request head too large")
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return (method, path, version, headers)
+
+    async def _handle(self, reader, writer):
+        '''
+        Serve the requests of one connection.
+        '''
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, version, headers = request
+                self.requests += 1
+                status, reason, response_headers, body = self.respond(method, path, headers)
+                keep_alive = (version == "HTTP/1.1"
+                        and headers.get("connection", "").lower() != "close")
+                head = ["HTTP/1.1 {} {}".format(status, reason)]
+                head.extend("{}: {}".format(name, value) for name, value in response_headers)
+                if status != 304:
+                    head.append("Content-Length: {}".format(len(body)))
+                head.append("Connection: {}".format("keep-alive" if keep_alive else "close"))
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # stop() cancels handlers waiting on idle keep-alive connections
+            pass
+        finally:
+            writer.close()
+
+def parse_listen(value):
+    '''
+    Parse "HOST:PORT" (or just "PORT") into `(host, port)`.
+    '''
+    host, _, port = value.rpartition(":")
+    return (host or "127.0.0.1", int(port))
@@ -0,0 +1,141 @@
+'''
+keystonescan.shard
+~~~~~~~~~~~~~~~~~~
+
+This module provides the partitioning of a roster over several scan processes
+and the partial result files they write for `keystonescan merge`
+'''
+
+import os
+import json
+import glob
+import zlib
+import hashlib
+
+from keystonescan.toons import Toon
+
+class ShardError(Exception):
+    '''
+    Exception with a --shard value or a set of partial result files
+    '''
+
+def parse_shard(value):
+    '''
+    Parse a "i/N" shard (1 <= i <= N) into `(i, N)`.
+    '''
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError as err:
+        raise ShardError("shard must look like i/N", value) from err
+    if not 1 <= index <= count:
+        raise ShardError("shard index must be between 1 and N", value)
+    return (index, count)
+
+def shard_of(toon, count):
+    '''
+    Shard (1 to `count`) a toon belongs to, stable across processes, hosts
+    and roster changes since it only depends on `Toon.slug()`.
+    '''
+    return zlib.crc32("/".join(toon.slug()).encode("utf-8")) % count + 1
+
+def select_shard(toons, shard):
+    '''
+    Toons of the `(i, N)` shard, in roster order.
+    '''
+    index, count = shard
+    return [toon for toon in toons if shard_of(toon, count) == index]
+
+def roster_digest(roster):
+    '''
+    Digest of the characters of a roster, shards only merge when they all
+    split the same roster.
+    '''
+    slugs = sorted("/".join(toon.slug()) for toon in roster)
+    return hashlib.sha256("\n".join(slugs).encode("utf-8")).hexdigest()
+
+def partial_name(shard):
+    '''
+    File name of the partial result of a shard
+    '''
+    return "partial-{}-of-{}.json".format(*shard)
+
+def partial_output(shard, roster, characters, groups, dungeon_default, dungeon_details, timestamp):
+    '''
+    Data for the partial result file of a shard.
+
+    @param roster Full roster, positions let `merge` restore the roster order
+    @param characters Scanned toons of the shard
+    '''
+    # partial-<i>-of-<N>.json contains:
+    # {
+    #    "shard": [<i>, <N>],
+    #    "roster": "<roster_digest of the full roster>",
+    #    "timestamp": <scan time>,
+    #    "groups": ["completed", "weekly"],
+    #    "dungeons": <dungeon defaults>,
+    #    "dungeon_details": <dungeons.json data or null>,
+    #    "toons": [{"index": <roster position>, "region": "...", "realm": "...",
+    #               "name": "...", "players": ["..."], "stale": false,
+    #               "state": {"<group>": <Toon.get_state(group)>}}, ...]
+    # }
+    positions = {toon.slug(): index for index, toon in enumerate(roster)}
+    return {
+        "shard": list(shard),
+        "roster": roster_digest(roster),
+        "timestamp": timestamp,
+        "groups": list(groups),
+        "dungeons": dungeon_default,
+        "dungeon_details": dungeon_details,
+        "toons": [{
+            "index": positions[toon.slug()],
+            "region": toon.region,
+            "realm": toon.realm,
+            "name": toon.name,
+            "players": toon.players,
+            "stale": toon.stale,
+            "state": {group: toon.get_state(group) for group in groups},
+        } for toon in characters],
+    }
+
+def load_partials(input_dir):
+    '''
+    Read every `<input_dir>/partial-*.json`, returns them ordered by shard.
+    Raises ShardError unless they are exactly the shards 1 to N of one split
+    of the same roster.
+    '''
+    partials = []
+    for path in sorted(glob.glob(os.path.join(input_dir, "partial-*-of-*.json"))):
+        with open(path, mode="r") as partial_fd:
+            partials.append(json.load(partial_fd))
+    if not partials:
+        raise ShardError("no partial result files", input_dir)
+
+    counts = {partial["shard"][1] for partial in partials}
+    if len(counts) != 1:
+        raise ShardError("partial result files of different splits", sorted(counts))
+    count = counts.pop()
+    partials.sort(key=lambda partial: partial["shard"][0])
+    found = [partial["shard"][0] for partial in partials]
+    if found != list(range(1, count + 1)):
+        raise ShardError("partial result files must be shards 1 to {}".format(count), found)
+    rosters = {partial.get("roster") for partial in partials}
+    if len(rosters) != 1:
+        raise ShardError("partial result files were scanned from different toons.json",
+                {partial["shard"][0]: partial.get("roster") for partial in partials})
+    return partials
+
+def merged_toons(partials, groups):
+    '''
+    Rebuild the toons of all partials in roster order.
+    '''
+    entries = sorted((entry for partial in partials for entry in partial["toons"]),
+            key=lambda entry: entry["index"])
+    toons = []
+    for entry in entries:
+        toon = Toon(entry["players"][0], entry["realm"], entry["name"], entry["region"])
+        toon.players = list(entry["players"])
+        toon.stale = entry["stale"]
+        for group in groups:
+            toon.set_state(group, entry["state"][group])
+        toons.append(toon)
+    return toons
@@ -0,0 +1,219 @@
+'''
+keystonescan.sources
+~~~~~~~~~~~~~~~~~~~~
+
+This module provides the sources of character run data.  Every source answers
+`character_profile(toon, fields)` in the shape of a raider.io profile, so
+`Toon.get_keystone_profile` parses the data the same way whichever upstream
+it came from.
+'''
+
+import time
+import logging
+import threading
+
+import requests
+
+from keystonescan.blizzrequest import BlizzardApiError, BlizzardThrottlingError
+from keystonescan.raideriorequest import RaiderIoApiError, RaiderIoThrottlingError
+
+# raider.io field groups a source can be asked for
+BEST_RUNS = "mythic_plus_best_runs"
+ALTERNATE_RUNS = "mythic_plus_alternate_runs"
+SEASON_SCORES = "mythic_plus_scores_by_season"
+WEEKLY_RUNS = "mythic_plus_weekly_highest_level_runs"
+
+def field_groups(fields):
+    '''
+    Field group names without their raider.io modifiers (e.g. ":all")
+    '''
+    return {field.split(":")[0] for field in fields}
+
+class RaiderIoSource():
+    '''
+    Run data straight from the raider.io character profile
+    '''
+    name = "raiderio"
+
+    def __init__(self, raiderioapi):
+        '''
+        RaiderIoSource constructor
+        '''
+        self.raiderioapi = raiderioapi
+
+    def character_profile(self, toon, fields, **kwargs):
+        '''
+        Request the profile field groups of a character.
+        '''
+        return self.raiderioapi.character_profile(toon, fields, **kwargs)
+
+class BlizzardSource():
+    '''
+    Run data from the Blizzard mythic keystone profile of the character's
+    region, normalized to the raider.io profile shape.  The weekly runs cost a
+    second request and only hold the best run per dungeon of the current period.
+    '''
+    name = "blizzard"
+    # affixes raider.io splits the best and alternate runs by
+    season_affixes = ("tyrannical", "fortified")
+
+    def __init__(self, blizzapis):
+        '''
+        @param blizzapis BlizzardRegionClients
+        '''
+        self.blizzapis = blizzapis
+        self._seasons = {}
+        self._lock = threading.Lock()
+
+    def current_season(self, blizzapi):
+        '''
+        Current season id of a region, asked for once.
+        '''
+        with self._lock:
+            season = self._seasons.get(blizzapi.region)
+        if season is None:
+            season = blizzapi.mythic_keystone_season_index()["current_season"]["id"]
+            with self._lock:
+                self._seasons[blizzapi.region] = season
+        return season
+
+    def character_profile(self, toon, fields, **kwargs):
+        '''
+        Build the requested raider.io field groups from the Blizzard profile.
+        '''
+        blizzapi = self.blizzapis.get(toon.region)
+        groups = field_groups(fields)
+        profile = {}
+        if groups & {BEST_RUNS, ALTERNATE_RUNS, SEASON_SCORES}:
+            detail = blizzapi.mythic_keystone_profile_detail(toon, self.current_season(blizzapi),
+                    **kwargs)
+            profile.update(self.normalize_season(detail))
+        if WEEKLY_RUNS in groups:
+            index = blizzapi.mythic_keystone_profile_index(toon, **kwargs)
+            profile.update(self.normalize_weekly(index))
+        return profile
+
+    @classmethod
+    def normalize_run(cls, run):
+        '''
+        Blizzard best run as a raider.io run record.
+        '''
+        affixes = [affix["name"] for affix in run.get("keystone_affixes", [])
+                if affix["name"].lower() in cls.season_affixes]
+        return {
+            "dungeon": run["dungeon"]["name"],
+            "mythic_level": run["keystone_level"],
+            "clear_time_ms": run["duration"],
+            "score": run.get("mythic_rating", {}).get("rating", 0),
+            "affixes": [{"name": affixes[0] if affixes else cls.season_affixes[0]}],
+        }
+
+    @classmethod
+    def normalize_season(cls, detail):
+        '''
+        Split the season best runs into raider.io best and alternate runs, the
+        better rated run of each dungeon is its best run.
+        '''
+        dungeons = {}
+        for run in map(cls.normalize_run, detail.get("best_runs", [])):
+            dungeons.setdefault(run["dungeon"], []).append(run)
+
+        best = []
+        alternate = []
+        for runs in dungeons.values():
+            runs.sort(key=lambda run: (run["score"], run["mythic_level"]), reverse=True)
+            best.append(runs[0])
+            alternate.extend([run for run in runs if run["affixes"] != runs[0]["affixes"]][:1])
+        return {
+            BEST_RUNS: best,
+            ALTERNATE_RUNS: alternate,
+            SEASON_SCORES: [{"scores": {"all": detail.get("mythic_rating", {}).get("rating", 0)}}],
+        }
+
+    @staticmethod
+    def normalize_weekly(index):
+        '''
+        Runs of the current weekly period as raider.io weekly runs.
+        '''
+        runs = index.get("current_period", {}).get("best_runs", [])
+        return {WEEKLY_RUNS: [{"mythic_level": run["keystone_level"]} for run in runs]}
+
+def source_unavailable(err):
+    '''
+    True for errors that say the upstream is throttled or down rather than
+    that the character is unknown.
+    '''
+    if isinstance(err, (RaiderIoThrottlingError, BlizzardThrottlingError, BlizzardApiError,
+            requests.RequestException)):
+        return True
+    if isinstance(err, RaiderIoApiError):
+        return not 400 <= err.args[0] < 500
+    return False
+
+class FailoverSource():
+    '''
+    Ask the sources in order and move on to the next one when a source is
+    throttled or down, a failed source is skipped for `cooldown` seconds.
+    With `balance` every request starts at the next source in turn, spreading
+    the load over the rate limit budgets of all sources.
+
+    Basic Usage::
+       >>> source = FailoverSource([RaiderIoSource(raiderioapi), BlizzardSource(blizzapis)])
+       >>> toon.get_keystone_profile(source)
+    '''
+    def __init__(self, sources, balance=False, cooldown=60, clock=time.monotonic):
+        '''
+        FailoverSource constructor
+        '''
+        self.sources = list(sources)
+        self.balance = balance
+        self.cooldown = cooldown
+        self.clock = clock
+        self._down_until = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _order(self):
+        '''
+        Sources to try for the next request, the ones in cooldown last.
+        '''
+        with self._lock:
+            start = self._next
+            if self.balance:
+                self._next = (self._next + 1) % len(self.sources)
+            now = self.clock()
+            order = self.sources[start:] + self.sources[:start]
+            return sorted(order, key=lambda source: self._down_until.get(source.name, 0) > now)
+
+    def character_profile(self, toon, fields, **kwargs):
+        '''
+        Request the profile field groups of a character from the first source that answers.
+        '''
+        order = self._order()
+        for attempt, source in enumerate(order):
+            try:
+                return source.character_profile(toon, fields, **kwargs)
+            except Exception as err: # pylint: disable=broad-except
+                if not source_unavailable(err) or attempt == len(order) - 1:
+                    raise
+                logging.warning("{} unavailable for {}, trying {}: {}".format(
+                        source.name, toon, order[attempt + 1].name, err))
+                with self._lock:
+                    self._down_until[source.name] = self.clock() + self.cooldown
+        raise ValueError("FailoverSource without sources")
+
+# --source choices
+source_choices = ("raiderio", "blizzard", "failover", "balance")
+
+def get_run_source(source, raiderioapi, blizzapis):
+    '''
+    Build the run data source selected by name, see `source_choices`.
+    '''
+    if source == "raiderio":
+        return RaiderIoSource(raiderioapi)
+    if source == "blizzard":
+        return BlizzardSource(blizzapis)
+    if source in ("failover", "balance"):
+        return FailoverSource([RaiderIoSource(raiderioapi), BlizzardSource(blizzapis)],
+                balance=source == "balance")
+    raise ValueError("unknown run data source", source)
@@ -0,0 +1,101 @@
+'''
+keystonescan.statestore
+~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides the persistent per-character state used by incremental scans
+'''
+
+import json
+import time
+import sqlite3
+import threading
+
+from keystonescan.blizzregion import last_weekly_reset
+
+class ToonStateStore():
+    '''
+    SQLite store holding the last fetched data of every character, one row per
+    character and data group ("completed" or "weekly", see `Toon.state_attributes`).
+
+    Basic Usage::
+       >>> store = ToonStateStore("./toons.sqlite")
+       >>> store.save(toon, "completed", now)
+       >>> store.restore(toon, "completed", fresh_after=now - 3600)
+       True
+    '''
+    file_name = "toons.sqlite"
+
+    def __init__(self, path):
+        '''
+        @param path SQLite database file, created when missing
+        '''
+        self.path = path
+        self._lock = threading.Lock()
+        # worker threads save their toons as they finish, access is serialized by _lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS toon_state ("
+                " slug TEXT NOT NULL,"
+                " data_group TEXT NOT NULL,"
+                " state TEXT NOT NULL,"
+                " fetched_at INTEGER NOT NULL,"
+                " PRIMARY KEY (slug, data_group))")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def key(toon):
+        '''
+        Row key for a toon
+        '''
+        return "/".join(toon.slug())
+
+    def save(self, toon, group, fetched_at):
+        '''
+        Store the data group of a freshly fetched toon.
+        '''
+        state = json.dumps(toon.get_state(group))
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO toon_state (slug, data_group, state, fetched_at)"
+                " VALUES (?, ?, ?, ?)", (self.key(toon), group, state, fetched_at))
+
+    def load(self, toon, group):
+        '''
+        Return `(state, fetched_at)` for a toon or `(None, None)`.
+        '''
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state, fetched_at FROM toon_state WHERE slug = ? AND data_group = ?",
+                (self.key(toon), group)).fetchone()
+        if row is None:
+            return (None, None)
+        return (json.loads(row[0]), row[1])
+
+    def restore(self, toon, group, fresh_after=None, now=None):
+        '''
+        Fill a toon from the store.  Returns False when there is no stored data
+        or it was fetched before `fresh_after`.  Weekly data fetched before the
+        last weekly reset of the toon's region (at `now`) belongs to another
+        week and is never restored.
+        '''
+        state, fetched_at = self.load(toon, group)
+        if state is None or (fresh_after is not None and fetched_at < fresh_after):
+            return False
+        if group == "weekly" and fetched_at < last_weekly_reset(
+                now if now is not None else time.time(), toon.region):
+            return False
+        toon.set_state(group, state)
+        return True
+
+    def close(self):
+        '''
+        Close the database.
+        '''
+        with self._lock:
+            self._db.close()
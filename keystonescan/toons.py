@@ -6,20 +6,43 @@ import os
 import json
 import logging
 
+from keystonescan import profiling
+from keystonescan.blizzregion import BlizzardRegion
+
 class Toon():
     '''
     Toon docstring
     '''
-    def __init__(self, player, realm, name):
+    # raider.io profile field groups behind the completed and weekly keystone data
+    completed_fields = (
+        "mythic_plus_best_runs:all",
+        "mythic_plus_alternate_runs:all",
+        "mythic_plus_scores_by_season:current",
+    )
+    weekly_fields = (
+        "mythic_plus_weekly_highest_level_runs",
+    )
+    # toon attributes filled in by each data group
+    state_attributes = {
+        "completed": ("keystone", "keystone_score"),
+        "weekly": ("weekly_completed_keys",),
+    }
+
+    def __init__(self, player, realm, name, region=BlizzardRegion.US):
         '''
         Toon constructor
         '''
         self.player = player
+        # every player the character is listed under, `player` is the first one
+        self.players = [player]
         self.realm = realm
         self.name = name
+        self.region = region
         self.keystone = {}
         self.keystone_score = 0
         self.weekly_completed_keys = []
+        # True when the data is the last known good data, its upstream being unavailable
+        self.stale = False
 
     def __repr__(self):
         '''
@@ -31,26 +54,69 @@ class Toon():
         '''
         str
         '''
-        return '{{"{}":"{}/{}"}}'.format(self.player, self.realm, self.name)
+        return '{{"{}":"{}/{}/{}"}}'.format(self.player, self.region, self.realm, self.name)
 
     def slug(self):
         '''
-        slug
+        Identity of the character, realm names repeat across regions
+        '''
+        return (self.region, self.realm, self.name)
+
+    def get_state(self, group):
+        '''
+        Return the attributes of a data group as a json friendly dict.
+        '''
+        return {attr: getattr(self, attr) for attr in self.state_attributes[group]}
+
+    def set_state(self, group, state):
+        '''
+        Restore the attributes of a data group saved with `get_state`.
         '''
-        return (self.realm, self.name)
+        for attr in self.state_attributes[group]:
+            setattr(self, attr, state[attr])
+
+    def get_keystone_profile(self, raiderioapi, completed=True, weekly=True):
+        '''
+        Fetch the completed and/or weekly keystone data with a single raider.io
+        profile request and parse it.
+        '''
+        fields = []
+        if completed:
+            fields.extend(self.completed_fields)
+        if weekly:
+            fields.extend(self.weekly_fields)
+
+        with profiling.span("fetch"):
+            profile = raiderioapi.character_profile(self, fields)
+        with profiling.span("parse"):
+            if completed:
+                self.parse_mythic_keystone(profile)
+            if weekly:
+                self.parse_weekly_keystone(profile)
+        return profile
 
     def get_mythic_keystone(self, raiderioapi):
         '''
         get_mythic_keystone
         '''
-        keystone_best = raiderioapi.mythic_plus_best_runs(self)
-        keystone_alternate = raiderioapi.mythic_plus_alternate_runs(self)
-        keystone_total_score = raiderioapi.mythic_plus_scores_by_season(self)
+        self.get_keystone_profile(raiderioapi, completed=True, weekly=False)
 
-        if "mythic_plus_scores_by_season" in keystone_total_score:
-            self.keystone_score = keystone_total_score["mythic_plus_scores_by_season"][0]["scores"]["all"]
+    def get_weekly_keystone(self, raiderioapi):
+        '''
+        get_weekly_keystone
+        '''
+        self.get_keystone_profile(raiderioapi, completed=False, weekly=True)
 
-        for run in keystone_best["mythic_plus_best_runs"]:
+    def parse_mythic_keystone(self, profile):
+        '''
+        Fill in the best runs, ratings and season score from a raider.io profile.
+        '''
+        self.keystone = {}
+
+        if "mythic_plus_scores_by_season" in profile:
+            self.keystone_score = profile["mythic_plus_scores_by_season"][0]["scores"]["all"]
+
+        for run in profile["mythic_plus_best_runs"]:
             dungeon = run["dungeon"]
             fort_tyr_affix = str.lower(run["affixes"][0]["name"])
 
@@ -65,12 +131,12 @@ class Toon():
             }
             self.keystone[dungeon]["rating"][fort_tyr_affix] = run["score"]
 
-        for run in keystone_alternate["mythic_plus_alternate_runs"]:
+        for run in profile["mythic_plus_alternate_runs"]:
             dungeon = run["dungeon"]
             fort_tyr_affix = str.lower(run["affixes"][0]["name"])
 
             self.keystone[dungeon]["rating"][fort_tyr_affix] = run["score"]
-        
+
         for dungeon in self.keystone.values():
             logging.info(dungeon)
             total = 0
@@ -80,16 +146,15 @@ class Toon():
                 total = dungeon["rating"]["tyrannical"] * 1.5 + dungeon["rating"]["fortified"] / 2.0
             dungeon["rating"]["total"] = round(total)
 
-    def get_weekly_keystone(self, raiderioapi):
+    def parse_weekly_keystone(self, profile):
         '''
-        get_weekly_keystone
+        Fill in the keys completed this week from a raider.io profile.
         '''
-        keystone_detail = raiderioapi.mythic_keystone_weekly_highest(self)
-
         # number of keys you need to complete for 3 vault choices.
         three_vault_choices=8
 
-        for weekly_key in keystone_detail["mythic_plus_weekly_highest_level_runs"]:
+        self.weekly_completed_keys = []
+        for weekly_key in profile["mythic_plus_weekly_highest_level_runs"]:
             self.weekly_completed_keys.append(weekly_key["mythic_level"])
         self.weekly_completed_keys.sort(reverse=True)
         self.weekly_completed_keys = self.weekly_completed_keys[:three_vault_choices]
@@ -97,16 +162,39 @@ class Toon():
         self.weekly_completed_keys.extend([0 for n in range(three_vault_choices - padding)])
 
     @staticmethod
-    def scan(input_dir):
+    def scan(input_dir, region=BlizzardRegion.US):
         '''
-        scan
+        Read the roster from `<input_dir>/toons.json`.
+
+        @param region Region of characters listed without one
         '''
-        scan_toons = []
+        # toons.json contains, per player, realms or regions holding realms:
+        # {
+        #    "<player>": {
+        #        "<realm>": ["<name>", ...],
+        #        "<region>": {"<realm>": ["<name>", ...]}
+        #    }
+        # }
+        # a character listed more than once (shared accounts, alts listed twice)
+        # is one toon that remembers every player it belongs to
+        scan_toons = {}
+        def add(player, realm, name, region):
+            toon = scan_toons.setdefault((region, realm, name), Toon(player, realm, name, region))
+            if player not in toon.players:
+                toon.players.append(player)
+
         with open(os.path.join(input_dir, "toons.json")) as toon_fd:
             toons_data = json.load(toon_fd)
             for player, toons in toons_data.items():
-                for realm, characters in toons.items():
-                    for name in characters:
-                        scan_toons.append(Toon(player, realm, name))
-
-        return scan_toons
+                for key, characters in toons.items():
+                    if isinstance(characters, dict):
+                        if key not in BlizzardRegion:
+                            raise ValueError("unknown region in toons.json", player, key)
+                        for realm, names in characters.items():
+                            for name in names:
+                                add(player, realm, name, key)
+                    else:
+                        for name in characters:
+                            add(player, key, name, region)
+
+        return list(scan_toons.values())
@@ -0,0 +1,210 @@
+'''
+keystonescan.transport
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides the pooled HTTP transport shared by the API wrappers
+'''
+
+import json
+import time
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from keystonescan import profiling
+from keystonescan.ratelimit import parse_retry_after
+
+class HttpTransport:
+    '''
+    Keep-alive HTTP session with a connection pool per upstream host, so calls
+    to the same API reuse the TCP and TLS connection.
+
+    When a `RateLimiter` is given, calls that name a `limit_key` wait for their
+    budget.  Throttled calls (429) are retried with jittered exponential backoff,
+    waiting at least as long as the upstream `Retry-After` asks.  With
+    `CircuitBreakers` calls to an upstream that keeps failing raise
+    `CircuitOpenError` without being sent.
+
+    Basic Usage::
+       >>> transport = HttpTransport(pool_size=16, timeout=10)
+       >>> blizzapi = BlizzardApiRequest(oauth, transport=transport)
+       >>> raiderioapi = RaiderIoApiRequest(transport=transport)
+    '''
+    # (connect, read) timeout in seconds used when the caller does not give one
+    default_timeout = (5, 30)
+    default_pool_size = 10
+
+    def __init__(self, pool_size=default_pool_size, timeout=None, max_hosts=10,
+            rate_limiter=None, max_retries=3, backoff=0.5, sleep=time.sleep, recorder=None,
+            metrics=None, coalescer=None, breakers=None):
+        '''
+        @param pool_size Number of connections kept alive per host
+        @param timeout Default timeout for every request
+        @param max_hosts Number of per-host pools to keep
+        @param rate_limiter Optional RateLimiter holding the per-upstream budgets
+        @param max_retries Number of times a throttled request is retried
+        @param backoff Base delay in seconds for the exponential backoff
+        @param recorder Optional ResponseArchive every final response is recorded to
+        @param metrics Optional RequestMetrics counting every attempt per endpoint
+        @param coalescer Optional RequestCoalescer sharing one response between identical GETs
+        @param breakers Optional CircuitBreakers failing calls to a degraded upstream at once
+        '''
+        self.pool_size = pool_size
+        self.timeout = timeout if timeout is not None else self.default_timeout
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.recorder = recorder
+        self.metrics = metrics
+        self.coalescer = coalescer
+        self.breakers = breakers
+        self._sleep = sleep
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def request(self, method, url, limit_key=None, endpoint=None, **kwargs):
+        '''
+        Send a request through the pooled session.
+
+        @param limit_key Name of the rate limit budget this call counts against
+        @param endpoint Name the call is counted under in the metrics
+        '''
+        kwargs.setdefault("timeout", self.timeout)
+        endpoint = endpoint or limit_key or "other"
+        def send():
+            resp = self._request_with_breaker(method, url, limit_key, endpoint, **kwargs)
+            if self.recorder is not None:
+                self.recorder.record(method, url, kwargs, resp)
+            return resp
+        if self.coalescer is None or method != "GET":
+            return send()
+        return self.coalescer.call(self.coalesce_key(url, **kwargs), send)
+
+    @staticmethod
+    def coalesce_key(url, params=None, headers=None, **kwargs):
+        '''
+        Requests with the same key get the same response.  The bearer token is
+        not part of it, the namespace and conditional headers are.
+        '''
+        headers = headers or {}
+        return json.dumps([url, sorted((params or {}).items())] + [headers.get(name)
+                for name in ("Battlenet-Namespace", "If-None-Match", "If-Modified-Since")])
+
+    def _send(self, method, url, endpoint, **kwargs):
+        '''
+        Send one attempt, timing it for the metrics.
+        '''
+        if self.metrics is None:
+            with profiling.span("http"):
+                return self.session.request(method, url, **kwargs)
+        start = time.monotonic()
+        try:
+            with profiling.span("http"):
+                resp = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.metrics.observe(endpoint, None, time.monotonic() - start)
+            raise
+        self.metrics.observe(endpoint, resp.status_code, time.monotonic() - start,
+                len(resp.content or b""))
+        return resp
+
+    def _request_with_breaker(self, method, url, limit_key, endpoint, **kwargs):
+        '''
+        Send a request unless the breaker of its upstream is open, reporting
+        the outcome to the breaker.
+        '''
+        breaker = None
+        if self.breakers is not None:
+            breaker = self.breakers.breaker(limit_key)
+        if breaker is None:
+            return self._request_with_retries(method, url, limit_key, endpoint, **kwargs)
+
+        breaker.allow()
+        try:
+            resp = self._request_with_retries(method, url, limit_key, endpoint, **kwargs)
+        except BaseException:
+            # any way out must report, or a half-open trial never ends
+            breaker.on_failure()
+            raise
+        if resp.status_code == 429 or resp.status_code >= 500:
+            breaker.on_failure()
+        else:
+            breaker.on_success()
+        return resp
+
+    def _request_with_retries(self, method, url, limit_key, endpoint, **kwargs):
+        '''
+        Send a request, waiting for its rate limit budget and retrying a 429.
+        '''
+        bucket = None
+        if self.rate_limiter is not None and limit_key is not None:
+            bucket = self.rate_limiter.bucket(limit_key)
+
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+            resp = self._send(method, url, endpoint, **kwargs)
+            if resp.status_code != 429:
+                if bucket is not None:
+                    bucket.on_success()
+                return resp
+
+            retry_after = parse_retry_after(resp.headers.get("Retry-After"))
+            if bucket is not None:
+                bucket.on_throttled(retry_after)
+            if attempt >= self.max_retries:
+                return resp
+
+            delay = max(retry_after or 0, random.uniform(0, self.backoff * 2 ** attempt))
+            logging.warning("throttled by {}, retrying in {:.2f}s".format(url, delay))
+            if bucket is not None:
+                bucket.on_retry()
+            if self.metrics is not None:
+                self.metrics.retry(endpoint)
+            self._sleep(delay)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        '''
+        GET a url, see `requests.get`
+        '''
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        '''
+        POST to a url, see `requests.post`
+        '''
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        '''
+        Close all pooled connections.
+        '''
+        self.session.close()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+def default_transport():
+    '''
+    Shared transport used when a request class is not given one.
+    '''
+    global _default_transport # pylint: disable=global-statement
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+        return _default_transport
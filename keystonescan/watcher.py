@@ -0,0 +1,377 @@
+'''
+keystonescan.watcher
+~~~~~~~~~~~~~~~~~~~~
+
+This module provides the long running `keystonescan watch` mode.  The API
+clients, sessions and tokens stay warm between refreshes and characters are
+polled on their own schedule instead of sweeping the whole roster every run.
+'''
+
+import os
+import time
+import heapq
+import logging
+import itertools
+
+import requests
+
+from keystonescan import keystonescan
+from keystonescan import profiling
+from keystonescan.dungeon import DungeonCache
+from keystonescan.aggregate import KeystoneAggregate
+from keystonescan.leaderboard import Leaderboards
+from keystonescan.output import OutputWriter
+from keystonescan.server import OutputStore, OutputServer
+from keystonescan.statestore import ToonStateStore
+from keystonescan.sources import get_run_source
+from keystonescan.blizzregion import BlizzardRegion
+from keystonescan.blizzrequest import BlizzardApiError, BlizzardThrottlingError
+from keystonescan.raideriorequest import RaiderIoApiError, RaiderIoThrottlingError
+
+class RefreshScheduler():
+    '''
+    Priority queue of toons ordered by their next refresh time.  A toon with
+    new data is polled again after `min_interval` seconds, every refresh that
+    finds nothing new doubles its interval up to `max_interval`.
+    '''
+    def __init__(self, min_interval, max_interval):
+        '''
+        RefreshScheduler constructor
+        '''
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._queue = []
+        self._intervals = {}
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def schedule(self, toon, due):
+        '''
+        Queue a toon to be refreshed at `due`.
+        '''
+        self._intervals.setdefault(toon.slug(), self.min_interval)
+        heapq.heappush(self._queue, (due, next(self._order), toon))
+
+    def pop_due(self, now):
+        '''
+        Remove and return every toon due at `now`.
+        '''
+        due = []
+        while self._queue and self._queue[0][0] <= now:
+            due.append(heapq.heappop(self._queue)[2])
+        return due
+
+    def reschedule(self, toon, changed, now):
+        '''
+        Queue a refreshed toon again, sooner if it had new data.
+        '''
+        if changed:
+            interval = self.min_interval
+        else:
+            interval = min(self.max_interval, self._intervals.get(toon.slug(), self.min_interval) * 2)
+        self._intervals[toon.slug()] = interval
+        self.schedule(toon, now + interval)
+
+    def next_due(self):
+        '''
+        Time the next toon is due or None when the queue is empty.
+        '''
+        return self._queue[0][0] if self._queue else None
+
+    def clear(self):
+        '''
+        Drop every queued toon.
+        '''
+        self._queue = []
+
+class Watcher():
+    '''
+    Keep the output files up to date, rewriting them only when their inputs change.
+    '''
+    # seconds between checks of the dungeon index
+    dungeon_interval = 60 * 60
+
+    def __init__(self, input_dir, writer, blizzapi, raiderioapi, scheduler,
+            character=False, player=False, dungeon=False, weekly=False,
+            jobs=1, state_store=None, stale_after=0, dungeon_cache=None, metrics=None,
+            metrics_file=None, region=BlizzardRegion.US, leaderboard=False,
+            leaderboard_size=Leaderboards.default_top, clock=time.time):
+        '''
+        Watcher constructor
+        '''
+        self.input_dir = input_dir
+        self.writer = writer
+        self.blizzapi = blizzapi
+        self.raiderioapi = raiderioapi
+        self.scheduler = scheduler
+        self.character = character
+        self.player = player
+        self.dungeon = dungeon
+        self.weekly = weekly
+        self.jobs = jobs
+        self.state_store = state_store
+        self.stale_after = stale_after
+        self.dungeon_cache = dungeon_cache
+        self.metrics = metrics
+        self.metrics_file = metrics_file
+        self.region = region
+        self.leaderboard = leaderboard
+        self.leaderboard_size = leaderboard_size
+        self.clock = clock
+
+        self.groups = []
+        if player or character or leaderboard:
+            self.groups.append("completed")
+        if weekly or leaderboard:
+            self.groups.append("weekly")
+        # rebuilt when the roster or the dungeons change, otherwise updated per refreshed toon
+        self.leaderboards = None
+
+        self.toons = []
+        self.toons_mtime = None
+        self.dungeon_default = None
+        self.dungeon_details = None
+        self.dungeon_checked = None
+
+    def load_toons(self, now):
+        '''
+        (Re)load `<input_dir>/toons.json` when it changed.  Known toons keep
+        their data, new toons are refreshed right away unless the state store
+        has data newer than `stale_after` for them.
+        '''
+        mtime = os.path.getmtime(os.path.join(self.input_dir, "toons.json"))
+        if mtime == self.toons_mtime:
+            return False
+        self.toons_mtime = mtime
+
+        known = {toon.slug(): toon for toon in self.toons}
+        self.toons = []
+        self.leaderboards = None
+        self.scheduler.clear()
+        for toon in keystonescan.get_toons(self.input_dir, self.region):
+            due = now
+            old_toon = known.get(toon.slug())
+            if old_toon is not None:
+                old_toon.player = toon.player
+                old_toon.players = toon.players
+                toon = old_toon
+            elif self.state_store is not None:
+                fresh = [self.state_store.restore(toon, group, fresh_after=now - self.stale_after,
+                        now=now)
+                        for group in self.groups]
+                if fresh and all(fresh):
+                    due = now + self.scheduler.min_interval
+            self.toons.append(toon)
+            if self.groups:
+                self.scheduler.schedule(toon, due)
+        logging.info("watching {} characters".format(len(self.toons)))
+        return True
+
+    def refresh_dungeons(self, now):
+        '''
+        Check the dungeon index, returns True when the dungeon data changed.
+        '''
+        if self.dungeon_checked is not None and now < self.dungeon_checked + self.dungeon_interval:
+            return False
+        self.dungeon_checked = now
+
+        try:
+            dungeon_default = keystonescan.get_dungeon_defaults(self.blizzapi)
+            dungeon_details = self.dungeon_details
+            if self.dungeon:
+                dungeon_details = keystonescan.get_cached_dungeon_details(self.blizzapi,
+                        dungeon_default, self.dungeon_cache, self.jobs)
+        except (BlizzardApiError, BlizzardThrottlingError, requests.RequestException) as err:
+            if self.dungeon_default is None:
+                raise
+            logging.error("refreshing dungeons failed: {}".format(err))
+            return False
+
+        changed = (dungeon_default, dungeon_details) != (self.dungeon_default, self.dungeon_details)
+        self.dungeon_default = dungeon_default
+        self.dungeon_details = dungeon_details
+        return changed
+
+    def refresh_toon(self, toon, now):
+        '''
+        Fetch every data group of a toon, returns the groups that changed.  A
+        toon that could not be fetched keeps its last known data and is marked
+        stale, which changes its groups once.
+        '''
+        before = {group: toon.get_state(group) for group in self.groups}
+        was_stale = toon.stale
+        try:
+            with profiling.span("toon"):
+                toon.get_keystone_profile(self.raiderioapi,
+                        completed="completed" in self.groups, weekly="weekly" in self.groups)
+        except (RaiderIoApiError, RaiderIoThrottlingError, BlizzardApiError,
+                BlizzardThrottlingError, requests.RequestException) as err:
+            logging.error("refreshing {} failed: {}".format(toon, err))
+            toon.stale = True
+            return set() if was_stale else set(self.groups)
+
+        toon.stale = False
+        changed = set(self.groups) if was_stale else set()
+        for group in self.groups:
+            if toon.get_state(group) != before[group]:
+                changed.add(group)
+            if self.state_store is not None:
+                self.state_store.save(toon, group, int(now))
+        return changed
+
+    def refresh_toons(self, now):
+        '''
+        Refresh the toons that are due, returns the groups that changed.
+        '''
+        due = self.scheduler.pop_due(now)
+        if not due:
+            return set()
+
+        changes = {}
+        def refresh(toon):
+            changes[id(toon)] = self.refresh_toon(toon, now)
+        keystonescan.scan_concurrently(due, refresh, self.jobs)
+
+        changed = set()
+        for toon in due:
+            changed.update(changes[id(toon)])
+            self.scheduler.reschedule(toon, bool(changes[id(toon)]), now)
+            if changes[id(toon)] and self.leaderboards is not None:
+                self.leaderboards.add(toon)
+        logging.info("refreshed {} characters, changed: {}".format(
+                len(due), ", ".join(sorted(changed)) or "nothing"))
+        return changed
+
+    def write_outputs(self, changed, dungeons_changed, now):
+        '''
+        Rewrite the output files whose inputs changed.
+        '''
+        if not changed and not dungeons_changed:
+            return False
+
+        written = False
+        with profiling.span("aggregate"):
+            aggregate = KeystoneAggregate.build(self.dungeon_default, self.toons,
+                    completed=self.player or self.character, weekly=self.weekly)
+        if "completed" in changed or (dungeons_changed and "completed" in self.groups):
+            if self.player:
+                keystonescan.generate_player_output(self.writer, aggregate)
+            if self.character:
+                keystonescan.generate_character_output(self.writer, aggregate)
+            written = True
+        if self.dungeon and dungeons_changed:
+            keystonescan.generate_dungeon_output(self.writer, self.dungeon_details)
+            written = True
+        if "weekly" in changed and self.weekly:
+            keystonescan.generate_weekly_output(self.writer, aggregate)
+            written = True
+        if self.leaderboard:
+            if self.leaderboards is None or dungeons_changed:
+                self.leaderboards = Leaderboards.build(self.dungeon_default, self.toons,
+                        top=self.leaderboard_size)
+            keystonescan.generate_leaderboard_output(self.writer, self.leaderboards)
+            written = True
+        if written:
+            keystonescan.generate_scanned_output(self.writer, int(now))
+            self.write_metrics()
+            self.writer.publish()
+        return written
+
+    def write_metrics(self):
+        '''
+        Write the request metrics gathered so far.
+        '''
+        if self.metrics is None:
+            return
+        keystonescan.generate_stats_output(self.writer, self.metrics)
+        if self.metrics_file is not None:
+            self.metrics.write_prometheus(self.metrics_file)
+
+    def run_once(self):
+        '''
+        Do whatever work is due, returns the seconds until more work is due.
+        '''
+        now = self.clock()
+        roster_changed = self.load_toons(now)
+        dungeons_changed = self.refresh_dungeons(now)
+        changed = self.refresh_toons(now)
+        if roster_changed:
+            changed.update(self.groups)
+        self.write_outputs(changed, dungeons_changed, now)
+
+        next_due = self.scheduler.next_due()
+        if next_due is None:
+            next_due = now + self.scheduler.max_interval
+        next_due = min(next_due, self.dungeon_checked + self.dungeon_interval)
+        return max(0, next_due - self.clock())
+
+    def run(self, sleep=time.sleep):
+        '''
+        Refresh forever.
+        '''
+        while True:
+            # check toons.json for changes at least once a minute
+            sleep(min(self.run_once(), 60))
+
+def watch(input_dir, output_dir, character=False, player=False, dungeon=False, weekly=False,
+        debug=False, jobs=1, cache_size=32, dungeon_ttl=DungeonCache.default_ttl,
+        incremental=False, stale_after=12 * 60 * 60, compress=(), manifest=False,
+        min_interval=5 * 60, max_interval=6 * 60 * 60, metrics_file=None,
+        region=BlizzardRegion.US, source="raiderio", breaker_threshold=5, breaker_reset=30,
+        http=None, leaderboard=False, leaderboard_size=Leaderboards.default_top):
+    '''
+    Stay resident and keep the outputs in <output_dir> up to date.
+
+    @param min_interval Seconds between polls of a character with new runs
+    @param max_interval Longest backoff for characters without new runs
+    @param incremental Keep character data in `<input_dir>/toons.sqlite` so a
+                       restart picks up where the last process stopped
+    @param metrics_file Also write the request metrics to this Prometheus textfile
+    @param region Region of characters toons.json lists without one and of the dungeon data
+    @param source Where character runs come from, one of `sources.source_choices`
+    @param breaker_threshold Consecutive failures that open the circuit of an upstream
+    @param breaker_reset Seconds an open circuit waits before trying its upstream again
+    @param http `(host, port)` to also serve the outputs from memory over HTTP
+    @param leaderboard Keep leaderboards.json up to date
+    @param leaderboard_size Runs listed per dungeon leaderboard
+    '''
+    keystonescan.configure_logging(debug)
+
+    # a resident process must see new data, only share requests that are in flight
+    blizzapis, raiderioapi = keystonescan.get_api_clients(input_dir, jobs, cache_size,
+            remember=False, breaker_threshold=breaker_threshold, breaker_reset=breaker_reset)
+    blizzapi = blizzapis.get(region)
+    state_store = None
+    if incremental:
+        state_store = ToonStateStore(os.path.join(input_dir, ToonStateStore.file_name))
+
+    store = None
+    server = None
+    if http is not None:
+        store = OutputStore()
+        store.load(output_dir)
+        server = OutputServer(store, *http)
+        server.start()
+    writer = OutputWriter(output_dir, compress=compress, manifest=manifest, store=store)
+    watcher = Watcher(input_dir, writer, blizzapi,
+            get_run_source(source, raiderioapi, blizzapis),
+            RefreshScheduler(min_interval, max_interval),
+            character=character, player=player, dungeon=dungeon, weekly=weekly, jobs=jobs,
+            state_store=state_store, stale_after=stale_after,
+            dungeon_cache=DungeonCache(input_dir, ttl=dungeon_ttl),
+            metrics=blizzapi.transport.metrics, metrics_file=metrics_file, region=region,
+            leaderboard=leaderboard, leaderboard_size=leaderboard_size)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        logging.info("stopping")
+    finally:
+        if server is not None:
+            server.stop()
+        if state_store is not None:
+            state_store.close()
+        if blizzapi.cache is not None:
+            blizzapi.cache.flush()
+    return 0
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.aggregate` package."""
+
+import unittest
+
+from keystonescan.aggregate import KeystoneAggregate
+from keystonescan.toons import Toon
+
+def dungeon_defaults():
+    """Default dungeon records as built by `get_dungeon_defaults`."""
+    return [{"id": dungeon_id, "name": name, "level": 0, "duration": 0,
+             "rating": {"total": 0, "tyrannical": 0, "fortified": 0}}
+            for dungeon_id, name in ((375, "Mists"), (376, "Wake"))]
+
+def run(level, total):
+    """Best run record as parsed into `Toon.keystone`."""
+    return {"level": level, "duration": level * 1000,
+            "rating": {"fortified": total, "tyrannical": 0, "total": total}}
+
+class TestKeystoneAggregate(unittest.TestCase):
+    """Tests for `keystonescan.aggregate` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        main = Toon("player", "realm", "main")
+        main.keystone = {"Mists": dict(run(15, 200), name="Mists")}
+        main.weekly_completed_keys = [15, 0]
+        alt = Toon("player", "realm", "alt")
+        alt.keystone = {"Mists": dict(run(12, 150), name="Mists"),
+                        "Wake": dict(run(10, 120), name="Wake"),
+                        "Old Dungeon": dict(run(20, 300), name="Old Dungeon")}
+        self.characters = [main, alt]
+
+    def test_000_player_takes_best_level(self):
+        """Players get the highest level of all their characters per dungeon."""
+        aggregate = KeystoneAggregate.build(dungeon_defaults(), self.characters)
+        players = aggregate.player_output()
+        self.assertEqual(len(players), 1)
+        self.assertEqual([dungeon["level"] for dungeon in players[0]["dungeons"]], [15, 10])
+        self.assertEqual(players[0]["dungeons"][0],
+                {"id": 375, "name": "Mists", "level": 15, "duration": 15000,
+                 "rating": {"fortified": 200, "tyrannical": 0, "total": 200}})
+
+    def test_001_characters_fill_defaults(self):
+        """Unplayed dungeons keep their defaults and unknown dungeons are dropped."""
+        aggregate = KeystoneAggregate.build(dungeon_defaults(), self.characters)
+        main, alt = aggregate.character_output()
+        self.assertEqual((main["name"], alt["name"]), ("Main", "Alt"))
+        self.assertEqual(main["dungeons"][1], dungeon_defaults()[1])
+        self.assertEqual([dungeon["id"] for dungeon in alt["dungeons"]], [375, 376])
+
+    def test_002_weekly(self):
+        """Weekly output lists every character's keys."""
+        aggregate = KeystoneAggregate.build(dungeon_defaults(), self.characters, completed=False)
+        self.assertEqual(aggregate.weekly_output()[0],
+                {"name": "Main", "realm": "realm", "region": "us", "dungeons": [15, 0]})
+        self.assertEqual(aggregate.player_output(), [])
+
+    def test_003_shared_character(self):
+        """A character listed under two players counts for both."""
+        shared = self.characters[1]
+        shared.players.append("other")
+        players = {player["name"]: player
+                for player in KeystoneAggregate.build(dungeon_defaults(), [shared]).player_output()}
+        self.assertEqual(players["player"]["dungeons"], players["other"]["dungeons"])
+        self.assertEqual(players["other"]["dungeons"][1]["level"], 10)
+
+    def test_004_same_name_in_two_regions(self):
+        """Characters sharing a name in different regions stay apart."""
+        us_main = self.characters[0]
+        eu_main = Toon("player", "realm", "main", "eu")
+        eu_main.weekly_completed_keys = [20, 0]
+        eu_main.stale = True
+        aggregate = KeystoneAggregate.build(dungeon_defaults(), [us_main, eu_main])
+        characters = aggregate.character_output()
+        self.assertEqual([(character["name"], character["region"]) for character in characters],
+                [("Main", "us"), ("Main", "eu")])
+        self.assertEqual([character.get("stale", False) for character in characters], [False, True])
+        self.assertEqual([week["dungeons"] for week in aggregate.weekly_output()], [[15, 0], [20, 0]])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.archive` package."""
+
+import os
+import gzip
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from keystonescan import keystonescan
+from tests.test_toons import raiderio_profile
+
+def fake_upstream(self, method, url, **kwargs): # pylint: disable=unused-argument
+    """Answer the blizzard and raider.io endpoints keystonescan uses."""
+    if url.endswith("/oauth/token"):
+        body = {"access_token": "secret", "token_type": "bearer", "expires_in": 86399}
+    elif url.endswith("/mythic-keystone/dungeon/index"):
+        body = {"dungeons": [{"id": 375, "name": "Plaguefall"}]}
+    elif url.endswith("/characters/profile"):
+        body = raiderio_profile()
+    else:
+        body = {}
+    resp = requests.Response()
+    resp.status_code = 200
+    resp._content = json.dumps(body).encode("utf-8") # pylint: disable=protected-access
+    return resp
+
+class TestArchive(unittest.TestCase):
+    """Tests for `keystonescan.archive` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_dir = os.path.join(self.tmpdir.name, "input")
+        self.archive_dir = os.path.join(self.tmpdir.name, "archive")
+        os.makedirs(self.input_dir)
+        with open(os.path.join(self.input_dir, "toons.json"), mode="w") as toon_fd:
+            json.dump({"player": {"realm": ["toon", "alt"]}}, toon_fd)
+        with open(os.path.join(self.input_dir, "access.json"), mode="w") as access_fd:
+            json.dump({"client_id": "id", "client_secret": "secret"}, access_fd)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.tmpdir.cleanup()
+
+    def outputs(self, output_dir):
+        """Read the player and weekly outputs."""
+        outputs = {}
+        for name in ("players.json", "weekly.json"):
+            with open(os.path.join(output_dir, name)) as output_fd:
+                outputs[name] = json.load(output_fd)
+        return outputs
+
+    def test_000_record_and_replay(self):
+        """A replay rebuilds the same outputs without the network."""
+        recorded_dir = os.path.join(self.tmpdir.name, "recorded")
+        replayed_dir = os.path.join(self.tmpdir.name, "replayed")
+        os.makedirs(recorded_dir)
+        os.makedirs(replayed_dir)
+
+        with mock.patch.object(requests.Session, "request", fake_upstream):
+            keystonescan.scan(self.input_dir, recorded_dir, player=True, weekly=True,
+                    record=self.archive_dir)
+        objects_dir = os.path.join(self.archive_dir, "objects")
+        for name in os.listdir(objects_dir):
+            with gzip.open(os.path.join(objects_dir, name)) as object_fd:
+                self.assertNotIn(b"secret", object_fd.read())
+
+        os.remove(os.path.join(self.input_dir, "toons.json"))
+        with mock.patch.object(requests.Session, "request",
+                side_effect=AssertionError("network used")):
+            keystonescan.scan(self.input_dir, replayed_dir, player=True, weekly=True,
+                    replay=self.archive_dir)
+        self.assertEqual(self.outputs(recorded_dir), self.outputs(replayed_dir))
+        self.assertEqual(self.outputs(replayed_dir)["players.json"][0]["dungeons"][0]["level"], 15)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+"""Tests for `benchmarks` package."""
+
+import unittest
+
+from benchmarks.fakeserver import FakeUpstreamServer
+from benchmarks.bench_scan import bench_scan
+
+class TestBench(unittest.TestCase):
+    """Tests for `benchmarks` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.server = FakeUpstreamServer(throttle_rate=0.1, seed=1)
+        self.server.start()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.server.stop()
+
+    def test_000_scan_against_fake_server(self):
+        """A full scan runs against the fake upstream and retries its 429s."""
+        result = bench_scan(self.server, 20, jobs=4,
+                rates={"raiderio": 1000, "blizzard": 1000, "oauth": 1000})
+        self.assertEqual(result["toons"], 20)
+        # one profile request per toon plus oauth and dungeon data
+        self.assertGreaterEqual(result["requests"], 20 + 1 + 1 + 8 * 2)
+        self.assertGreater(result["throttled"], 0)
+        self.assertGreater(result["peak_mib"], 0)
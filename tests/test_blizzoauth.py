@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.blizzoauth` package."""
+
+import os
+import json
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from keystonescan.blizzoauth import BlizzOAuth, BlizzOAuthPool
+from keystonescan.blizzrequest import BlizzardApiRequest
+
+class TestBlizzOAuth(unittest.TestCase):
+    """Tests for `keystonescan.blizzoauth` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmpdir.name, "auth_cache.json")
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.tmpdir.cleanup()
+
+    def test_000_token_kept_in_memory(self):
+        """Only the first call goes to blizzard or the cache file."""
+        token = {"access_token": "abc", "token_type": "bearer", "expires_in": 86399}
+        with mock.patch.object(BlizzardApiRequest, "oauth_token_client",
+                return_value=dict(token)) as token_client, \
+             mock.patch.object(BlizzardApiRequest, "oauth_check_token") as check_token:
+            oauth = BlizzOAuth("id", "secret", self.cache_file)
+            self.assertEqual(oauth.client_credentials(), "abc")
+            os.remove(self.cache_file)
+            self.assertEqual(oauth.client_credentials(), "abc")
+            self.assertEqual(token_client.call_count, 1)
+            check_token.assert_not_called()
+
+    def test_001_cache_file_trusted_until_expiry(self):
+        """A cached token with expiry info skips check_token."""
+        oauth = BlizzOAuth("id", "secret", self.cache_file)
+        with open(self.cache_file, mode="w") as auth_fd:
+            json.dump({"id": {"access_token": "cached", "timestamp": 0,
+                              "expires_in": 2 ** 40}}, auth_fd)
+        with mock.patch.object(BlizzardApiRequest, "oauth_check_token") as check_token:
+            self.assertEqual(oauth.client_credentials(), "cached")
+            check_token.assert_not_called()
+
+    def test_002_invalidate_requests_new_token(self):
+        """A rejected token is not reused from the cache file."""
+        oauth = BlizzOAuth("id", "secret", self.cache_file)
+        with open(self.cache_file, mode="w") as auth_fd:
+            json.dump({"id": {"access_token": "stale", "timestamp": 0,
+                              "expires_in": 2 ** 40}}, auth_fd)
+        self.assertEqual(oauth.client_credentials(), "stale")
+        oauth.invalidate()
+        with mock.patch.object(BlizzardApiRequest, "oauth_token_client",
+                return_value={"access_token": "fresh", "expires_in": 86399}):
+            self.assertEqual(oauth.client_credentials(), "fresh")
+
+    def test_003_regions_share_the_cache_file(self):
+        """Each region asks its own endpoint and keeps the other regions' tokens."""
+        tokens = [{"access_token": "us-token", "expires_in": 86399},
+                  {"access_token": "eu-token", "expires_in": 86399}]
+        with mock.patch.object(BlizzardApiRequest, "oauth_token_client",
+                side_effect=tokens) as token_client:
+            self.assertEqual(BlizzOAuth("id", "secret", self.cache_file).client_credentials(),
+                    "us-token")
+            self.assertEqual(BlizzOAuth("id", "secret", self.cache_file,
+                    region="eu").client_credentials(), "eu-token")
+        self.assertEqual(token_client.call_args[0][2], "eu")
+        with open(self.cache_file) as auth_fd:
+            self.assertEqual(set(json.load(auth_fd)), {"id", "id/eu"})
+
+    def test_004_pool_round_robin(self):
+        """The pool hands out the clients in turn, each with its own budget."""
+        clients = [BlizzOAuth(client_id, "secret", self.cache_file) for client_id in "abc"]
+        with open(self.cache_file, mode="w") as auth_fd:
+            json.dump({client_id: {"access_token": client_id + "-token", "timestamp": 0,
+                    "expires_in": 2 ** 40} for client_id in "abc"}, auth_fd)
+        pool = BlizzOAuthPool(clients)
+        self.assertEqual([pool.client_credentials() for _ in range(4)],
+                ["a-token", "b-token", "c-token", "a-token"])
+        self.assertEqual([client.limit_suffix for client in clients], ["0", "1", "2"])
+        self.assertIsNone(BlizzOAuthPool([BlizzOAuth("a", "s", self.cache_file)]).pick().limit_suffix)
+
+    def test_005_concurrent_clients_merge_cache(self):
+        """Clients refreshing at once all end up in the cache file."""
+        def token_client(client_id, *args, **kwargs): # pylint: disable=unused-argument
+            return {"access_token": client_id + "-token", "expires_in": 86399}
+        clients = [BlizzOAuth(str(n), "secret", self.cache_file) for n in range(8)]
+        with mock.patch.object(BlizzardApiRequest, "oauth_token_client", side_effect=token_client):
+            threads = [threading.Thread(target=client.client_credentials) for client in clients]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        with open(self.cache_file) as auth_fd:
+            self.assertEqual(sorted(json.load(auth_fd)), [str(n) for n in range(8)])
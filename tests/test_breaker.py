@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.breaker` package."""
+
+import unittest
+from unittest import mock
+
+from keystonescan.breaker import CircuitBreaker, CircuitBreakers, CircuitOpenError
+from keystonescan.transport import HttpTransport
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Tests for `keystonescan.breaker` package."""
+
+    def test_000_open_and_half_open(self):
+        """Consecutive failures open the breaker until a trial call succeeds."""
+        now = [0]
+        breaker = CircuitBreaker("raiderio", threshold=2, reset_timeout=10, clock=lambda: now[0])
+        breaker.on_failure()
+        breaker.on_success()
+        breaker.on_failure()
+        breaker.allow()
+        with self.assertLogs(level="WARNING"):
+            breaker.on_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+
+        now[0] = 10
+        breaker.allow()
+        with self.assertRaises(CircuitOpenError):
+            breaker.allow()
+        with self.assertLogs(level="INFO"):
+            breaker.on_success()
+        breaker.allow()
+        self.assertEqual(breaker.stats(), {"state": "closed", "opened": 1, "rejected": 2})
+
+    def test_001_upstream_names(self):
+        """Pooled Blizzard clients share the breaker of their region."""
+        breakers = CircuitBreakers()
+        self.assertIs(breakers.breaker("blizzard-us-1"), breakers.breaker("blizzard-us"))
+        self.assertIsNot(breakers.breaker("blizzard-us"), breakers.breaker("blizzard-eu"))
+        self.assertIsNone(breakers.breaker(None))
+        self.assertIsNone(CircuitBreakers(threshold=0).breaker("raiderio"))
+
+    def test_002_transport_stops_sending(self):
+        """An open circuit fails calls without sending them."""
+        transport = HttpTransport(breakers=CircuitBreakers(threshold=2), max_retries=0)
+        with mock.patch.object(transport.session, "request") as request:
+            request.return_value = mock.Mock(status_code=503, content=b"")
+            with self.assertLogs(level="WARNING"):
+                for _ in range(2):
+                    transport.get("https://raider.io/", limit_key="raiderio")
+            with self.assertRaises(CircuitOpenError):
+                transport.get("https://raider.io/", limit_key="raiderio")
+            self.assertEqual(request.call_count, 2)
+            # other upstreams are not affected
+            transport.get("https://us.api.blizzard.com/", limit_key="blizzard-us")
+            self.assertEqual(request.call_count, 3)
+
+    def test_003_interrupted_trial_reopens(self):
+        """A trial call cut short by any exception opens the breaker again."""
+        now = [0]
+        breakers = CircuitBreakers(threshold=1, reset_timeout=10, clock=lambda: now[0])
+        transport = HttpTransport(breakers=breakers, max_retries=0)
+        with mock.patch.object(transport.session, "request") as request:
+            request.return_value = mock.Mock(status_code=503, content=b"")
+            with self.assertLogs(level="WARNING"):
+                transport.get("https://raider.io/", limit_key="raiderio")
+
+            now[0] = 10
+            request.side_effect = KeyboardInterrupt
+            with self.assertLogs(level="WARNING"), self.assertRaises(KeyboardInterrupt):
+                transport.get("https://raider.io/", limit_key="raiderio")
+
+            now[0] = 20
+            request.side_effect = None
+            request.return_value = mock.Mock(status_code=200, content=b"")
+            with self.assertLogs(level="INFO"):
+                transport.get("https://raider.io/", limit_key="raiderio")
+            self.assertEqual(breakers.breaker("raiderio").state, "closed")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.coalesce` package."""
+
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+from keystonescan.coalesce import RequestCoalescer, reusable_response, reusable_game_data
+from keystonescan.transport import HttpTransport
+
+class TestRequestCoalescer(unittest.TestCase):
+    """Tests for `keystonescan.coalesce` package."""
+
+    def test_000_concurrent_callers_share_one_call(self):
+        """Callers arriving while a call is in flight wait for its result."""
+        coalescer = RequestCoalescer(remember=False)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "profile"
+        results = []
+        first = threading.Thread(target=lambda: results.append(coalescer.call("key", fetch)))
+        first.start()
+        started.wait()
+        second = threading.Thread(target=lambda: results.append(coalescer.call("key", fetch)))
+        second.start()
+        while coalescer.hits == 0:
+            pass
+        release.set()
+        first.join()
+        second.join()
+        self.assertEqual(results, ["profile", "profile"])
+        self.assertEqual(len(calls), 1)
+        # nothing is remembered once the call finished
+        coalescer.call("key", fetch)
+        self.assertEqual(len(calls), 2)
+
+    def test_001_errors_are_not_remembered(self):
+        """A failed call is made again by the next caller."""
+        coalescer = RequestCoalescer(remember=True)
+        with self.assertRaises(ValueError):
+            coalescer.call("key", mock.Mock(side_effect=ValueError))
+        self.assertEqual(coalescer.call("key", lambda: 1), 1)
+        self.assertEqual(coalescer.call("key", lambda: 2), 1)
+        coalescer.clear()
+        self.assertEqual(coalescer.call("key", lambda: 3), 3)
+
+    def test_002_transport_shares_identical_gets(self):
+        """Repeated GETs with the same params reach upstream once, other params do not."""
+        resp = requests.Response()
+        resp.status_code = 200
+        transport = HttpTransport(coalescer=RequestCoalescer(remember=True,
+                keep=reusable_response))
+        with mock.patch.object(transport.session, "request", return_value=resp) as request:
+            for name in ("a", "a", "b"):
+                transport.get("https://raider.io/api/v1/characters/profile",
+                        params={"name": name}, headers={"Authorization": name})
+        self.assertEqual(request.call_count, 2)
+
+    def test_003_only_game_data_remembered(self):
+        """Character responses are not kept once their call finished."""
+        def response(url):
+            resp = requests.Response()
+            resp.status_code = 200
+            resp.url = url
+            return resp
+        self.assertTrue(reusable_game_data(
+                response("https://us.api.blizzard.com/data/wow/mythic-keystone/dungeon/index")))
+        self.assertFalse(reusable_game_data(
+                response("https://us.api.blizzard.com/profile/wow/character/realm/main")))
+        self.assertFalse(reusable_game_data(
+                response("https://raider.io/api/v1/characters/profile")))
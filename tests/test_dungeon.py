@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.dungeon` package."""
+
+import tempfile
+import unittest
+
+from keystonescan import keystonescan
+from keystonescan.dungeon import DungeonCache
+
+class FakeBlizzard():
+    """Stand-in for `BlizzardApiRequest` serving the dungeon endpoints."""
+
+    dynamic_ns = "dynamic-us"
+    locale = "en_US"
+
+    def __init__(self):
+        self.calls = 0
+        self.season = 6
+
+    def mythic_keystone_season_index(self):
+        """Current season."""
+        self.calls += 1
+        return {"current_season": {"id": self.season}}
+
+    def mythic_keystone_dungeon(self, dungeon_id):
+        """Dungeon with two upgrade levels."""
+        self.calls += 1
+        return {
+            "id": dungeon_id,
+            "name": "Dungeon {}".format(dungeon_id),
+            "dungeon": {"id": dungeon_id + 1000},
+            "keystone_upgrades": [
+                {"upgrade_level": 1, "qualifying_duration": 1800000},
+                {"upgrade_level": 2, "qualifying_duration": 1440000},
+            ],
+        }
+
+    def media_journal_instance(self, journal_id):
+        """Journal media with a tile."""
+        self.calls += 1
+        return {"assets": [{"key": "tile", "value": "tile-{}.jpg".format(journal_id)}]}
+
+class TestDungeonCache(unittest.TestCase):
+    """Tests for `keystonescan.dungeon` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.index = [{"id": 375, "name": "Mists"}, {"id": 376, "name": "Necrotic Wake"}]
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.tmpdir.cleanup()
+
+    def test_000_details_served_from_cache(self):
+        """The second run makes no API calls."""
+        blizzapi = FakeBlizzard()
+        cache = DungeonCache(self.tmpdir.name)
+        first = keystonescan.get_cached_dungeon_details(blizzapi, self.index, cache, jobs=2)
+        self.assertEqual(blizzapi.calls, 5)
+        self.assertEqual([dungeon["id"] for dungeon in first], [375, 376])
+        self.assertEqual(first[0]["upgrade"], ["0:30:00", "0:24:00"])
+        self.assertEqual(first[1]["tile"], "tile-1376.jpg")
+
+        second = keystonescan.get_cached_dungeon_details(blizzapi, self.index, cache)
+        # only the season index is asked again
+        self.assertEqual(blizzapi.calls, 6)
+        self.assertEqual(first, second)
+
+    def test_001_index_change_invalidates(self):
+        """A new dungeon index or an expired entry forces a refresh."""
+        blizzapi = FakeBlizzard()
+        cache = DungeonCache(self.tmpdir.name, ttl=100)
+        cache.save(blizzapi, self.index, 6, [], now=1000)
+        self.assertEqual(cache.load(blizzapi, self.index, 6, now=1050), [])
+        self.assertIsNone(cache.load(blizzapi, self.index, 6, now=1100))
+        self.assertIsNone(cache.load(blizzapi, self.index[:1], 6, now=1050))
+
+    def test_002_new_season_invalidates(self):
+        """A new season with the same dungeons fetches the details again."""
+        blizzapi = FakeBlizzard()
+        cache = DungeonCache(self.tmpdir.name)
+        keystonescan.get_cached_dungeon_details(blizzapi, self.index, cache)
+        blizzapi.season = 7
+        keystonescan.get_cached_dungeon_details(blizzapi, self.index, cache)
+        self.assertEqual(blizzapi.calls, 10)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.httpcache` package."""
+
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from keystonescan.httpcache import HttpCache
+
+def response(status_code, body=b"", headers=None):
+    """Build a requests-like response."""
+    resp = mock.Mock(status_code=status_code, content=body, headers=headers or {})
+    resp.json = lambda: json.loads(body.decode("utf-8"))
+    return resp
+
+class TestHttpCache(unittest.TestCase):
+    """Tests for `keystonescan.httpcache` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.tmpdir.cleanup()
+
+    def test_000_not_modified_served_from_disk(self):
+        """A 304 returns the cached body and sends the stored validators."""
+        transport = mock.Mock()
+        transport.get.side_effect = [
+            response(200, b'{"id": 1}', {"ETag": '"v1"', "Last-Modified": "yesterday"}),
+            response(304),
+        ]
+        cache = HttpCache(self.tmpdir.name)
+        self.assertEqual(cache.get(transport, "https://x/a").json(), {"id": 1})
+
+        cache = HttpCache(self.tmpdir.name)
+        resp = cache.get(transport, "https://x/a")
+        self.assertEqual((resp.status_code, resp.json()), (200, {"id": 1}))
+        headers = transport.get.call_args[1]["headers"]
+        self.assertEqual(headers["If-None-Match"], '"v1"')
+        self.assertEqual(headers["If-Modified-Since"], "yesterday")
+        self.assertEqual(cache.hits, 1)
+
+    def test_001_lru_eviction(self):
+        """The least recently used body goes when the size cap is hit."""
+        cache = HttpCache(self.tmpdir.name, max_bytes=10)
+        for name in ("a", "b", "c"):
+            cache.store(HttpCache.key(name), response(200, b"12345", {"ETag": name}))
+        self.assertEqual(cache.validators(HttpCache.key("a")), {})
+        self.assertEqual(cache.validators(HttpCache.key("c")), {"If-None-Match": "c"})
+
+    def test_002_no_validators_not_cached(self):
+        """Responses without ETag or Last-Modified are not stored."""
+        cache = HttpCache(self.tmpdir.name)
+        cache.store(HttpCache.key("a"), response(200, b"{}"))
+        self.assertEqual(cache.validators(HttpCache.key("a")), {})
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.journal` package."""
+
+import os
+import json
+import tempfile
+import unittest
+
+from keystonescan import keystonescan
+from keystonescan.journal import ScanJournal
+from keystonescan.toons import Toon
+
+class TestScanJournal(unittest.TestCase):
+    """Tests for `keystonescan.journal` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, ScanJournal.file_name)
+        self.roster = [Toon("player", "realm", str(n)) for n in range(4)]
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.tmpdir.cleanup()
+
+    def scan(self, journal, fail_on=None):
+        """Scan the roster, returns the toons that were fetched."""
+        scanned = []
+        def scan_toon(toon, stale_groups):
+            if toon.name == fail_on:
+                raise RuntimeError("upstream down")
+            scanned.append(toon.name)
+            toon.weekly_completed_keys = [int(toon.name)]
+        keystonescan.scan_stale_toons(self.roster, ["weekly"], scan_toon, journal=journal)
+        return scanned
+
+    def test_000_resume_skips_finished_toons(self):
+        """A resumed scan only fetches the toons the failed scan did not finish."""
+        journal = ScanJournal(self.path, ["weekly"])
+        with self.assertRaises(RuntimeError):
+            self.scan(journal, fail_on="3")
+        journal.close()
+
+        self.roster = [Toon("player", "realm", str(n)) for n in range(4)]
+        journal = ScanJournal(self.path, ["weekly"], resume=True)
+        self.assertEqual(self.scan(journal), ["3"])
+        self.assertEqual(self.roster[1].weekly_completed_keys, [1])
+        journal.finish()
+
+        journal = ScanJournal(self.path, ["weekly"], resume=True)
+        self.assertEqual(len(self.scan(journal)), 4)
+        journal.close()
+
+    def test_001_other_groups_not_resumed(self):
+        """An epoch that fetched other data groups starts over."""
+        journal = ScanJournal(self.path, ["weekly"])
+        journal.record(self.roster[0])
+        journal.close()
+        journal = ScanJournal(self.path, ["completed", "weekly"], resume=True)
+        self.assertFalse(journal.restore(self.roster[0]))
+        journal.close()
+
+    def test_002_old_epoch_not_resumed(self):
+        """An unfinished epoch older than max_age starts over."""
+        journal = ScanJournal(self.path, ["weekly"])
+        journal.record(self.roster[0])
+        journal.close()
+        with open(self.path, mode="r") as journal_fd:
+            lines = journal_fd.readlines()
+        lines[0] = json.dumps({"epoch": journal.epoch - 2 * 60 * 60, "groups": ["weekly"]}) + "\n"
+        with open(self.path, mode="w") as journal_fd:
+            journal_fd.writelines(lines)
+
+        journal = ScanJournal(self.path, ["weekly"], resume=True, max_age=60 * 60)
+        self.assertFalse(journal.restore(self.roster[0]))
+        journal.close()
+        journal = ScanJournal(self.path, ["weekly"], resume=True)
+        self.assertFalse(journal.restore(self.roster[0]))
+        journal.close()
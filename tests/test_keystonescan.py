@@ -2,9 +2,19 @@
 
 """Tests for `keystonescan` package."""
 
+import os
+import json
+import time
+import tempfile
 import unittest
 
 from keystonescan import keystonescan
+from keystonescan.raideriorequest import RaiderIoApiError
+from keystonescan.breaker import CircuitOpenError
+from keystonescan.statestore import ToonStateStore
+from keystonescan.aggregate import KeystoneAggregate
+from keystonescan.toons import Toon
+from tests.test_toons import FakeRaiderIo
 
 class TestKeystoneScan(unittest.TestCase):
     """Tests for `keystonescan` package."""
@@ -17,3 +27,96 @@ class TestKeystoneScan(unittest.TestCase):
 
     def test_000_something(self):
         """Test something."""
+
+    def test_001_concurrent_scan_keeps_order(self):
+        """Toons come back in roster order no matter when they finish."""
+        roster = [Toon("player", "realm", str(n)) for n in range(8)]
+        finished = []
+        def scan_toon(toon):
+            time.sleep(0.001 * (8 - int(toon.name)))
+            finished.append(toon.name)
+        scanned = keystonescan.scan_concurrently(roster, scan_toon, jobs=4)
+        self.assertEqual([toon.name for toon in scanned], [str(n) for n in range(8)])
+        self.assertEqual(sorted(finished), [str(n) for n in range(8)])
+
+    def test_002_bad_request_skipped_per_toon(self):
+        """A raider.io 400 only drops the toon it belongs to."""
+        class RaiderIo():
+            """Fails for a single character."""
+            def character_profile(self, toon, fields, **kwargs):
+                """Return an empty profile or a 400."""
+                if toon.name == "missing":
+                    raise RaiderIoApiError(400, "Bad Request", "", "", {})
+                return {"mythic_plus_best_runs": [], "mythic_plus_alternate_runs": []}
+        roster = [Toon("player", "realm", name) for name in ("a", "missing", "b")]
+        with self.assertLogs(level="ERROR"):
+            scanned = keystonescan.scan_completed_keystones(RaiderIo(), roster, jobs=3)
+        self.assertEqual(len(scanned), 3)
+
+    def test_003_hard_error_stops_scan(self):
+        """Any other error is raised to the caller."""
+        def scan_toon(toon):
+            if toon.name == "1":
+                raise RaiderIoApiError(500, "Internal Server Error", "", "", {})
+        roster = [Toon("player", "realm", str(n)) for n in range(4)]
+        with self.assertRaises(RaiderIoApiError):
+            keystonescan.scan_concurrently(roster, scan_toon, jobs=2)
+
+    def test_004_one_request_per_toon(self):
+        """Completed and weekly data are fetched in the same request."""
+        raiderioapi = FakeRaiderIo()
+        roster = [Toon("player", "realm", name) for name in ("a", "b")]
+        keystonescan.scan_keystones(raiderioapi, roster, ["completed", "weekly"], jobs=2)
+        self.assertEqual(len(raiderioapi.calls), 2)
+        self.assertEqual(roster[1].weekly_completed_keys[0], 15)
+        self.assertEqual(roster[1].keystone_score, 1234.5)
+
+    def test_005_access_file_client_list(self):
+        """access.json may list several clients next to the single pair."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "access.json"), mode="w") as access_fd:
+                json.dump({"client_id": "a", "client_secret": "1",
+                           "clients": [{"client_id": "b", "client_secret": "2"}]}, access_fd)
+            self.assertEqual(keystonescan.get_api_credentials(tmpdir), [("a", "1"), ("b", "2")])
+
+    def test_006_open_circuit_serves_last_known_data(self):
+        """Characters behind an open circuit keep their stored data, marked stale."""
+        class RaiderIo():
+            """Up for the first scan only."""
+            def __init__(self):
+                self.down = False
+            def character_profile(self, toon, fields, **kwargs):
+                """Return the canned profile or fail like an open circuit."""
+                if self.down:
+                    raise CircuitOpenError("circuit open for raiderio")
+                return FakeRaiderIo().character_profile(toon, fields)
+        raiderioapi = RaiderIo()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ToonStateStore(os.path.join(tmpdir, ToonStateStore.file_name)) as store:
+                keystonescan.scan_keystones(raiderioapi, [Toon("player", "realm", "a")],
+                        ["completed"], state_store=store, incremental=False)
+                raiderioapi.down = True
+                with self.assertLogs(level="ERROR"):
+                    scanned = keystonescan.scan_keystones(raiderioapi,
+                            [Toon("player", "realm", "a"), Toon("player", "realm", "new")],
+                            ["completed"], jobs=2, state_store=store, incremental=False)
+        self.assertTrue(all(toon.stale for toon in scanned))
+        self.assertEqual(scanned[0].keystone_score, 1234.5)
+        self.assertEqual(scanned[1].keystone, {})
+        aggregate = KeystoneAggregate.build([], scanned, weekly=False)
+        self.assertEqual(aggregate.player_output(), [{"name": "player", "dungeons": [],
+                "stale": True}])
+
+    def test_007_error_cancels_remaining_toons(self):
+        """A failure late in the roster does not wait for earlier toons to finish."""
+        started = []
+        def scan_toon(toon):
+            started.append(toon.name)
+            if toon.name == "0":
+                time.sleep(0.2)
+            elif toon.name == "1":
+                raise RaiderIoApiError(500, "Internal Server Error", "", "", {})
+        roster = [Toon("player", "realm", str(n)) for n in range(50)]
+        with self.assertRaises(RaiderIoApiError):
+            keystonescan.scan_concurrently(roster, scan_toon, jobs=2)
+        self.assertLess(len(started), 10)
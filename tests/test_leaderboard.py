@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.leaderboard` package."""
+
+import random
+import unittest
+
+from keystonescan.leaderboard import Leaderboards, RankingIndex
+from keystonescan.toons import Toon
+from tests.test_aggregate import dungeon_defaults, run
+
+def character(name, levels, score, weekly):
+    """Toon with a run per dungeon level (0 for not run), a score and weekly keys."""
+    toon = Toon("player", "realm", name)
+    for dungeon, level in zip(("Mists", "Wake"), levels):
+        if level:
+            toon.keystone[dungeon] = dict(run(level, level * 10), name=dungeon)
+    toon.keystone_score = score
+    toon.weekly_completed_keys = sorted(weekly, reverse=True) + [0] * (8 - len(weekly))
+    return toon
+
+class TestLeaderboards(unittest.TestCase):
+    """Tests for `keystonescan.leaderboard` package."""
+
+    def test_000_ranking_index(self):
+        """Entries stay sorted best first while they are updated and removed."""
+        index = RankingIndex()
+        index.update("a", (10, 1), "a")
+        index.update("b", (12, 0), "b")
+        index.update("c", (10, 2), "c")
+        self.assertEqual(index.top(), ["b", "c", "a"])
+        index.update("a", (20, 0), "a")
+        index.remove("b")
+        index.remove("unknown")
+        self.assertEqual(index.top(), ["a", "c"])
+        self.assertEqual(index.top(1), ["a"])
+        self.assertEqual(len(index), 2)
+
+    def test_001_rankings(self):
+        """Dungeon, score and weekly rankings list the best first."""
+        characters = [character("low", (10, 0), 900.0, [10]),
+                      character("high", (15, 12), 1500.0, [12, 11, 10, 10, 9, 8, 7, 2]),
+                      character("none", (0, 0), 0, [])]
+        output = Leaderboards.build(dungeon_defaults(), characters, top=1).output()
+        self.assertEqual(output["top"], 1)
+        mists, wake = output["dungeons"]
+        self.assertEqual(mists["level"], [["player", "High", "realm", 15, 150, 15000]])
+        self.assertEqual(wake["rating"], [["player", "High", "realm", 12, 120, 12000]])
+        self.assertEqual(output["score"], [["player", "High", "realm", 1500.0],
+                                           ["player", "Low", "realm", 900.0]])
+        self.assertEqual(output["weekly"], [["player", "High", "realm", 3, 12, 10, 2, 8],
+                                            ["player", "Low", "realm", 1, 10, 0, 0, 1]])
+
+    def test_002_incremental_matches_rebuild(self):
+        """Re-adding changed characters gives the same output as a full rebuild."""
+        rand = random.Random(1)
+        def random_character(name):
+            return character(name, (rand.randint(0, 20), rand.randint(0, 20)),
+                    rand.uniform(0, 3000), [rand.randint(2, 20) for _ in range(rand.randint(0, 8))])
+        characters = [random_character("toon{}".format(n)) for n in range(40)]
+        leaderboards = Leaderboards.build(dungeon_defaults(), characters, top=5)
+        for _ in range(3):
+            for index in rand.sample(range(len(characters)), 5):
+                characters[index] = random_character(characters[index].name)
+                leaderboards.add(characters[index])
+        self.assertEqual(leaderboards.output(),
+                Leaderboards.build(dungeon_defaults(), characters, top=5).output())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.metrics` package."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+from keystonescan.metrics import RequestMetrics
+from keystonescan.transport import HttpTransport
+
+def response(status, body=b"{}", headers=None):
+    """Build a bare response."""
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers.update(headers or {})
+    resp._content = body # pylint: disable=protected-access
+    return resp
+
+class TestRequestMetrics(unittest.TestCase):
+    """Tests for `keystonescan.metrics` package."""
+
+    def test_000_histogram_and_status(self):
+        """Attempts land in cumulative latency buckets and status counts."""
+        metrics = RequestMetrics(buckets=(0.1, 1.0))
+        metrics.observe("raiderio_character_profile", 200, 0.05, 100)
+        metrics.observe("raiderio_character_profile", 429, 0.5, 10)
+        metrics.observe("raiderio_character_profile", None, 3.0)
+        stats = metrics.snapshot()["raiderio_character_profile"]
+        self.assertEqual(stats["calls"], 3)
+        self.assertEqual(stats["errors"], 1)
+        self.assertEqual(stats["bytes"], 110)
+        self.assertEqual(stats["status"], {"200": 1, "429": 1})
+        self.assertEqual(stats["latency"], {"0.1": 1, "1.0": 2, "+Inf": 3})
+
+    def test_001_transport_counts_retries(self):
+        """The transport observes every attempt under its endpoint."""
+        metrics = RequestMetrics()
+        transport = HttpTransport(metrics=metrics, sleep=lambda delay: None)
+        with mock.patch.object(transport.session, "request",
+                side_effect=[response(429, headers={"Retry-After": "0"}), response(200, b"abc")]):
+            transport.get("https://raider.io/api/v1/characters/profile",
+                    limit_key="raiderio", endpoint="raiderio_character_profile")
+        stats = metrics.snapshot()["raiderio_character_profile"]
+        self.assertEqual(stats["calls"], 2)
+        self.assertEqual(stats["retries"], 1)
+        self.assertEqual(stats["bytes"], 5)
+
+    def test_002_prometheus_textfile(self):
+        """The textfile holds labelled counters and a histogram per endpoint."""
+        metrics = RequestMetrics(buckets=(0.1,))
+        metrics.observe("oauth_token", 200, 0.01, 10)
+        metrics.cache("blizzard_mythic_keystone_dungeon", True)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "keystonescan.prom")
+            metrics.write_prometheus(path)
+            with open(path) as prom_fd:
+                text = prom_fd.read()
+        self.assertIn('keystonescan_requests_total{endpoint="oauth_token",status="200"} 1', text)
+        self.assertIn('keystonescan_request_duration_seconds_bucket{endpoint="oauth_token",le="+Inf"} 1',
+                text)
+        self.assertIn('keystonescan_cache_hits_total{endpoint="blizzard_mythic_keystone_dungeon"} 1',
+                text)
+        self.assertIn("requests: 1 calls", metrics.summary())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.output` package."""
+
+import os
+import gzip
+import json
+import tempfile
+import unittest
+
+from keystonescan.output import OutputWriter
+
+class TestOutputWriter(unittest.TestCase):
+    """Tests for `keystonescan.output` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        """Path in the output dir."""
+        return os.path.join(self.tmpdir.name, name)
+
+    def test_000_unchanged_content_skipped(self):
+        """Identical content is not rewritten, even by a new writer."""
+        self.assertTrue(OutputWriter(self.tmpdir.name).write_json("players.json", [{"a": 1}]))
+        with open(self.path("players.json"), mode="rb") as players_fd:
+            self.assertEqual(players_fd.read(), b'[{"a":1}]')
+
+        writer = OutputWriter(self.tmpdir.name)
+        self.assertFalse(writer.write_json("players.json", [{"a": 1}]))
+        self.assertTrue(writer.write_json("players.json", [{"a": 2}]))
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ["players.json"])
+
+    def test_001_variants_and_manifest(self):
+        """Compressed siblings and the manifest follow the content."""
+        writer = OutputWriter(self.tmpdir.name, compress=["gz"], manifest=True)
+        writer.write_json("weekly.json", {"b": [1, 2]})
+        with gzip.open(self.path("weekly.json.gz")) as gz_fd:
+            self.assertEqual(json.loads(gz_fd.read().decode("utf-8")), {"b": [1, 2]})
+        with open(self.path("manifest.json")) as manifest_fd:
+            manifest = json.load(manifest_fd)
+        self.assertEqual(manifest["weekly.json"]["size"], os.path.getsize(self.path("weekly.json")))
+
+        os.remove(self.path("weekly.json.gz"))
+        self.assertTrue(writer.write_json("weekly.json", {"b": [1, 2]}))
+        self.assertTrue(os.path.exists(self.path("weekly.json.gz")))
+
+    def test_002_unconfigured_variants_removed(self):
+        """Variants no longer configured are deleted, the manifest lists the others."""
+        writer = OutputWriter(self.tmpdir.name, compress=["gz"], manifest=True)
+        writer.write_json("weekly.json", [1])
+        with open(self.path("manifest.json")) as manifest_fd:
+            self.assertEqual(json.load(manifest_fd)["weekly.json"]["variants"], [".gz"])
+
+        writer = OutputWriter(self.tmpdir.name, manifest=True)
+        self.assertTrue(writer.write_json("weekly.json", [1]))
+        self.assertFalse(os.path.exists(self.path("weekly.json.gz")))
+        self.assertFalse(writer.write_json("weekly.json", [1]))
+        with open(self.path("manifest.json")) as manifest_fd:
+            self.assertEqual(json.load(manifest_fd)["weekly.json"]["variants"], [])
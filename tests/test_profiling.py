@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.profiling` package."""
+
+import os
+import pstats
+import tempfile
+import threading
+import unittest
+
+from keystonescan import profiling
+
+class FakeClock():
+    """Clock advanced by hand."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestProfiling(unittest.TestCase):
+    """Tests for `keystonescan.profiling` package."""
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        profiling.stop()
+
+    def test_000_nested_spans(self):
+        """Spans nest into paths and child time is not self time."""
+        clock = FakeClock()
+        profiler = profiling.start(clock)
+        with profiling.span("toon"):
+            clock.now += 1
+            with profiling.span("http"):
+                clock.now += 3
+        spans = profiler.spans()
+        self.assertEqual(spans["toon"]["total"], 4)
+        self.assertEqual(spans["toon"]["self"], 1)
+        self.assertEqual(spans["toon;http"]["calls"], 1)
+        self.assertEqual(profiler.folded(), "toon 1000000\ntoon;http 3000000\n")
+
+    def test_001_spans_per_thread(self):
+        """Worker threads keep their own span stack."""
+        def scan_toon():
+            with profiling.span("toon"):
+                pass
+        profiler = profiling.start()
+        with profiling.span("scan"):
+            worker = threading.Thread(target=scan_toon)
+            worker.start()
+            worker.join()
+            with profiling.span("output"):
+                pass
+        self.assertIn("scan;output", profiler.spans())
+        self.assertIn("toon", profiler.spans())
+        self.assertNotIn("scan;toon", profiler.spans())
+
+    def test_002_disabled(self):
+        """Without a profiler spans do nothing."""
+        with profiling.span("toon"):
+            pass
+        self.assertIsNone(profiling._profiler) # pylint: disable=protected-access
+
+    def test_003_profile_dir(self):
+        """A profiled block leaves cProfile stats and folded spans behind."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with profiling.profile(tmpdir):
+                with profiling.span("output"):
+                    sorted(range(1000))
+            pstats.Stats(os.path.join(tmpdir, "cprofile.pstats"))
+            with open(os.path.join(tmpdir, "spans.folded")) as folded_fd:
+                self.assertIn("total;output ", folded_fd.read())
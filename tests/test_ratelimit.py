@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.ratelimit` package."""
+
+import unittest
+from unittest import mock
+
+from keystonescan.ratelimit import RateLimiter, TokenBucket, parse_retry_after
+from keystonescan.transport import HttpTransport
+
+class FakeClock():
+    """Clock that only moves when someone sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        """Advance the clock."""
+        self.slept.append(seconds)
+        self.now += seconds
+
+class TestRateLimit(unittest.TestCase):
+    """Tests for `keystonescan.ratelimit` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.clock = FakeClock()
+
+    def test_000_bucket_limits_rate(self):
+        """After the burst is spent calls are spaced by the rate."""
+        bucket = TokenBucket(2, capacity=2, clock=self.clock, sleep=self.clock.sleep)
+        for _ in range(4):
+            bucket.acquire()
+        self.assertAlmostEqual(self.clock.now, 1.0)
+        self.assertEqual(bucket.stats()["acquired"], 4)
+
+    def test_001_throttle_adapts_and_honors_retry_after(self):
+        """A 429 halves the rate and blocks for Retry-After."""
+        bucket = TokenBucket(10, clock=self.clock, sleep=self.clock.sleep)
+        bucket.on_throttled(retry_after=30)
+        self.assertEqual(bucket.rate, 5)
+        bucket.acquire()
+        self.assertGreaterEqual(self.clock.now, 30)
+        for _ in range(10):
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 10)
+
+    def test_002_budgets_per_key(self):
+        """Regional budgets fall back to the rate of their prefix."""
+        limiter = RateLimiter({"blizzard": 50}, clock=self.clock, sleep=self.clock.sleep)
+        self.assertIs(limiter.bucket("blizzard-us"), limiter.bucket("blizzard-us"))
+        self.assertIsNot(limiter.bucket("blizzard-us"), limiter.bucket("blizzard-eu"))
+        self.assertEqual(limiter.bucket("blizzard-eu").max_rate, 50)
+        self.assertEqual(sorted(limiter.stats()), ["blizzard-eu", "blizzard-us"])
+
+    def test_003_parse_retry_after(self):
+        """Retry-After can be seconds or an HTTP date."""
+        self.assertEqual(parse_retry_after("3"), 3)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+
+    def test_004_transport_retries_throttled_calls(self):
+        """The transport retries a 429 and records it against the budget."""
+        limiter = RateLimiter(clock=self.clock, sleep=self.clock.sleep)
+        transport = HttpTransport(rate_limiter=limiter, sleep=self.clock.sleep)
+        throttled = mock.Mock(status_code=429, headers={"Retry-After": "2"})
+        success = mock.Mock(status_code=200, headers={})
+        with mock.patch.object(transport.session, "request", side_effect=[throttled, success]):
+            resp = transport.get("https://raider.io/api/v1", limit_key="raiderio")
+        self.assertIs(resp, success)
+        self.assertGreaterEqual(self.clock.slept[0], 2)
+        stats = limiter.stats()["raiderio"]
+        self.assertEqual((stats["throttled"], stats["retries"]), (1, 1))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.server` package."""
+
+import gzip
+import json
+import logging
+import tempfile
+import unittest
+import http.client
+
+from keystonescan.output import OutputWriter
+from keystonescan.server import OutputStore, OutputServer, accepts_gzip
+
+class TestOutputServer(unittest.TestCase):
+    """Tests for `keystonescan.server` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = OutputStore()
+        self.writer = OutputWriter(self.tmpdir.name, store=self.store)
+        self.server = OutputServer(self.store, port=0)
+        self.server.start()
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.server.stop()
+        self.tmpdir.cleanup()
+
+    def get(self, connection, path, **headers):
+        """GET a path, returns the response and its body."""
+        connection.request("GET", path, headers=headers)
+        resp = connection.getresponse()
+        return (resp, resp.read())
+
+    def test_000_swap_publishes_staged_files_at_once(self):
+        """Written files are only served after publish."""
+        self.writer.write_json("players.json", [{"name": "a"}])
+        self.assertIsNone(self.store.get("players.json"))
+        self.writer.publish()
+        first = self.store.get("players.json")
+        self.writer.write_json("players.json", [{"name": "a"}])
+        self.writer.publish()
+        self.assertIs(self.store.get("players.json"), first)
+        self.writer.write_json("players.json", [{"name": "b"}])
+        self.writer.publish()
+        self.assertNotEqual(self.store.get("players.json").etag, first.etag)
+
+    def test_001_etag_gzip_and_304(self):
+        """Documents are served with a strong ETag, gzip when asked and 304s."""
+        self.writer.write_json("players.json", [{"name": "a"}])
+        self.writer.publish()
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.port)
+        try:
+            resp, body = self.get(connection, "/players.json", **{"Accept-Encoding": "gzip"})
+            self.assertEqual(resp.status, 200)
+            self.assertEqual(resp.getheader("Content-Encoding"), "gzip")
+            self.assertEqual(json.loads(gzip.decompress(body).decode()), [{"name": "a"}])
+            etag = resp.getheader("ETag")
+            self.assertFalse(etag.startswith("W/"))
+
+            resp, body = self.get(connection, "/players.json",
+                    **{"If-None-Match": etag, "Accept-Encoding": "gzip"})
+            self.assertEqual((resp.status, body), (304, b""))
+            # the identity body has its own ETag
+            resp, body = self.get(connection, "/players.json", **{"If-None-Match": etag})
+            self.assertEqual(resp.status, 200)
+            self.assertNotEqual(resp.getheader("ETag"), etag)
+            self.assertEqual(json.loads(body.decode()), [{"name": "a"}])
+
+            # hot swap, the old ETag no longer matches
+            self.writer.write_json("players.json", [{"name": "b"}])
+            self.writer.publish()
+            resp, body = self.get(connection, "/players.json", **{"If-None-Match": etag})
+            self.assertEqual(resp.status, 200)
+            self.assertIsNone(resp.getheader("Content-Encoding"))
+            self.assertEqual(json.loads(body.decode()), [{"name": "b"}])
+
+            self.assertEqual(self.get(connection, "/missing.json")[0].status, 404)
+        finally:
+            connection.close()
+        self.assertEqual(self.server.requests, 5)
+
+    def test_002_accept_encoding(self):
+        """gzip is used unless refused with q=0."""
+        self.assertTrue(accepts_gzip("gzip, deflate, br"))
+        self.assertTrue(accepts_gzip("*"))
+        self.assertFalse(accepts_gzip("gzip;q=0, identity"))
+        self.assertFalse(accepts_gzip("*, gzip;q=0"))
+        self.assertFalse(accepts_gzip(""))
+
+    def test_003_stop_with_open_connection(self):
+        """Stopping closes keep-alive connections still open."""
+        self.writer.write_json("players.json", [])
+        self.writer.publish()
+        connection = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logging.getLogger("asyncio").addHandler(handler)
+        try:
+            self.assertEqual(self.get(connection, "/players.json")[0].status, 200)
+            self.server.stop()
+            # the cancelled connection handler must not log a traceback
+            self.assertEqual(records, [])
+            with self.assertRaises((http.client.HTTPException, OSError)):
+                self.get(connection, "/players.json")
+        finally:
+            connection.close()
+            logging.getLogger("asyncio").removeHandler(handler)
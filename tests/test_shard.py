@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.shard` package."""
+
+import os
+import json
+import tempfile
+import unittest
+
+from keystonescan import keystonescan
+from keystonescan.ratelimit import RateLimiter
+from keystonescan.shard import (ShardError, parse_shard, select_shard, partial_name,
+        partial_output, load_partials)
+from keystonescan.toons import Toon
+from benchmarks.fakeserver import FakeUpstreamServer, LocalTransport
+from benchmarks.bench_scan import write_inputs
+
+class TestShard(unittest.TestCase):
+    """Tests for `keystonescan.shard` package."""
+
+    def test_000_parse_shard(self):
+        """Shards are numbered 1 to N."""
+        self.assertEqual(parse_shard("2/3"), (2, 3))
+        for value in ("0/3", "4/3", "3", "a/b"):
+            with self.assertRaises(ShardError):
+                parse_shard(value)
+
+    def test_001_partition(self):
+        """Every toon lands in exactly one shard, the same one every time."""
+        roster = [Toon("player", "realm{}".format(n % 3), "toon{}".format(n)) for n in range(50)]
+        parts = [select_shard(roster, (index, 4)) for index in range(1, 5)]
+        self.assertEqual(sorted(toon.name for part in parts for toon in part),
+                sorted(toon.name for toon in roster))
+        self.assertTrue(all(parts))
+        self.assertEqual(parts[1], select_shard(list(reversed(roster)), (2, 4))[::-1])
+
+    def test_002_merge_matches_unsharded_scan(self):
+        """Merged shards write the same outputs as one scan of the whole roster."""
+        server = FakeUpstreamServer(seed=1)
+        server.start()
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                outputs = {}
+                for name, shards in (("whole", [None]), ("sharded", [(1, 3), (2, 3), (3, 3)])):
+                    input_dir = os.path.join(tmpdir, name, "input")
+                    output_dir = os.path.join(tmpdir, name, "output")
+                    os.makedirs(input_dir)
+                    os.makedirs(output_dir)
+                    write_inputs(input_dir, 30)
+                    for shard in shards:
+                        transport = LocalTransport(server.base_url, rate_limiter=RateLimiter(
+                                {"raiderio": 1000, "blizzard": 1000, "oauth": 1000}))
+                        with self.assertLogs(level="INFO"):
+                            keystonescan.scan(input_dir, output_dir, character=True,
+                                    player=True, weekly=True, jobs=4, transport=transport,
+                                    shard=shard)
+                        transport.close()
+                    if name == "sharded":
+                        with self.assertRaises(ShardError):
+                            keystonescan.merge(output_dir, output_dir, dungeon=True)
+                        with self.assertLogs(level="INFO"):
+                            keystonescan.merge(output_dir, output_dir, character=True,
+                                    player=True, weekly=True)
+                    outputs[name] = {}
+                    for output in ("players.json", "characters.json", "weekly.json"):
+                        with open(os.path.join(output_dir, output)) as output_fd:
+                            outputs[name][output] = json.load(output_fd)
+                self.assertEqual(outputs["sharded"], outputs["whole"])
+        finally:
+            server.stop()
+
+    def test_003_partials_of_different_rosters(self):
+        """Shards that read different toons.json are not merged."""
+        roster = [Toon("player", "realm", "toon{}".format(n)) for n in range(10)]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for shard, shard_roster in (((1, 2), roster), ((2, 2), roster[:-1])):
+                with open(os.path.join(tmpdir, partial_name(shard)), mode="w") as partial_fd:
+                    json.dump(partial_output(shard, shard_roster,
+                            select_shard(shard_roster, shard), [], [], None, 0), partial_fd)
+            with self.assertRaises(ShardError):
+                load_partials(tmpdir)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.sources` package."""
+
+import unittest
+
+from keystonescan.raideriorequest import RaiderIoApiError, RaiderIoThrottlingError
+from keystonescan.blizzrequest import BlizzardApiRequest
+from keystonescan.sources import BlizzardSource, FailoverSource
+from keystonescan.toons import Toon
+from tests.test_toons import raiderio_profile
+
+def blizzard_run(dungeon, level, affix, rating):
+    """Build a blizzard mythic keystone profile best run."""
+    return {"dungeon": {"id": 1, "name": dungeon}, "keystone_level": level, "duration": 1800000,
+            "keystone_affixes": [{"name": affix}, {"name": "Bolstering"}],
+            "mythic_rating": {"rating": rating}}
+
+class FakeBlizzardApi():
+    """Stand-in for a regional `BlizzardApiRequest`."""
+    region = "eu"
+
+    def mythic_keystone_season_index(self):
+        """Current season"""
+        return {"current_season": {"id": 7}}
+
+    def mythic_keystone_profile_detail(self, toon, season, **kwargs):
+        """Season best runs"""
+        assert season == 7
+        return {"best_runs": [blizzard_run("Plaguefall", 14, "Fortified", 110.0),
+                              blizzard_run("Plaguefall", 15, "Tyrannical", 120.0),
+                              blizzard_run("Mists of Tirna Scithe", 12, "Fortified", 100.0)],
+                "mythic_rating": {"rating": 1234.5}}
+
+    def mythic_keystone_profile_index(self, toon, **kwargs):
+        """Runs this week"""
+        return {"current_period": {"best_runs": [{"keystone_level": level}
+                for level in (10, 15, 12)]}}
+
+class FakeRegions():
+    """Stand-in for `BlizzardRegionClients`."""
+
+    def get(self, region):
+        """The one fake client"""
+        return FakeBlizzardApi()
+
+class FakeSource():
+    """Source failing with a given error."""
+
+    def __init__(self, name, error=None):
+        self.name = name
+        self.error = error
+        self.calls = 0
+
+    def character_profile(self, toon, fields, **kwargs):
+        """Fail or answer with the canned raider.io profile."""
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return raiderio_profile()
+
+class TestSources(unittest.TestCase):
+    """Tests for `keystonescan.sources` package."""
+
+    def test_000_blizzard_profile_parses_like_raiderio(self):
+        """A toon parsed from the blizzard source matches the raider.io profile."""
+        from_raiderio = Toon("player", "realm", "toon")
+        from_raiderio.parse_mythic_keystone(raiderio_profile())
+        from_raiderio.parse_weekly_keystone(raiderio_profile())
+        from_blizzard = Toon("player", "realm", "toon", "eu")
+        from_blizzard.get_keystone_profile(BlizzardSource(FakeRegions()))
+        self.assertEqual(from_blizzard.get_state("completed"), from_raiderio.get_state("completed"))
+        self.assertEqual(from_blizzard.weekly_completed_keys, from_raiderio.weekly_completed_keys)
+
+    def test_001_failover(self):
+        """A throttled source is skipped until its cooldown passed."""
+        now = [0]
+        raiderio = FakeSource("raiderio", RaiderIoThrottlingError(429))
+        blizzard = FakeSource("blizzard")
+        source = FailoverSource([raiderio, blizzard], cooldown=60, clock=lambda: now[0])
+        toon = Toon("player", "realm", "toon")
+        with self.assertLogs(level="WARNING"):
+            source.character_profile(toon, [])
+        source.character_profile(toon, [])
+        self.assertEqual((raiderio.calls, blizzard.calls), (1, 2))
+        now[0] = 61
+        raiderio.error = None
+        source.character_profile(toon, [])
+        self.assertEqual((raiderio.calls, blizzard.calls), (2, 2))
+
+    def test_002_unknown_character_does_not_fail_over(self):
+        """A raider.io 400 is about the character, not the source."""
+        blizzard = FakeSource("blizzard")
+        source = FailoverSource([FakeSource("raiderio",
+                RaiderIoApiError(400, "Bad Request", "", "", {})), blizzard])
+        with self.assertRaises(RaiderIoApiError):
+            source.character_profile(Toon("player", "realm", "toon"), [])
+        self.assertEqual(blizzard.calls, 0)
+
+    def test_003_balance(self):
+        """Balanced requests alternate between the sources."""
+        raiderio, blizzard = FakeSource("raiderio"), FakeSource("blizzard")
+        source = FailoverSource([raiderio, blizzard], balance=True)
+        for _ in range(4):
+            source.character_profile(Toon("player", "realm", "toon"), [])
+        self.assertEqual((raiderio.calls, blizzard.calls), (2, 2))
+
+    def test_004_blizzard_character_path(self):
+        """Profile urls use the lowercase realm slug and character name."""
+        self.assertEqual(BlizzardApiRequest.character_path(Toon("player", "Area 52", "Main")),
+                "area-52/main")
+        self.assertEqual(BlizzardApiRequest.character_path(Toon("player", "Mal'Ganis", "Bjørn")),
+                "malganis/bj%C3%B8rn")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.statestore` package."""
+
+import os
+import tempfile
+import unittest
+
+from keystonescan import keystonescan
+from keystonescan.statestore import ToonStateStore
+from keystonescan.toons import Toon
+
+class TestToonStateStore(unittest.TestCase):
+    """Tests for `keystonescan.statestore` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ToonStateStore(os.path.join(self.tmpdir.name, ToonStateStore.file_name))
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_000_round_trip(self):
+        """A saved group restores onto a new toon."""
+        toon = Toon("player", "realm", "toon")
+        toon.keystone = {"Plaguefall": {"level": 15}}
+        toon.keystone_score = 1500
+        self.store.save(toon, "completed", 1000)
+
+        restored = Toon("other player", "realm", "toon")
+        self.assertTrue(self.store.restore(restored, "completed", fresh_after=900))
+        self.assertEqual(restored.keystone, toon.keystone)
+        self.assertEqual(restored.keystone_score, 1500)
+        self.assertFalse(self.store.restore(restored, "completed", fresh_after=1001))
+        self.assertFalse(self.store.restore(restored, "weekly"))
+
+    def test_001_only_stale_toons_scanned(self):
+        """Incremental scans skip toons with fresh stored data."""
+        roster = [Toon("player", "realm", name) for name in ("fresh", "stale")]
+        roster[0].weekly_completed_keys = [15] + [0] * 7
+        self.store.save(roster[0], "weekly", 2 ** 40)
+
+        scanned = []
+        def scan_toon(toon, stale_groups):
+            scanned.append((toon.name, stale_groups))
+            toon.weekly_completed_keys = [10] + [0] * 7
+
+        keystonescan.scan_stale_toons(roster, ["weekly"], scan_toon,
+                state_store=self.store, stale_after=3600)
+        self.assertEqual(scanned, [("stale", ["weekly"])])
+        self.assertEqual(roster[0].weekly_completed_keys[0], 15)
+        self.assertEqual(self.store.load(roster[1], "weekly")[0],
+                {"weekly_completed_keys": [10] + [0] * 7})
+
+    def test_002_weekly_not_restored_after_reset(self):
+        """Weekly keys of last week are not restored, however young they are."""
+        # Tuesday 2021-03-09 14:00 UTC, one hour before the US reset
+        before_reset = 1615298400
+        toon = Toon("player", "realm", "toon")
+        toon.weekly_completed_keys = [15] + [0] * 7
+        self.store.save(toon, "weekly", before_reset)
+        restored = Toon("player", "realm", "toon")
+        self.assertTrue(self.store.restore(restored, "weekly", fresh_after=0,
+                now=before_reset + 30 * 60))
+        self.assertFalse(self.store.restore(restored, "weekly", fresh_after=0,
+                now=before_reset + 2 * 60 * 60))
+        # the EU reset is not until Wednesday
+        eu_toon = Toon("player", "realm", "toon", "eu")
+        self.store.save(eu_toon, "weekly", before_reset)
+        self.assertTrue(self.store.restore(eu_toon, "weekly", now=before_reset + 2 * 60 * 60))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.toons` package."""
+
+import os
+import json
+import tempfile
+import unittest
+
+from keystonescan.toons import Toon
+
+def raiderio_run(dungeon, level, affix, score, clear_time_ms=1800000):
+    """Build a raider.io run record."""
+    return {
+        "dungeon": dungeon,
+        "mythic_level": level,
+        "clear_time_ms": clear_time_ms,
+        "score": score,
+        "affixes": [{"name": affix}],
+    }
+
+def raiderio_profile():
+    """Build a raider.io profile holding every field group keystonescan uses."""
+    return {
+        "mythic_plus_best_runs": [
+            raiderio_run("Plaguefall", 15, "Tyrannical", 120.0),
+            raiderio_run("Mists of Tirna Scithe", 12, "Fortified", 100.0),
+        ],
+        "mythic_plus_alternate_runs": [
+            raiderio_run("Plaguefall", 14, "Fortified", 110.0),
+        ],
+        "mythic_plus_scores_by_season": [{"scores": {"all": 1234.5}}],
+        "mythic_plus_weekly_highest_level_runs": [
+            {"mythic_level": 10}, {"mythic_level": 15}, {"mythic_level": 12},
+        ],
+    }
+
+class FakeRaiderIo():
+    """Stand-in for `RaiderIoApiRequest` that counts profile requests."""
+
+    def __init__(self):
+        self.calls = []
+
+    def character_profile(self, toon, fields, **kwargs):
+        """Return the canned profile."""
+        self.calls.append((toon.slug(), tuple(fields)))
+        return raiderio_profile()
+
+class TestToon(unittest.TestCase):
+    """Tests for `keystonescan.toons` package."""
+
+    def test_000_single_profile_request(self):
+        """Completed and weekly data come from one request."""
+        raiderioapi = FakeRaiderIo()
+        toon = Toon("player", "area-52", "toon")
+        toon.get_keystone_profile(raiderioapi)
+
+        self.assertEqual(len(raiderioapi.calls), 1)
+        self.assertEqual(set(raiderioapi.calls[0][1]),
+                set(Toon.completed_fields + Toon.weekly_fields))
+        self.assertEqual(toon.keystone_score, 1234.5)
+        self.assertEqual(toon.keystone["Plaguefall"]["level"], 15)
+        self.assertEqual(toon.keystone["Plaguefall"]["rating"],
+                {"tyrannical": 120.0, "fortified": 110.0, "total": 235})
+        self.assertEqual(toon.keystone["Mists of Tirna Scithe"]["rating"]["total"], 150)
+        self.assertEqual(toon.weekly_completed_keys, [15, 12, 10, 0, 0, 0, 0, 0])
+
+    def test_001_reparse_replaces_data(self):
+        """Parsing a profile again does not accumulate weekly keys."""
+        toon = Toon("player", "area-52", "toon")
+        toon.parse_weekly_keystone(raiderio_profile())
+        toon.parse_weekly_keystone(raiderio_profile())
+        self.assertEqual(toon.weekly_completed_keys, [15, 12, 10, 0, 0, 0, 0, 0])
+
+    def test_002_roster_regions(self):
+        """toons.json may group realms by region, plain realms get the default region."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "toons.json"), mode="w") as toon_fd:
+                json.dump({"player": {"area-52": ["main"],
+                                      "eu": {"area-52": ["main"], "silvermoon": ["alt"]}}}, toon_fd)
+            roster = Toon.scan(tmpdir, region="kr")
+        self.assertEqual(sorted(toon.slug() for toon in roster),
+                [("eu", "area-52", "main"), ("eu", "silvermoon", "alt"), ("kr", "area-52", "main")])
+
+    def test_003_roster_duplicates(self):
+        """A character listed under several players is one toon with every player."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "toons.json"), mode="w") as toon_fd:
+                json.dump({"alice": {"realm": ["shared", "main"]},
+                           "bob": {"realm": ["shared"], "us": {"realm": ["shared"]}}}, toon_fd)
+            roster = Toon.scan(tmpdir)
+        self.assertEqual(len(roster), 2)
+        shared = [toon for toon in roster if toon.name == "shared"][0]
+        self.assertEqual(shared.players, ["alice", "bob"])
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.transport` package."""
+
+import unittest
+from unittest import mock
+
+from keystonescan.transport import HttpTransport, default_transport
+
+class TestHttpTransport(unittest.TestCase):
+    """Tests for `keystonescan.transport` package."""
+
+    def test_000_default_timeout(self):
+        """Requests get the transport timeout unless one is given."""
+        transport = HttpTransport(timeout=3)
+        with mock.patch.object(transport.session, "request") as request:
+            transport.get("https://example.invalid/")
+            request.assert_called_with("GET", "https://example.invalid/", timeout=3)
+            transport.post("https://example.invalid/", timeout=9)
+            request.assert_called_with("POST", "https://example.invalid/", timeout=9)
+
+    def test_001_pool_size(self):
+        """Every https host shares the configured pool size."""
+        transport = HttpTransport(pool_size=4)
+        adapter = transport.session.get_adapter("https://raider.io/")
+        self.assertEqual(adapter._pool_maxsize, 4) # pylint: disable=protected-access
+
+    def test_002_default_transport_shared(self):
+        """The fallback transport is created once."""
+        self.assertIs(default_transport(), default_transport())
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""Tests for `keystonescan.watcher` package."""
+
+import os
+import json
+import tempfile
+import unittest
+
+from keystonescan.output import OutputWriter
+from keystonescan.toons import Toon
+from keystonescan.watcher import RefreshScheduler, Watcher
+
+class FakeBlizzard():
+    """Stand-in for `BlizzardApiRequest` with a fixed dungeon index."""
+
+    def mythic_keystone_dungeon_index(self):
+        """Two dungeons."""
+        return {"dungeons": [{"id": 375, "name": "Mists"}, {"id": 376, "name": "Wake"}]}
+
+class FakeRaiderIo():
+    """Stand-in for `RaiderIoApiRequest` where only `active` plays."""
+
+    def __init__(self):
+        self.level = 10
+        self.playing = True
+
+    def character_profile(self, toon, fields, **kwargs):
+        """Weekly runs, `active` gains a higher key every call while playing."""
+        if toon.name == "active":
+            self.level += 1 if self.playing else 0
+            return {"mythic_plus_weekly_highest_level_runs": [{"mythic_level": self.level}]}
+        return {"mythic_plus_weekly_highest_level_runs": [{"mythic_level": 10}]}
+
+class TestWatcher(unittest.TestCase):
+    """Tests for `keystonescan.watcher` package."""
+
+    def setUp(self):
+        """Set up test fixtures, if any."""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmpdir.name, "toons.json"), mode="w") as toon_fd:
+            json.dump({"player": {"realm": ["active", "idle"]}}, toon_fd)
+
+    def tearDown(self):
+        """Tear down test fixtures, if any."""
+        self.tmpdir.cleanup()
+
+    def test_000_scheduler_backoff(self):
+        """Idle toons back off exponentially, active ones reset."""
+        scheduler = RefreshScheduler(10, 35)
+        toon = Toon("player", "realm", "toon")
+        scheduler.schedule(toon, 0)
+        self.assertEqual(scheduler.pop_due(0), [toon])
+        for expected in (20, 35, 35):
+            scheduler.reschedule(toon, False, 0)
+            self.assertEqual(scheduler.next_due(), expected)
+            scheduler.pop_due(expected)
+        scheduler.reschedule(toon, True, 0)
+        self.assertEqual(scheduler.next_due(), 10)
+
+    def test_001_outputs_rewritten_on_change(self):
+        """weekly.json is only written when a weekly key changed."""
+        clock = [1000]
+        watcher = Watcher(self.tmpdir.name, OutputWriter(self.tmpdir.name), FakeBlizzard(), FakeRaiderIo(),
+                RefreshScheduler(10, 1000), weekly=True, clock=lambda: clock[0])
+        weekly_file = os.path.join(self.tmpdir.name, "weekly.json")
+
+        self.assertEqual(watcher.run_once(), 10)
+        self.assertTrue(os.path.exists(weekly_file))
+        os.remove(weekly_file)
+
+        # only the active toon changed, it is polled again at the minimum interval
+        clock[0] += 10
+        watcher.run_once()
+        self.assertTrue(os.path.exists(weekly_file))
+        self.assertEqual(watcher.scheduler.next_due(), 1020)
+        os.remove(weekly_file)
+
+        # nothing was played since the last poll
+        watcher.raiderioapi.playing = False
+        clock[0] += 10
+        watcher.run_once()
+        self.assertFalse(os.path.exists(weekly_file))